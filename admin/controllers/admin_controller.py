@@ -1,21 +1,50 @@
+import json
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required
 from utils.auth_utils import is_admin_or_moderator, is_admin
 from marshmallow import ValidationError
 from admin.schemas.admin_schemas import (
     UserActionSchema,
     DemoteUserSchema,
-    PromoteUserSchema
+    PromoteUserSchema,
+    ListUsersSchema,
+    SearchUsersSchema,
+    BulkUserActionSchema,
+    BulkDemoteUsersSchema,
+    BulkPromoteUsersSchema,
+    ProfilerSettingsSchema,
+    RedisMemoryAuditSchema
 )
 from admin.services.admin_service import (
-    list_all_users,
+    list_users_page,
+    iter_users,
     block_user as block_user_service,
     unblock_user as unblock_user_service,
     promote_user as promote_user_service,
-    demote_user as demote_user_service
+    demote_user as demote_user_service,
+    block_users as block_users_service,
+    unblock_users as unblock_users_service,
+    set_users_role
 )
-from services.complaint_service import list_complaints, remove_complaint
+from admin.services.user_search_service import search_users
+from admin.services.redis_audit_service import redis_memory_audit
+from core.database import get_redis_metrics
+from core.profiler import (
+    get_sample_rate,
+    set_sample_rate,
+    list_profiles,
+    get_collapsed_stacks,
+    clear_profiles
+)
+from schemas.complaint_schemas import ListComplaintsSchema, TopOffendersSchema
+from services.complaint_service import (
+    list_complaints,
+    remove_complaint,
+    resolve_complaint,
+    top_offenders
+)
+from services.complaint_archive_service import list_archived_complaints, remove_archived_complaint
 
 admin_bp = Blueprint("admin_bp", __name__)
 admin_logger = logging.getLogger("admin_actions")
@@ -25,16 +54,51 @@ admin_logger = logging.getLogger("admin_actions")
 @is_admin_or_moderator
 def list_users():
     """
-    Получить список всех пользователей
+    Получить список пользователей
     ---
-    description: Вывод списка всех пользователей (доступно для admin и moderator).
+    description: |
+      Список пользователей с keyset-пагинацией по id (доступно для admin и moderator).
+      Если есть следующая страница, её курсор приходит в заголовке X-Next-After-Id.
+      format=ndjson отдаёт всех пользователей потоком, по одному JSON-объекту на строку.
     tags:
       - Admin
     security:
       - bearerAuth: []
+    parameters:
+      - in: query
+        name: after_id
+        type: integer
+        required: false
+        description: Курсор — id последнего пользователя предыдущей страницы
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        default: 100
+        description: Размер страницы (1..1000)
+      - in: query
+        name: role
+        type: string
+        required: false
+        enum: [user, moderator, admin]
+        description: Фильтр по роли
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: [json, ndjson]
+        default: json
+        description: json — одна страница, ndjson — потоковая выгрузка
+    produces:
+      - application/json
+      - application/x-ndjson
     responses:
       200:
-        description: Список пользователей (JSON array)
+        description: Список пользователей (JSON array или NDJSON)
+        headers:
+          X-Next-After-Id:
+            type: integer
+            description: Курсор следующей страницы (если она есть)
         schema:
           type: array
           items:
@@ -52,14 +116,108 @@ def list_users():
                 type: integer
                 example: 1
                 description: Идентификатор пользователя
+      400:
+        description: Некорректные параметры
+        schema:
+          $ref: '#/definitions/ErrorResponse'
       403:
         description: Недостаточно прав или пользователь заблокирован
         schema:
           $ref: '#/definitions/ErrorResponse'
     """
     admin_logger.debug("Admin/moderator requested user list")
-    users_data = list_all_users()
-    return jsonify(users_data)
+    try:
+        args = ListUsersSchema().load(request.args)
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    if args["format"] == "ndjson":
+        def generate():
+            for row in iter_users(role=args["role"]):
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    users_data, next_after_id = list_users_page(
+        after_id=args["after_id"],
+        limit=args["limit"],
+        role=args["role"]
+    )
+    resp = jsonify(users_data)
+    if next_after_id is not None:
+        resp.headers["X-Next-After-Id"] = str(next_after_id)
+    return resp
+
+@admin_bp.route("/admin/users/search", methods=["GET"])
+@jwt_required()
+@is_admin_or_moderator
+def search_users_endpoint():
+    """
+    Поиск пользователей по username
+    ---
+    description: |
+      Префиксный поиск по username по индексу (admin и moderator).
+      С fuzzy=true выдача дополняется нечёткими совпадениями по триграммам
+      (запрос от 3 символов).
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: q
+        type: string
+        required: true
+        description: Начало username, например "user_1234"
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        default: 20
+        description: Максимум результатов (1..100)
+      - in: query
+        name: fuzzy
+        type: boolean
+        required: false
+        default: false
+        description: Добавить нечёткие совпадения
+    responses:
+      200:
+        description: Найденные пользователи
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              id:
+                type: integer
+                example: 1
+              username:
+                type: string
+                example: "user_12345678"
+              role:
+                type: string
+                example: "user"
+              match:
+                type: string
+                enum: [prefix, fuzzy]
+                example: "prefix"
+      400:
+        description: Некорректные параметры
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Недостаточно прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    try:
+        args = SearchUsersSchema().load(request.args)
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    admin_logger.debug(f"Admin/moderator searches users: q={args['q']!r}")
+    return jsonify(search_users(args["q"], limit=args["limit"], fuzzy=args["fuzzy"])), 200
 
 @admin_bp.route("/admin/block_user", methods=["POST"])
 @jwt_required()
@@ -275,33 +433,312 @@ def demote_user():
     admin_logger.warning(f"User {user_id} demoted to {new_role}")
     return jsonify({"message": f"User {user_id} role changed to {new_role}"}), 200
 
+@admin_bp.route("/admin/block_users", methods=["POST"])
+@jwt_required()
+@is_admin_or_moderator
+def block_users():
+    """
+    Заблокировать нескольких пользователей
+    ---
+    description: Массовая блокировка по списку ID (admin или moderator). Результат — по каждому ID.
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          $ref: '#/definitions/BulkUserActionModel'
+    responses:
+      200:
+        description: Результаты блокировки по каждому ID
+        schema:
+          $ref: '#/definitions/BulkResultResponse'
+      400:
+        description: Некорректные данные
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Недостаточно прав / пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    admin_logger.warning("Admin/moderator attempts to block users in bulk")
+    try:
+        data = BulkUserActionSchema().load(request.json or {})
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    results = block_users_service(data["user_ids"])
+    admin_logger.warning(f"Bulk block processed for {len(results)} ids")
+    return jsonify({"results": results}), 200
+
+@admin_bp.route("/admin/unblock_users", methods=["POST"])
+@jwt_required()
+@is_admin_or_moderator
+def unblock_users():
+    """
+    Разблокировать нескольких пользователей
+    ---
+    description: Массовая разблокировка по списку ID (admin или moderator). Результат — по каждому ID.
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          $ref: '#/definitions/BulkUserActionModel'
+    responses:
+      200:
+        description: Результаты разблокировки по каждому ID
+        schema:
+          $ref: '#/definitions/BulkResultResponse'
+      400:
+        description: Некорректные данные
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Недостаточно прав / пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    admin_logger.warning("Admin/moderator attempts to unblock users in bulk")
+    try:
+        data = BulkUserActionSchema().load(request.json or {})
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    results = unblock_users_service(data["user_ids"])
+    admin_logger.warning(f"Bulk unblock processed for {len(results)} ids")
+    return jsonify({"results": results}), 200
+
+@admin_bp.route("/admin/promote_users", methods=["POST"])
+@jwt_required()
+@is_admin
+def promote_users():
+    """
+    Повысить роль нескольким пользователям
+    ---
+    description: Массовое повышение роли одной транзакцией (только admin). Результат — по каждому ID.
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          $ref: '#/definitions/BulkRoleModel'
+    responses:
+      200:
+        description: Результаты по каждому ID
+        schema:
+          $ref: '#/definitions/BulkResultResponse'
+      400:
+        description: Некорректные данные
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Недостаточно прав / пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    admin_logger.warning("Admin attempts to promote users in bulk")
+    try:
+        data = BulkPromoteUsersSchema().load(request.json or {})
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    results = set_users_role(data["user_ids"], data["new_role"])
+    admin_logger.warning(f"Bulk promote to {data['new_role']} processed for {len(results)} ids")
+    return jsonify({"results": results}), 200
+
+@admin_bp.route("/admin/demote_users", methods=["POST"])
+@jwt_required()
+@is_admin
+def demote_users():
+    """
+    Понизить роль нескольким пользователям
+    ---
+    description: Массовое понижение роли одной транзакцией (только admin). Результат — по каждому ID.
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          $ref: '#/definitions/BulkRoleModel'
+    responses:
+      200:
+        description: Результаты по каждому ID
+        schema:
+          $ref: '#/definitions/BulkResultResponse'
+      400:
+        description: Некорректные данные
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Недостаточно прав / пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    admin_logger.warning("Admin attempts to demote users in bulk")
+    try:
+        data = BulkDemoteUsersSchema().load(request.json or {})
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    results = set_users_role(data["user_ids"], data["new_role"])
+    admin_logger.warning(f"Bulk demote to {data['new_role']} processed for {len(results)} ids")
+    return jsonify({"results": results}), 200
+
 @admin_bp.route("/admin/complaints", methods=["GET"])
 @jwt_required()
 @is_admin_or_moderator
 def get_complaints():
     """
-    Получить все жалобы
+    Получить жалобы
     ---
-    description: Возвращает список всех жалоб (admin или moderator).
+    description: |
+      Постраничный список жалоб по возрастанию ID (admin или moderator).
+      Курсор следующей страницы приходит в заголовке X-Next-After-Id.
     tags:
       - Complaints
     security:
       - bearerAuth: []
+    parameters:
+      - in: query
+        name: after_id
+        type: integer
+        required: false
+        description: Курсор — ID последней жалобы предыдущей страницы
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        default: 50
+        description: Размер страницы (1..500)
+      - in: query
+        name: target_user_id
+        type: integer
+        required: false
+        description: Только жалобы на этого пользователя
+      - in: query
+        name: reporter_id
+        type: integer
+        required: false
+        description: Только жалобы от этого пользователя
+      - in: query
+        name: source
+        type: string
+        required: false
+        enum: [active, archive]
+        default: active
+        description: active — активная очередь, archive — архив решённых/старых жалоб
     responses:
       200:
         description: Список жалоб
+        headers:
+          X-Next-After-Id:
+            type: integer
+            description: Курсор следующей страницы (если она есть)
         schema:
           type: array
           items:
             $ref: '#/definitions/ComplaintModel'
+      400:
+        description: Некорректные параметры
+        schema:
+          $ref: '#/definitions/ErrorResponse'
       403:
         description: Недостаточно прав или пользователь заблокирован
         schema:
           $ref: '#/definitions/ErrorResponse'
     """
     admin_logger.warning("Admin/moderator requested complaints list")
-    complaints = list_complaints()
-    return jsonify(complaints), 200
+    try:
+        args = ListComplaintsSchema().load(request.args)
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    if args.pop("source") == "archive":
+        complaints, next_after_id = list_archived_complaints(**args)
+    else:
+        complaints, next_after_id = list_complaints(**args)
+    resp = jsonify(complaints)
+    if next_after_id is not None:
+        resp.headers["X-Next-After-Id"] = str(next_after_id)
+    return resp, 200
+
+@admin_bp.route("/admin/complaints/top_offenders", methods=["GET"])
+@jwt_required()
+@is_admin_or_moderator
+def get_top_offenders():
+    """
+    Рейтинг нарушителей
+    ---
+    description: |
+      Пользователи с наибольшим весом жалоб (admin или moderator).
+      Вес каждой жалобы затухает со временем, повторные жалобы
+      одного репортёра на то же сообщение не учитываются.
+    tags:
+      - Complaints
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        default: 20
+        description: Сколько пользователей вернуть (1..100)
+    responses:
+      200:
+        description: Рейтинг по убыванию веса
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              user_id:
+                type: integer
+                example: 20
+              score:
+                type: number
+                example: 4.25
+      400:
+        description: Некорректные параметры
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Недостаточно прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    try:
+        args = TopOffendersSchema().load(request.args)
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    admin_logger.debug("Admin/moderator requested top offenders")
+    return jsonify(top_offenders(limit=args["limit"])), 200
 
 @admin_bp.route("/admin/complaints/<int:complaint_id>", methods=["DELETE"])
 @jwt_required()
@@ -310,7 +747,7 @@ def delete_complaint(complaint_id):
     """
     Удалить жалобу
     ---
-    description: Удаляет жалобу по ее ID (доступно admin или moderator).
+    description: Удаляет жалобу по ее ID из очереди или архива (доступно admin или moderator).
     tags:
       - Complaints
     security:
@@ -337,9 +774,422 @@ def delete_complaint(complaint_id):
     """
     admin_logger.warning(f"Admin/moderator attempts to delete complaint {complaint_id}")
     removed, error = remove_complaint(complaint_id)
+    if error == "Complaint not found":
+        removed, error = remove_archived_complaint(complaint_id)
     if error:
         admin_logger.warning(f"Complaint {complaint_id} not found for removal")
         return jsonify({"error": error}), 404
 
     admin_logger.warning(f"Complaint {complaint_id} removed by admin/moderator")
     return jsonify({"message": f"Complaint {complaint_id} removed"}), 200
+
+@admin_bp.route("/admin/complaints/<int:complaint_id>/resolve", methods=["POST"])
+@jwt_required()
+@is_admin_or_moderator
+def resolve_complaint_endpoint(complaint_id):
+    """
+    Пометить жалобу решённой
+    ---
+    description: |
+      Отмечает жалобу как решённую (admin или moderator).
+      Решённые жалобы переносятся архиватором из Redis в SQLite.
+    tags:
+      - Complaints
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: path
+        name: complaint_id
+        required: true
+        type: integer
+        description: ID жалобы
+    responses:
+      200:
+        description: Жалоба помечена решённой
+        schema:
+          $ref: '#/definitions/MessageResponse'
+      403:
+        description: Недостаточно прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      404:
+        description: Жалоба не найдена
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    admin_logger.warning(f"Admin/moderator attempts to resolve complaint {complaint_id}")
+    resolved, error = resolve_complaint(complaint_id)
+    if error:
+        return jsonify({"error": error}), 404
+
+    admin_logger.warning(f"Complaint {complaint_id} resolved by admin/moderator")
+    return jsonify({"message": f"Complaint {complaint_id} resolved"}), 200
+
+@admin_bp.route("/admin/redis/health", methods=["GET"])
+@jwt_required()
+@is_admin
+def redis_health():
+    """
+    Состояние подключения к Redis
+    ---
+    description: Метрики пула соединений и автомата (circuit breaker) Redis (только admin).
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    responses:
+      200:
+        description: Метрики пула и автомата
+        schema:
+          type: object
+          properties:
+            mode:
+              type: string
+              enum: [standalone, cluster]
+              example: "standalone"
+            pool:
+              type: object
+              description: В кластере — сумма по узлам
+              properties:
+                max_connections:
+                  type: integer
+                  example: 50
+                created:
+                  type: integer
+                  example: 4
+                available:
+                  type: integer
+                  example: 3
+                in_use:
+                  type: integer
+                  example: 1
+            nodes:
+              type: object
+              description: Только в кластере — пулы узлов по адресу host:port (те же поля и server_type)
+              additionalProperties:
+                type: object
+            replica:
+              type: object
+              description: Только с REDIS_REPLICA_HOST — отставание и автомат реплики
+              properties:
+                healthy:
+                  type: boolean
+                  example: true
+                lag_s:
+                  type: number
+                  example: 0.5
+                max_lag_s:
+                  type: number
+                  example: 2
+            breaker:
+              type: object
+              properties:
+                state:
+                  type: string
+                  enum: [closed, open]
+                  example: "closed"
+                consecutive_failures:
+                  type: integer
+                  example: 0
+                opened_total:
+                  type: integer
+                  example: 0
+                rejected_total:
+                  type: integer
+                  example: 0
+      403:
+        description: Нет прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    return jsonify(get_redis_metrics()), 200
+
+@admin_bp.route("/admin/redis/memory", methods=["GET"])
+@jwt_required()
+@is_admin
+def redis_memory():
+    """
+    Аудит памяти Redis
+    ---
+    description: |
+      Один шаг обхода ключей Redis (SCAN) с замером MEMORY USAGE для выборки
+      ключей (только admin). Шаг ограничен REDIS_AUDIT_MAX_KEYS ключами и
+      REDIS_AUDIT_TIME_BUDGET секундами; чтобы пройти всю базу, повторяйте
+      запрос с cursor из ответа, пока complete не станет true (с той же
+      sample_rate). Полный обход одной командой — flask --app app redis-memory-audit.
+      Осиротевшие ключи: no_room — сообщения/уведомления удалённой комнаты,
+      no_user — корзина или индекс жалоб несуществующих пользователей,
+      legacy — ключи старых схем (flask migrate-redis-keys).
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: cursor
+        type: string
+        required: false
+        description: Курсор из предыдущего шага; без него — с начала
+      - in: query
+        name: sample_rate
+        type: number
+        required: false
+        description: Доля владельцев ключей в выборке (0..1], по умолчанию REDIS_AUDIT_SAMPLE_RATE
+      - in: query
+        name: max_keys
+        type: integer
+        required: false
+        description: Максимум ключей за шаг (1..100000)
+      - in: query
+        name: top
+        type: integer
+        required: false
+        default: 10
+        description: Сколько самых больших комнат вернуть (1..100)
+    responses:
+      200:
+        description: Отчёт шага
+        schema:
+          type: object
+          properties:
+            cursor:
+              type: string
+              example: "18432"
+            complete:
+              type: boolean
+              example: false
+            sample_rate:
+              type: number
+              example: 0.1
+            scanned:
+              type: integer
+              example: 10000
+            sampled:
+              type: integer
+              example: 1012
+            duration_s:
+              type: number
+              example: 0.84
+            families:
+              type: object
+              description: rooms, messages, notifications, complaints, users, service, legacy, other
+              additionalProperties:
+                type: object
+                properties:
+                  keys:
+                    type: integer
+                    example: 3120
+                  sampled:
+                    type: integer
+                    example: 310
+                  bytes_sampled:
+                    type: integer
+                    example: 2150400
+                  bytes_estimated:
+                    type: integer
+                    example: 21504000
+            top_rooms:
+              type: array
+              items:
+                type: object
+                properties:
+                  room_id:
+                    type: string
+                    example: "room:5:123456"
+                  bytes:
+                    type: integer
+                    example: 48213
+            orphans_total:
+              type: object
+              additionalProperties:
+                type: integer
+              example: {"no_room": 3, "legacy": 12}
+            orphans:
+              type: array
+              description: Первые 100 найденных
+              items:
+                type: object
+                properties:
+                  key:
+                    type: string
+                    example: "{room:5:123456}:messages"
+                  reason:
+                    type: string
+                    enum: [no_room, no_user, legacy]
+      400:
+        description: Некорректные параметры
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Нет прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      503:
+        description: Redis недоступен
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    try:
+        args = RedisMemoryAuditSchema().load(request.args)
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    admin_logger.warning(f"Admin requested Redis memory audit from cursor {args['cursor'] or 0}")
+    report, error, status = redis_memory_audit(**args)
+    if error:
+        return jsonify({"error": error}), status
+    return jsonify(report), status
+
+@admin_bp.route("/admin/profiler", methods=["GET"])
+@jwt_required()
+@is_admin
+def profiler_status():
+    """
+    Сохранённые профили
+    ---
+    description: |
+      Текущая доля профилирования и N самых медленных профилей воркера,
+      обработавшего запрос (только admin). Стеки — в /admin/profiler/{profile_id}.
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    responses:
+      200:
+        description: Настройки и список профилей
+        schema:
+          type: object
+          properties:
+            sample_rate:
+              type: number
+              example: 0.01
+            profiles:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: integer
+                    example: 7
+                  kind:
+                    type: string
+                    enum: [http, socket]
+                  name:
+                    type: string
+                    example: "POST room_bp.join_room"
+                  duration_ms:
+                    type: number
+                    example: 41.2
+                  recorded_at:
+                    type: string
+                    example: "2025-01-01T12:00:00+00:00"
+                  samples:
+                    type: integer
+                    example: 8
+      403:
+        description: Нет прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    return jsonify({"sample_rate": get_sample_rate(), "profiles": list_profiles()}), 200
+
+@admin_bp.route("/admin/profiler", methods=["POST"])
+@jwt_required()
+@is_admin
+def profiler_settings():
+    """
+    Включить или выключить профилирование
+    ---
+    description: Задаёт долю профилируемых HTTP-запросов и Socket.IO-событий в текущем воркере (только admin). 0 — выключить.
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          $ref: '#/definitions/ProfilerSettingsModel'
+    responses:
+      200:
+        description: Новая доля профилирования
+        schema:
+          $ref: '#/definitions/ProfilerSettingsModel'
+      400:
+        description: Некорректные данные
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Нет прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    try:
+        data = ProfilerSettingsSchema().load(request.json or {})
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    set_sample_rate(data["sample_rate"])
+    admin_logger.warning(f"Profiler sample rate set to {data['sample_rate']}")
+    return jsonify({"sample_rate": data["sample_rate"]}), 200
+
+@admin_bp.route("/admin/profiler", methods=["DELETE"])
+@jwt_required()
+@is_admin
+def profiler_clear():
+    """
+    Очистить сохранённые профили
+    ---
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    responses:
+      200:
+        description: Профили удалены
+        schema:
+          $ref: '#/definitions/MessageResponse'
+      403:
+        description: Нет прав или пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    clear_profiles()
+    return jsonify({"message": "Profiles cleared"}), 200
+
+@admin_bp.route("/admin/profiler/<int:profile_id>", methods=["GET"])
+@jwt_required()
+@is_admin
+def profiler_stacks(profile_id):
+    """
+    Профиль в формате collapsed stacks
+    ---
+    description: |
+      Строки вида "module:func;module:func N" — готовый вход для flamegraph.pl
+      или speedscope (только admin).
+    tags:
+      - Admin
+    security:
+      - bearerAuth: []
+    produces:
+      - text/plain
+    parameters:
+      - in: path
+        name: profile_id
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Свёрнутые стеки
+      404:
+        description: Профиль не найден (вытеснен или снят другим воркером)
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    stacks = get_collapsed_stacks(profile_id)
+    if stacks is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(stacks, mimetype="text/plain"), 200
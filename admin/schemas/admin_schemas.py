@@ -1,4 +1,4 @@
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, fields, validate, EXCLUDE
 
 class UserActionSchema(Schema):
     user_id = fields.Int(required=True, description="ID пользователя")
@@ -14,3 +14,62 @@ class PromoteUserSchema(Schema):
     new_role = fields.Str(required=True,
                           validate=validate.OneOf(["moderator", "admin"]),
                           description="Новая роль (moderator или admin)")
+
+class BulkUserActionSchema(Schema):
+    user_ids = fields.List(fields.Int(), required=True,
+                           validate=validate.Length(min=1, max=500),
+                           description="Список ID пользователей (до 500)")
+
+class BulkDemoteUsersSchema(BulkUserActionSchema):
+    new_role = fields.Str(required=True,
+                          validate=validate.OneOf(["user","moderator"]),
+                          description="Роль, до которой понижаем (user/moderator)")
+
+class BulkPromoteUsersSchema(BulkUserActionSchema):
+    new_role = fields.Str(required=True,
+                          validate=validate.OneOf(["moderator", "admin"]),
+                          description="Новая роль (moderator или admin)")
+
+class ListUsersSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    after_id = fields.Int(load_default=None, validate=validate.Range(min=0),
+                          description="Вернуть пользователей с id больше этого")
+    limit = fields.Int(load_default=100, validate=validate.Range(min=1, max=1000),
+                       description="Размер страницы (1..1000)")
+    role = fields.Str(load_default=None,
+                      validate=validate.OneOf(["user", "moderator", "admin"]),
+                      description="Фильтр по роли")
+    format = fields.Str(load_default="json",
+                        validate=validate.OneOf(["json", "ndjson"]),
+                        description="json — страница, ndjson — потоковая выгрузка всех")
+
+class SearchUsersSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    q = fields.Str(required=True, validate=validate.Length(min=1, max=50),
+                   description="Начало username (или его фрагмент при fuzzy=true)")
+    limit = fields.Int(load_default=20, validate=validate.Range(min=1, max=100),
+                       description="Максимум результатов (1..100)")
+    fuzzy = fields.Bool(load_default=False,
+                        description="Дополнить выдачу нечёткими совпадениями (trigram)")
+
+class ProfilerSettingsSchema(Schema):
+    sample_rate = fields.Float(required=True, validate=validate.Range(min=0, max=1),
+                               description="Доля профилируемых запросов и событий (0..1)")
+
+class RedisMemoryAuditSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    cursor = fields.Str(load_default=None, validate=validate.Regexp(r"^\d+(:\d+)?$"),
+                        description="Курсор из предыдущего шага (cursor в ответе); без него — с начала")
+    sample_rate = fields.Float(load_default=None,
+                               validate=validate.Range(min=0, max=1, min_inclusive=False),
+                               description="Доля владельцев ключей, для которых меряется MEMORY USAGE (0..1]")
+    max_keys = fields.Int(load_default=None, validate=validate.Range(min=1, max=100000),
+                          description="Максимум ключей за шаг (по умолчанию REDIS_AUDIT_MAX_KEYS)")
+    top = fields.Int(load_default=10, validate=validate.Range(min=1, max=100),
+                     description="Сколько самых больших комнат вернуть")
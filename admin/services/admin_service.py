@@ -1,37 +1,72 @@
 import logging
 from models.user import User
-from core.database import db, get_redis_client
-from services.room_service import leave_room_service
+from core.database import db, read_session
+from core.storage import get_storage
+from core.socket_manager import disconnect_user, disconnect_users
+from services.room_service import leave_room_service, leave_rooms_bulk
+from services.user_search_cache import invalidate_user_search_cache
 
 logger = logging.getLogger(__name__)
 
-def list_all_users():
+def _user_row(u) -> dict:
+    return {"id": u.id, "role": u.role, "username": u.username}
+
+def _users_query(session, role: str = None):
+    """
+    Базовый запрос по пользователям: только нужные колонки, порядок по id.
+    """
+    query = session.query(User.id, User.role, User.username).order_by(User.id)
+    if role:
+        query = query.filter(User.role == role)
+    return query
+
+def list_users_page(after_id: int = None, limit: int = 100, role: str = None):
+    """
+    Keyset-пагинация по id: возвращает (list[dict], next_after_id).
+    next_after_id = None, если страниц больше нет.
+    """
+    with read_session() as session:
+        query = _users_query(session, role)
+        if after_id is not None:
+            query = query.filter(User.id > after_id)
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        rows = query.limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_after_id = rows[-1].id if has_more and rows else None
+    return [_user_row(u) for u in rows], next_after_id
+
+def iter_users(role: str = None, batch_size: int = 1000):
     """
-    Возвращает список всех пользователей в формате list[dict].
+    Генератор пользователей для потоковой выгрузки (NDJSON).
+    Строки читаются серверным курсором пачками по batch_size,
+    поэтому память не растёт вместе с таблицей.
     """
-    users = User.query.all()
-    return [{"id": u.id, "role": u.role, "username": u.username} for u in users]
+    with read_session() as session:
+        query = _users_query(session, role).execution_options(
+            stream_results=True, yield_per=batch_size
+        )
+        for u in query:
+            yield _user_row(u)
 
 def block_user(user_id: int):
     """
-    Блокирует пользователя (устанавливает ключ в Redis).
-    Если пользователь находится в комнате, удаляем его оттуда.
+    Блокирует пользователя (ставит флаг в хранилище) и закрывает все его
+    подключения. Если пользователь находится в комнате, удаляем его оттуда.
     Возвращает объект пользователя или None, если не найден.
     """
     user = User.query.get(user_id)
     if not user:
         return None
 
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
-    
-    # Ставим флаг блокировки в Redis
-    r.set(f"user:{user_id}:blocked", "1")
-    logger.info(f"User {user_id} blocked successfully (redis)")
+    storage = get_storage()
+    storage.set_blocked([user_id], True)
+    disconnect_user(user_id, "blocked")
+    logger.info(f"User {user_id} blocked successfully")
 
     # Проверяем, не находится ли пользователь в комнате
-    room_id = r.hget(f"user:{user.id}", "room")
+    room_id = storage.get_user_room(user.id)
     if room_id:
         # Пользователь в комнате -> выкидываем
         logger.info(f"User {user_id} is in room {room_id}, forcing leave_room")
@@ -41,17 +76,14 @@ def block_user(user_id: int):
 
 def unblock_user(user_id: int):
     """
-    Снимает блокировку с пользователя (удаляет ключ в Redis).
+    Снимает блокировку с пользователя (удаляет флаг в хранилище).
     Возвращает объект пользователя или None, если не найден.
     """
     user = User.query.get(user_id)
     if not user:
         return None
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
-    
-    r.delete(f"user:{user_id}:blocked")
+
+    get_storage().set_blocked([user_id], False)
     logger.info(f"User {user_id} unblocked successfully")
     return user
 
@@ -65,6 +97,7 @@ def promote_user(user_id: int, new_role: str):
         return None
     user.role = new_role
     db.session.commit()
+    invalidate_user_search_cache()
     logger.info(f"User {user_id} promoted to {new_role}")
     return user
 
@@ -80,5 +113,66 @@ def demote_user(user_id: int, new_role: str):
 
     user.role = new_role
     db.session.commit()
+    invalidate_user_search_cache()
     logger.info(f"User {user_id} demoted to {new_role}")
     return user
+
+def _load_users(user_ids):
+    """
+    Загружает пользователей одним запросом. Возвращает (ids_без_дублей, {id: User}).
+    """
+    ids = list(dict.fromkeys(user_ids))
+    users = User.query.filter(User.id.in_(ids)).all() if ids else []
+    return ids, {u.id: u for u in users}
+
+def block_users(user_ids):
+    """
+    Массовая блокировка: флаги ставятся одной командой, подключения
+    закрываются (только в этом воркере, см. disconnect_users), выход из
+    комнат — пачкой через leave_rooms_bulk.
+    Возвращает list[dict] с результатом по каждому id.
+    """
+    ids, users = _load_users(user_ids)
+    if users:
+        get_storage().set_blocked(list(users), True)
+        disconnect_users(list(users), "blocked")
+        deleted_rooms = leave_rooms_bulk(list(users.values()))
+        logger.info(f"Bulk block: {len(users)} users blocked, {len(deleted_rooms)} rooms emptied")
+
+    return [
+        {"user_id": uid, "status": "blocked" if uid in users else "not_found"}
+        for uid in ids
+    ]
+
+def unblock_users(user_ids):
+    """
+    Массовая разблокировка одной командой. Возвращает list[dict] по каждому id.
+    """
+    ids, users = _load_users(user_ids)
+    if users:
+        get_storage().set_blocked(list(users), False)
+        logger.info(f"Bulk unblock: {len(users)} users unblocked")
+
+    return [
+        {"user_id": uid, "status": "unblocked" if uid in users else "not_found"}
+        for uid in ids
+    ]
+
+def set_users_role(user_ids, new_role: str):
+    """
+    Меняет роль сразу нескольким пользователям одной транзакцией.
+    Возвращает list[dict] по каждому id.
+    """
+    ids, users = _load_users(user_ids)
+    if users:
+        User.query.filter(User.id.in_(list(users))).update(
+            {User.role: new_role}, synchronize_session=False
+        )
+        db.session.commit()
+        invalidate_user_search_cache()
+        logger.info(f"Bulk role change: {len(users)} users -> {new_role}")
+
+    return [
+        {"user_id": uid, "status": "updated" if uid in users else "not_found"}
+        for uid in ids
+    ]
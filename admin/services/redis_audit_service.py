@@ -0,0 +1,79 @@
+import logging
+import os
+import redis
+from core.database import get_redis_client, read_session, socketio, RedisUnavailableError
+from core.storage.redis_audit import audit_step, empty_report, finish_report, merge_reports
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Ограничения одного шага аудита памяти Redis (см. core.storage.redis_audit).
+# Настройки читаются при вызове: config.yaml загружается уже после импорта модулей.
+def _audit_settings() -> dict:
+    return {
+        "batch_size": int(os.environ.get("REDIS_AUDIT_BATCH_SIZE", 200)),
+        "max_keys": int(os.environ.get("REDIS_AUDIT_MAX_KEYS", 10000)),
+        "time_budget": float(os.environ.get("REDIS_AUDIT_TIME_BUDGET", 2.0)),
+        "pause": float(os.environ.get("REDIS_AUDIT_PAUSE", 0.01)),
+        "sample_rate": float(os.environ.get("REDIS_AUDIT_SAMPLE_RATE", 0.1)),
+        "memory_samples": int(os.environ.get("REDIS_AUDIT_MEMORY_SAMPLES", 5)),
+    }
+
+def _existing_user_ids(user_ids) -> set:
+    with read_session() as session:
+        rows = session.query(User.id).filter(User.id.in_(list(user_ids))).all()
+    return {row.id for row in rows}
+
+def _run_step(r, cursor, settings: dict) -> dict:
+    return audit_step(r, cursor, sleep=socketio.sleep, user_exists=_existing_user_ids, **settings)
+
+def redis_memory_audit(cursor: str = None, sample_rate: float = None, max_keys: int = None, top: int = 10):
+    """
+    Один шаг аудита памяти Redis с курсора (для постраничного обхода из админки).
+    top_rooms — по ключам, пройденным в этом шаге.
+    Возвращает (report, error, status_code).
+    """
+    settings = _audit_settings()
+    if sample_rate is not None:
+        settings["sample_rate"] = sample_rate
+    if max_keys is not None:
+        settings["max_keys"] = max_keys
+
+    r = get_redis_client()
+    if r is None:
+        return None, "Cannot connect to Redis", 503
+    try:
+        report = _run_step(r, cursor, settings)
+    except redis.ResponseError as e:
+        # MEMORY USAGE бывает запрещена в управляемых Redis
+        logger.error(f"Redis memory audit failed: {e}")
+        return None, f"Redis rejected the audit: {e}", 502
+    except (redis.ConnectionError, redis.TimeoutError, RedisUnavailableError) as e:
+        logger.error(f"Redis memory audit failed: {e}")
+        return None, "Cannot connect to Redis", 503
+    return finish_report(report, top), None, 200
+
+def redis_memory_audit_full(sample_rate: float = None, top: int = 10, progress=None):
+    """
+    Полный обход шагами с теми же ограничениями, что у эндпоинта. Требует app context.
+    progress(report) вызывается после каждого шага.
+    """
+    settings = _audit_settings()
+    if sample_rate is not None:
+        settings["sample_rate"] = sample_rate
+
+    r = get_redis_client()
+    if r is None:
+        raise RedisUnavailableError("Cannot connect to Redis")
+    total = empty_report(settings["sample_rate"])
+    cursor = 0
+    while True:
+        merge_reports(total, _run_step(r, cursor, settings))
+        if progress:
+            progress(total)
+        if total["complete"]:
+            break
+        cursor = total["cursor"]
+    report = finish_report(total, top)
+    logger.info(f"Redis memory audit: {report['scanned']} keys, orphans {report['orphans_total']}")
+    return report
@@ -0,0 +1,98 @@
+import logging
+from flask import current_app
+from sqlalchemy import text
+from models.user import User, USERNAME_TRIGRAM_TABLE
+from core.database import read_session
+from services.user_search_cache import get_search_cache
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница для префиксного диапазона: username >= q AND username < q + MAX_CHAR.
+# В отличие от LIKE 'q%' такое условие всегда использует индекс ix_users_username.
+_MAX_CHAR = "\U0010ffff"
+# Сколько кандидатов забираем из trigram-индекса перед ранжированием
+_FUZZY_CANDIDATES = 200
+# Доля триграмм запроса, найденных в username (как word_similarity в pg_trgm):
+# фрагмент длинного имени должен находиться, поэтому длина имени не штрафуется
+_FUZZY_MIN_SIMILARITY = 0.6
+
+def _trigrams(value: str) -> set:
+    value = value.lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+def _user_row(u, match: str) -> dict:
+    return {"id": u.id, "role": u.role, "username": u.username, "match": match}
+
+def _prefix_search(session, q: str, limit: int):
+    return (
+        session.query(User.id, User.role, User.username)
+        .filter(User.username >= q, User.username < q + _MAX_CHAR)
+        .order_by(User.username)
+        .limit(limit)
+        .all()
+    )
+
+def _fuzzy_search(session, q: str, limit: int, exclude_ids: set):
+    """
+    Нечёткий поиск: кандидаты по любому общему триграмму из FTS5, затем
+    ранжирование по доле триграмм запроса, встречающихся в username; при
+    равной доле выше имена, близкие к запросу целиком (коэффициент Жаккара).
+    """
+    query_trigrams = _trigrams(q)
+    if not query_trigrams:
+        return []
+
+    # Каждый триграмм — отдельная строка-фраза в синтаксисе FTS5
+    match_expr = " OR ".join('"' + t.replace('"', '""') + '"' for t in sorted(query_trigrams))
+    rows = session.execute(
+        text(f"SELECT rowid FROM {USERNAME_TRIGRAM_TABLE} "
+             f"WHERE {USERNAME_TRIGRAM_TABLE} MATCH :expr ORDER BY rank LIMIT :n"),
+        {"expr": match_expr, "n": _FUZZY_CANDIDATES}
+    ).all()
+    candidate_ids = [row[0] for row in rows if row[0] not in exclude_ids]
+    if not candidate_ids:
+        return []
+
+    users = (
+        session.query(User.id, User.role, User.username)
+        .filter(User.id.in_(candidate_ids))
+        .all()
+    )
+    scored = []
+    for u in users:
+        user_trigrams = _trigrams(u.username)
+        common = len(query_trigrams & user_trigrams)
+        coverage = common / len(query_trigrams)
+        if coverage >= _FUZZY_MIN_SIMILARITY:
+            jaccard = common / len(query_trigrams | user_trigrams)
+            scored.append((coverage, jaccard, u))
+    scored.sort(key=lambda item: (-item[0], -item[1], item[2].username))
+    return [u for _, _, u in scored[:limit]]
+
+def search_users(q: str, limit: int = 20, fuzzy: bool = False):
+    """
+    Поиск пользователей по username.
+    Сначала префиксные совпадения (по индексу), затем, если fuzzy=True
+    и места ещё хватает — нечёткие по trigram-индексу.
+    Возвращает list[dict].
+    """
+    cache_key = (q, limit, fuzzy)
+    cache = get_search_cache()
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        return cached
+
+    with read_session() as session:
+        prefix_rows = _prefix_search(session, q, limit)
+        results = [_user_row(u, "prefix") for u in prefix_rows]
+
+        fuzzy_allowed = current_app.config.get("USERNAME_TRIGRAM_INDEX", False)
+        if fuzzy and fuzzy_allowed and len(results) < limit and len(q) >= 3:
+            exclude_ids = {u.id for u in prefix_rows}
+            fuzzy_rows = _fuzzy_search(session, q, limit - len(results), exclude_ids)
+            results.extend(_user_row(u, "fuzzy") for u in fuzzy_rows)
+
+    if cache is not None:
+        cache.set(cache_key, results)
+    logger.debug(f"User search q={q!r} fuzzy={fuzzy} -> {len(results)} results")
+    return results
@@ -1,18 +1,44 @@
+if __name__ == "__main__":
+    # python app.py запускает eventlet-сервер сам, а без monkey_patch сокеты
+    # Redis и HTTP-запросы (мост Telegram) блокируют весь hub; под gunicorn
+    # -k eventlet это делает воркер. Должно идти до остальных импортов.
+    import eventlet
+    eventlet.monkey_patch()
+
 import os
+import redis
 from flask import Flask
-from flasgger import Swagger
 from config.loader import load_config_yml
-from config.swagger import swagger_config, swagger_template
+from core.swagger_setup import init_swagger
 from core.logging_setup import setup_logging
-from core.database import init_db, init_jwt, init_socketio #, init_redis
+from core.database import init_db, init_jwt, init_socketio, socketio, start_replica_monitor, RedisUnavailableError #, init_redis
+from core.commands import register_commands
 from controllers.auth_controller import auth_bp
 from controllers.room_controller import room_bp
 from admin.controllers.admin_controller import admin_bp
 from controllers.complaint_controller import complaint_bp  
+from controllers.metrics_controller import metrics_bp
+from controllers.session_controller import session_bp
+from core.metrics import init_metrics, start_metrics_flusher
+from core.profiler import init_profiler
+from core.call_accounting import init_call_accounting
 import core.socket_manager
+from services.complaint_archive_service import start_complaint_archiver
+from services.room_reaper_service import start_room_reaper
+from services.telegram_bridge_service import start_telegram_bridge
 
-def create_app():
+def create_app(env_overrides: dict = None, start_background_tasks: bool = True):
+    """
+    Фабрика приложения. Импорт модуля ничего не создаёт и не подключает:
+      flask --app app run | <команда>
+      gunicorn -k eventlet -w 1 "app:create_app()"
+    start_background_tasks=False — без архиватора жалоб и записи метрик
+    (бенчмарки, сборка спецификации).
+    """
     load_config_yml()  # Ставим env переменные
+    if env_overrides:
+        # Поверх config.yaml (бенчмарки, нагрузочные прогоны)
+        os.environ.update({key: str(val) for key, val in env_overrides.items()})
 
     # Проверка переменных окружения
     required_env_vars = ["REDIS_HOST", "REDIS_PORT", "REDIS_PASSWORD", "REDIS_DB", "SECRET_KEY", "JWT_SECRET_KEY"]
@@ -29,7 +55,10 @@ def create_app():
     BASE_DIR = os.environ.get("BASE_DIR", os.getcwd())
 
     app.config['SECRET_KEY'] = SECRET_KEY
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(BASE_DIR, 'instance', 'chat.db')}"
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        "DATABASE_URL",
+        f"sqlite:///{os.path.join(BASE_DIR, 'instance', 'chat.db')}"
+    )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JWT_SECRET_KEY'] = JWT_SECRET_KEY
 
@@ -38,31 +67,52 @@ def create_app():
     init_jwt(app)
     # init_redis()  # Инициализация Redis до импорта Blueprint
 
-    swagger = Swagger(
-        app,
-        config=swagger_config,
-        template=swagger_template
-    )
+    init_swagger(app)
 
     # Регистрируем Blueprint'ы
     app.register_blueprint(auth_bp, url_prefix='/')
     app.register_blueprint(room_bp, url_prefix='/')
+    app.register_blueprint(session_bp, url_prefix='/')
     app.register_blueprint(admin_bp, url_prefix='/')
     app.register_blueprint(complaint_bp, url_prefix='/')
+    app.register_blueprint(metrics_bp, url_prefix='/')
+    init_metrics(app)
+    init_profiler(app)
+    init_call_accounting(app)
+
+    register_commands(app)
+    register_error_handlers(app)
+
+    init_socketio(app)
+    if start_background_tasks:
+        start_complaint_archiver(app)
+        start_room_reaper(app)
+        start_metrics_flusher(app)
+        start_replica_monitor(app)
+        start_telegram_bridge(app)
 
     return app
 
-app = create_app()
-socketio = init_socketio(app)
+def register_error_handlers(app):
+    @app.errorhandler(RuntimeError)
+    def handle_runtime_error(e):
+        """
+        Глобальный обработчик RuntimeError
+        """
+        app.logger.error(f"RuntimeError: {str(e)}")
+        return {"error": "Internal server error"}, 500
 
-@app.errorhandler(RuntimeError)
-def handle_runtime_error(e):
-    """
-    Глобальный обработчик RuntimeError
-    """
-    app.logger.error(f"RuntimeError: {str(e)}")
-    return {"error": "Internal server error"}, 500
+    @app.errorhandler(RedisUnavailableError)
+    @app.errorhandler(redis.ConnectionError)
+    @app.errorhandler(redis.TimeoutError)
+    def handle_redis_unavailable(e):
+        """
+        Redis недоступен — отвечаем сразу 503, клиент может повторить позже
+        """
+        app.logger.error(f"Redis unavailable: {str(e)}")
+        return {"error": "Service temporarily unavailable"}, 503
 
 if __name__ == "__main__":
+    app = create_app()
     app.logger.info(f"Omilia launched PID={os.getpid()}")
     socketio.run(app, debug=False, use_reloader=False)
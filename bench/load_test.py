@@ -0,0 +1,235 @@
+"""
+Сквозной нагрузочный прогон: регистрация и логин K пользователей, вход
+в комнаты всех размеров (2..10), подключение по Socket.IO и рассылка
+сообщений с заданной частотой.
+
+Отчёт: задержка входа в комнату, задержка доставки сообщения (p50/p99),
+сообщений в секунду и память на одно подключение.
+
+В процессе (по умолчанию): реальное приложение, SQLite во временном
+файле, хранилище в памяти вместо Redis:
+    python -m bench.load_test --users 180 --rate 200 --duration 10
+
+Против запущенного сервера (Redis и БД — его собственные):
+    python -m bench.load_test --url http://127.0.0.1:5000 --users 90 --server-pid 12345
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+ROOM_SIZES = range(2, 11)
+PASSWORD = "LoadTest1!"
+
+def percentile(values, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def _rss_kb(pid: int):
+    """VmRSS процесса из /proc (только Linux), КиБ."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+class InProcessTarget:
+    """
+    Приложение в этом же процессе: HTTP через test_client, Socket.IO через
+    socketio.test_client. Доставка синхронная: сообщение оказывается в очередях
+    получателей до возврата emit(), поэтому время доставки — время emit().
+    """
+    def __init__(self):
+        from app import create_app
+        from core.storage import set_storage
+        from core.storage.memory_storage import MemoryStorage
+
+        self.tmp_dir = tempfile.mkdtemp(prefix="omilia-load-")
+        self.app = create_app({
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.tmp_dir, 'load.db')}",
+            "LOG_DIR": os.path.join(self.tmp_dir, "logs"),
+            "LOG_LEVEL": "WARNING",
+            "STORAGE_BACKEND": "memory",
+        }, start_background_tasks=False)
+        from core.database import socketio
+        self.socketio = socketio
+        set_storage(MemoryStorage())
+        self.http = self.app.test_client()
+
+    def post(self, path: str, payload: dict, token: str = None):
+        headers = {"Authorization": token} if token else {}
+        response = self.http.post(path, json=payload, headers=headers)
+        return response.status_code, response.get_json()
+
+    def connect(self, token: str, on_message):
+        client = self.socketio.test_client(self.app, query_string=f"token={token}")
+        if not client.is_connected():
+            raise RuntimeError("Socket.IO connection rejected")
+        client.on_message = on_message
+        return client
+
+    def send(self, client, text: str):
+        client.emit("send_message", {"message": text})
+
+    def drain(self, clients):
+        now = time.perf_counter()
+        for client in clients:
+            for packet in client.get_received():
+                if packet["name"] == "new_message":
+                    client.on_message(packet["args"][0], now)
+
+    def disconnect(self, client):
+        client.disconnect()
+
+class HttpTarget:
+    """
+    Запущенный сервер: HTTP через requests.Session, Socket.IO через
+    python-socketio Client (websocket), время доставки — момент получения.
+    """
+    def __init__(self, url: str):
+        import requests
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def post(self, path: str, payload: dict, token: str = None):
+        headers = {"Authorization": token} if token else {}
+        response = self.session.post(f"{self.url}{path}", json=payload, headers=headers, timeout=30)
+        return response.status_code, response.json()
+
+    def connect(self, token: str, on_message):
+        import socketio
+        client = socketio.Client(reconnection=False)
+        client.on("new_message", lambda data: on_message(data, time.perf_counter()))
+        client.connect(f"{self.url}?token={token}", transports=["websocket"], wait_timeout=10)
+        return client
+
+    def send(self, client, text: str):
+        client.emit("send_message", {"message": text})
+
+    def drain(self, clients):
+        pass  # сообщения приходят в фоновых потоках клиентов
+
+    def disconnect(self, client):
+        client.disconnect()
+
+def run(target, users: int, rate: float, duration: float, server_pid: int = None):
+    run_id = random.randint(100000, 999999)
+    report = {"users": users, "rate": rate, "duration": duration}
+
+    # 1) Регистрация и логин
+    tokens = []
+    started = time.perf_counter()
+    for i in range(users):
+        login = f"lt{run_id}_{i}"
+        status, body = target.post("/register", {"login": login, "password": PASSWORD})
+        if status != 201:
+            raise RuntimeError(f"Register failed for {login}: {body}")
+        status, body = target.post("/login", {"login": login, "password": PASSWORD})
+        if status != 200:
+            raise RuntimeError(f"Login failed for {login}: {body}")
+        tokens.append(body["access_token"])
+    report["register_login_s"] = round(time.perf_counter() - started, 3)
+
+    # 2) Вход в комнаты: пользователи поровну по размерам 2..10
+    join_latencies = []
+    sizes = list(ROOM_SIZES)
+    for i, token in enumerate(tokens):
+        started = time.perf_counter()
+        status, body = target.post("/join_room", {"room_size": sizes[i % len(sizes)]}, token)
+        join_latencies.append(time.perf_counter() - started)
+        if status not in (200, 201):
+            raise RuntimeError(f"Join failed: {body}")
+    report["join_p50_ms"] = _ms(percentile(join_latencies, 50))
+    report["join_p99_ms"] = _ms(percentile(join_latencies, 99))
+
+    # 3) Подключение Socket.IO (после входа — сокет сразу попадает в комнату)
+    send_times = {}
+    deliveries = []
+
+    def on_message(data, received_at):
+        text = data.get("message", "")
+        if text.startswith(f"lt{run_id}:"):
+            sent_at = send_times.get(text)
+            if sent_at is not None:
+                deliveries.append(received_at - sent_at)
+
+    rss_before = _rss_kb(server_pid or os.getpid())
+    tracemalloc.start()
+    mem_before = tracemalloc.get_traced_memory()[0]
+    clients = [target.connect(token, on_message) for token in tokens]
+    mem_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rss_after = _rss_kb(server_pid or os.getpid())
+
+    if isinstance(target, InProcessTarget):
+        report["memory_per_connection_kb"] = round((mem_after - mem_before) / 1024 / users, 2)
+    if rss_before and rss_after:
+        report["rss_per_connection_kb"] = round((rss_after - rss_before) / users, 2)
+
+    # 4) Сообщения с частотой rate в секунду от случайных участников
+    total = int(rate * duration)
+    started = time.perf_counter()
+    for seq in range(total):
+        delay = started + seq / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        text = f"lt{run_id}:{seq}"
+        send_times[text] = time.perf_counter()
+        target.send(random.choice(clients), text)
+        target.drain(clients)
+    send_elapsed = time.perf_counter() - started
+
+    # Дожидаемся хвоста доставок от сервера (пока число доставок растёт, но не дольше 5 сек)
+    deadline = time.time() + 5
+    delivered = -1
+    while isinstance(target, HttpTarget) and time.time() < deadline and delivered != len(deliveries):
+        delivered = len(deliveries)
+        time.sleep(0.5)
+    elapsed = time.perf_counter() - started
+
+    report["messages_sent"] = total
+    report["messages_delivered"] = len(deliveries)
+    report["sent_per_s"] = round(total / send_elapsed, 1) if send_elapsed else None
+    report["delivered_per_s"] = round(len(deliveries) / elapsed, 1) if elapsed else None
+    report["delivery_p50_ms"] = _ms(percentile(deliveries, 50))
+    report["delivery_p99_ms"] = _ms(percentile(deliveries, 99))
+
+    for client in clients:
+        target.disconnect(client)
+    for token in tokens:
+        target.post("/leave_room", {}, token)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for rooms and chat fan-out")
+    parser.add_argument("--url", help="URL запущенного сервера; без него — приложение в процессе")
+    parser.add_argument("--users", type=int, default=90)
+    parser.add_argument("--rate", type=float, default=100, help="сообщений в секунду")
+    parser.add_argument("--duration", type=float, default=5, help="сек рассылки")
+    parser.add_argument("--server-pid", type=int, help="PID сервера для замера RSS (Linux)")
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    args = parser.parse_args()
+
+    target = HttpTarget(args.url) if args.url else InProcessTarget()
+    report = run(target, args.users, args.rate, args.duration, args.server_pid)
+
+    for key, value in report.items():
+        print(f"{key:28} {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
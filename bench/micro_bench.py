@@ -0,0 +1,329 @@
+"""
+Микробенчмарки горячих функций сервисного слоя. Работают офлайн:
+SQLite во временном файле, хранилище в памяти вместо Redis.
+
+    python -m bench.micro_bench                     # сравнить с bench/baseline.json
+    python -m bench.micro_bench --tolerance 0.5     # допустимое замедление 50%
+    python -m bench.micro_bench --only join_room    # только совпадающие по имени
+    python -m bench.micro_bench --repeat 5          # лучший из 5 прогонов каждого
+    python -m bench.micro_bench --update-baseline   # записать текущие результаты
+
+Код выхода 1, если хотя бы один бенчмарк медленнее базовой линии больше,
+чем на tolerance. Сравнивается время относительно эталонной нагрузки,
+замеренной сразу после каждого замера (_calibrate), а не абсолютные мкс.
+Базовая линия всё равно зависит от машины — обновлять её стоит на той же
+машине (CI-раннере), где идёт сравнение.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+PASSWORD = "BenchPass1!"
+
+# Короче замер — шум таймера и планировщика: операции в несколько мкс
+# замеряются пачками подряд, пока пачка не займёт хотя бы столько секунд
+MIN_SAMPLE_SECONDS = 0.002
+
+Timing = namedtuple("Timing", "us relative")
+
+_CALIBRATION_DATA = [(i * 7919) % 1000 for i in range(1000)]
+
+def _calibration_op():
+    counts = {}
+    for value in sorted(_CALIBRATION_DATA):
+        counts[value] = counts.get(value, 0) + 1
+
+def _calibrate() -> float:
+    """
+    Эталонная нагрузка на чистом Python не короче MIN_SAMPLE_SECONDS, сек на
+    операцию. Скорость общей машины (соседи, частота CPU) плавает в разы за
+    секунды, поэтому эталон замеряется сразу после каждого замера бенчмарка.
+    """
+    ops = 0
+    started = time.perf_counter()
+    while True:
+        _calibration_op()
+        ops += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            return elapsed / ops
+
+def _timed(op, iterations: int, setup=None) -> Timing:
+    """
+    Время одной операции: медиана по замерам, каждый из которых — пачка
+    подряд идущих операций не короче MIN_SAMPLE_SECONDS (пачка удваивается,
+    пока короче; короткие пачки отбрасываются). us — в микросекундах,
+    relative — в долях эталона (_calibrate), снятого сразу после каждого
+    замера; по relative идёт сравнение с базовой линией. setup(i)
+    выполняется вне замера. Сборщик мусора на время замера выключен, как в timeit.
+    """
+    samples = []
+    total_elapsed, total_ops = 0.0, 0
+    batch = 1
+    i = 0
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while i < iterations:
+            args = [setup(j) if setup else j for j in range(i, min(i + batch, iterations))]
+            started = time.perf_counter()
+            for arg in args:
+                op(arg)
+            elapsed = time.perf_counter() - started
+            i += len(args)
+            total_elapsed += elapsed
+            total_ops += len(args)
+            if elapsed >= MIN_SAMPLE_SECONDS:
+                per_op = elapsed / len(args)
+                samples.append((per_op, per_op / _calibrate()))
+            else:
+                batch *= 2
+        if not samples:
+            # Операций не хватило ни на одну полную пачку — среднее по всем
+            per_op = total_elapsed / total_ops
+            samples.append((per_op, per_op / _calibrate()))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return Timing(statistics.median(s[0] for s in samples) * 1_000_000,
+                  statistics.median(s[1] for s in samples))
+
+class Bench:
+    def __init__(self):
+        from app import create_app
+        from core.storage import set_storage
+        from core.storage.memory_storage import MemoryStorage
+
+        self.tmp_dir = tempfile.mkdtemp(prefix="omilia-bench-")
+        self.app = create_app({
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.tmp_dir, 'bench.db')}",
+            "LOG_DIR": os.path.join(self.tmp_dir, "logs"),
+            "LOG_LEVEL": "WARNING",
+            "STORAGE_BACKEND": "memory",
+        }, start_background_tasks=False)
+        self.storage = MemoryStorage()
+        set_storage(self.storage)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.seq = 0
+
+    def make_users(self, count: int):
+        """
+        Массовая вставка пользователей одним executemany (с готовым хешем пароля).
+        """
+        from sqlalchemy import insert
+        from core.database import db
+        from models.user import User
+
+        template = User(login="bench", username="bench")
+        template.set_password(PASSWORD)
+        start = self.seq
+        self.seq += count
+        db.session.execute(insert(User), [
+            {"login": f"bench{i}", "username": f"bench_user_{i}",
+             "password_hash": template.password_hash, "role": "user"}
+            for i in range(start, start + count)
+        ])
+        db.session.commit()
+        return User.query.filter(User.login.in_([f"bench{i}" for i in range(start, start + count)])).all()
+
+    # --- Бенчмарки ---
+
+    def join_room(self):
+        from services.room_service import join_room_service
+        users = self.make_users(10_000)
+        result = _timed(lambda i: join_room_service(users[i], 2 + i % 9), len(users))
+        self.storage.leave_rooms([u.id for u in users])
+        return result
+
+    def leave_room(self):
+        from services.room_service import join_room_service, leave_room_service
+        users = self.make_users(10_000)
+        for i, user in enumerate(users):
+            join_room_service(user, 2 + i % 9)
+        return _timed(lambda i: leave_room_service(users[i]), len(users))
+
+    def _room_messages(self, history: int, iterations: int):
+        from services.room_service import get_room_messages_service
+        (user,) = self.make_users(1)
+        joined_at = datetime(2025, 1, 1)
+        room_id, _ = self.storage.join_room(user.id, 10, joined_at.isoformat())
+        for i in range(history):
+            ts = (joined_at + timedelta(seconds=i)).isoformat()
+            self.storage.append_message(room_id, f"bench_user:message {i}:{ts}")
+        result = _timed(lambda i: get_room_messages_service(user, room_id), iterations)
+        self.storage.leave_room(user.id)
+        return result
+
+    def room_messages_10(self):
+        return self._room_messages(10, 10_000)
+
+    def room_messages_1k(self):
+        return self._room_messages(1_000, 200)
+
+    def room_messages_100k(self):
+        return self._room_messages(100_000, 5)
+
+    def _complaints_backlog(self, count: int):
+        now = datetime.now().isoformat()
+        for i in range(count):
+            data = {"reporter_id": str(i % 500), "target_user_id": str(i % 97), "message_id": "",
+                    "reason": "", "status": "open", "created_at": now}
+            self.storage.create_complaint(data, f"bench:{i}", 3600, now=0.0, half_life=3600.0,
+                                          default_epoch=0.0, min_score=0.0)
+
+    def list_complaints_first_page(self):
+        from services.complaint_service import list_complaints
+        if not self.storage.complaints:
+            self._complaints_backlog(50_000)
+        return _timed(lambda i: list_complaints(limit=50), 5_000)
+
+    def list_complaints_deep_page(self):
+        from services.complaint_service import list_complaints
+        if not self.storage.complaints:
+            self._complaints_backlog(50_000)
+        after_id = max(self.storage.complaints) - 100
+        return _timed(lambda i: list_complaints(after_id=after_id, limit=50), 5_000)
+
+    def list_complaints_by_target(self):
+        from services.complaint_service import list_complaints
+        if not self.storage.complaints:
+            self._complaints_backlog(50_000)
+        return _timed(lambda i: list_complaints(limit=50, target_user_id=i % 97), 3_000)
+
+    def register_user(self):
+        from services.auth_service import register_user
+        if self.seq < 20_000:
+            self.make_users(20_000)
+        prefix = f"bench_new_{self.seq}_"
+        self.seq += 1
+        return _timed(lambda i: register_user(f"{prefix}{i}", PASSWORD), 20)
+
+    def login_user(self):
+        from services.auth_service import login_user
+        users = self.make_users(50)
+        return _timed(lambda i: login_user(login=users[i].login, password=PASSWORD), len(users))
+
+    def search_users_fuzzy(self):
+        from flask import current_app
+        from admin.services.user_search_service import search_users
+        if not current_app.config.get("USERNAME_TRIGRAM_INDEX"):
+            raise RuntimeError("SQLite without FTS5 trigram tokenizer: fuzzy search is off")
+        if self.seq < 20_000:
+            self.make_users(20_000)
+        self._check_fuzzy_fragment(search_users)
+        # Разные 4-значные фрагменты: кэш поиска не должен подменять замер
+        return _timed(lambda i: search_users(f"{1000 + i * 37 % 9000}", limit=20, fuzzy=True), 300)
+
+    def _check_fuzzy_fragment(self, search_users):
+        """
+        Фрагмент из 5 символов из середины длинного имени должен находиться.
+        """
+        from core.database import db
+        from models.user import User
+        from services.user_search_cache import invalidate_user_search_cache
+        username = f"user_7791{self.seq:04d}66"
+        self.seq += 1
+        db.session.add(User(login=username, username=username, password_hash="-", role="user"))
+        db.session.commit()
+        invalidate_user_search_cache()  # как после регистрации
+        fragment = username[6:11]
+        found = [row["username"] for row in search_users(fragment, limit=20, fuzzy=True)]
+        if username not in found:
+            raise AssertionError(f"fuzzy search for {fragment!r} did not find {username!r}: {found}")
+
+BENCHMARKS = [
+    "join_room",
+    "leave_room",
+    "room_messages_10",
+    "room_messages_1k",
+    "room_messages_100k",
+    "list_complaints_first_page",
+    "list_complaints_deep_page",
+    "list_complaints_by_target",
+    "register_user",
+    "login_user",
+    "search_users_fuzzy",
+]
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    list[(name, current_us, baseline_us, ratio, regressed)]. results и
+    baseline — {name: {"us", "relative"}}; ratio считается по relative,
+    то есть с поправкой на скорость машины в момент замера.
+    """
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, current["us"], None, None, False))
+            continue
+        ratio = current["relative"] / base["relative"] if base["relative"] else float("inf")
+        rows.append((name, current["us"], base["us"], ratio, ratio > 1 + tolerance))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Service layer micro-benchmarks")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="допустимое замедление (0.3 = 30%%)")
+    parser.add_argument("--only", help="запускать бенчмарки, в имени которых есть подстрока")
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов на бенчмарк, берётся лучший")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    bench = Bench()
+    results = {}
+    for name in BENCHMARKS:
+        if args.only and args.only not in name:
+            continue
+        # Лучший из нескольких прогонов: шум соседей по машине только замедляет
+        runs = [getattr(bench, name)() for _ in range(args.repeat)]
+        results[name] = {"us": round(min(run.us for run in runs), 2),
+                         "relative": round(min(run.relative for run in runs), 4)}
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.setdefault("results", {}).update(results)
+        # Формат до замеров относительно эталона сравнивать уже не с чем
+        baseline.pop("results_us", None)
+        baseline["python"] = platform.python_version()
+        baseline["machine"] = platform.machine()
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        for name, value in results.items():
+            print(f"{name:30} {value['us']:>14.2f} us")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressed = False
+    print(f"{'benchmark':30} {'current us':>14} {'baseline us':>14} {'ratio':>7}")
+    rows = compare(results, baseline.get("results", {}), args.tolerance)
+    for name, current, base, ratio, is_regression in rows:
+        base_str = f"{base:14.2f}" if base is not None else f"{'-':>14}"
+        ratio_str = f"{ratio:7.2f}" if ratio is not None else f"{'-':>7}"
+        mark = "  REGRESSION" if is_regression else ""
+        print(f"{name:30} {current:14.2f} {base_str} {ratio_str}{mark}")
+        regressed = regressed or is_regression
+
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
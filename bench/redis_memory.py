@@ -0,0 +1,125 @@
+"""
+Память Redis на пользователя и на комнату: прежняя раскладка ({user:ID} и
+{user:ID}:blocked, hash комнаты со счётчиком и {room:S:N}:users) против
+компактной (корзины {users:B}, множество участников как ключ комнаты).
+Компактная раскладка получается той же миграцией, что и в
+flask migrate-redis-keys, так что прогон заодно проверяет её.
+
+Нужен живой Redis: бенчмарк пишет в отдельную БД (по умолчанию 15) и
+очищает её в конце. Непустую БД трогает только с --flush.
+    python -m bench.redis_memory --users 100000 --room-size 5
+    python -m bench.redis_memory --host 10.0.0.2 --db 14 --json redis_memory.json
+
+Замер — разница INFO memory used_memory до и после заполнения.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+CHUNK = 1000
+
+def _used_memory(r) -> int:
+    return int(r.info("memory")["used_memory"])
+
+def _fill(r, items, write):
+    """write(pipe, item) для каждого элемента, pipeline по CHUNK штук."""
+    for start in range(0, len(items), CHUNK):
+        pipe = r.pipeline(transaction=False)
+        for item in items[start:start + CHUNK]:
+            write(pipe, item)
+        pipe.execute()
+
+def _write_user(pipe, user_id):
+    pipe.hset(f"{{user:{user_id}}}", mapping={
+        "room": f"room:5:{random.randint(100000, 999999)}",
+        "joined_at": "2025-01-01T12:00:00.123456",
+        "seen_at": time.time(),
+    })
+    if user_id % 10 == 0:
+        pipe.set(f"{{user:{user_id}}}:blocked", "1")
+
+def _room_writer(room_size: int):
+    def write(pipe, room_number):
+        room_id = f"room:{room_size}:{room_number}"
+        members = range(room_number * room_size, (room_number + 1) * room_size)
+        pipe.hset(f"{{{room_id}}}", mapping={"max_users": room_size, "current_users": room_size})
+        pipe.sadd(f"{{{room_id}}}:users", *members)
+    return write
+
+def measure(r, name: str, items, write, compact, per: str):
+    """
+    Заполняет прежнюю раскладку, мерит, переводит в компактную, мерит снова.
+    Возвращает строки отчёта.
+    """
+    r.flushdb()
+    base = _used_memory(r)
+    _fill(r, items, write)
+    expanded_bytes = _used_memory(r) - base
+    expanded_keys = r.dbsize()
+
+    compact(r, batch_size=CHUNK)
+    compact_bytes = _used_memory(r) - base
+    compact_keys = r.dbsize()
+    r.flushdb()
+
+    count = len(items)
+    return [
+        {"family": name, "layout": "expanded", "keys": expanded_keys, "bytes": expanded_bytes,
+         f"bytes_per_{per}": round(expanded_bytes / count, 1)},
+        {"family": name, "layout": "compact", "keys": compact_keys, "bytes": compact_bytes,
+         f"bytes_per_{per}": round(compact_bytes / count, 1)},
+    ]
+
+def _listpack_limit(r):
+    for name in ("hash-max-listpack-entries", "hash-max-ziplist-entries"):
+        try:
+            value = r.config_get(name)
+        except Exception:
+            return None  # CONFIG запрещён (управляемый Redis)
+        if value:
+            return {key.decode() if isinstance(key, bytes) else key: val for key, val in value.items()}
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis memory per user and per room, before/after compaction")
+    parser.add_argument("--host", default=os.environ.get("REDIS_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("REDIS_PORT", 6379)))
+    parser.add_argument("--password", default=os.environ.get("REDIS_PASSWORD") or None)
+    parser.add_argument("--db", type=int, default=15, help="отдельная БД, будет очищена")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--room-size", type=int, default=5)
+    parser.add_argument("--flush", action="store_true", help="разрешить очистку непустой БД")
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    args = parser.parse_args()
+
+    import redis
+    from core.storage.redis_migration import compact_rooms, compact_users
+
+    r = redis.Redis(host=args.host, port=args.port, db=args.db, password=args.password)
+    if r.dbsize() and not args.flush:
+        print(f"DB {args.db} is not empty; pass --flush to clear it", file=sys.stderr)
+        return 1
+
+    rows = measure(r, "users", list(range(args.users)), _write_user, compact_users, "user")
+    rows += measure(r, "rooms", list(range(args.users // args.room_size)), _room_writer(args.room_size),
+                    compact_rooms, "room")
+
+    print(f"{'family':8} {'layout':9} {'keys':>9} {'bytes':>12} {'per item':>10}")
+    for row in rows:
+        per_item = row.get("bytes_per_user", row.get("bytes_per_room"))
+        print(f"{row['family']:8} {row['layout']:9} {row['keys']:9} {row['bytes']:12} {per_item:10}")
+
+    limit = _listpack_limit(r)
+    if limit:
+        print(f"listpack limit: {limit}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"users": args.users, "room_size": args.room_size, "rows": rows,
+                       "listpack_limit": limit}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Бенчмарк пропускной способности записи в SQLite: дефолтный движок против
+профиля из core.database (WAL + PRAGMA + пул).
+
+Запуск из корня проекта:
+    python -m bench.sqlite_write_bench --writers 8 --readers 4 --ops 500
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from core.database import get_sqlite_pragmas, apply_sqlite_pragmas, get_engine_options
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    login VARCHAR(50) UNIQUE NOT NULL,
+    password_hash VARCHAR(128) NOT NULL,
+    telegram_id VARCHAR(50) UNIQUE,
+    username VARCHAR(50) NOT NULL,
+    role VARCHAR(20)
+)
+"""
+
+def make_engine(path: str, tuned: bool):
+    uri = f"sqlite:///{path}"
+    if not tuned:
+        # Как было в app.py: никаких опций
+        return create_engine(uri)
+
+    engine = create_engine(uri, **get_engine_options(uri))
+    pragmas = get_sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+def run(tuned: bool, writers: int, readers: int, ops: int):
+    """
+    Запускает writers потоков, каждый делает ops коротких транзакций
+    (регистрация / смена username / смена роли), параллельно readers
+    потоков читают список пользователей. Возвращает (ops_per_sec, errors).
+    """
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = make_engine(path, tuned)
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA))
+
+    errors = []
+    stop = threading.Event()
+
+    def writer(n: int):
+        for i in range(ops):
+            try:
+                with engine.begin() as conn:
+                    login = f"w{n}_{i}"
+                    conn.execute(
+                        text("INSERT INTO users (login, password_hash, username, role) "
+                             "VALUES (:l, 'x', :u, 'user')"),
+                        {"l": login, "u": f"user_{n}_{i}"}
+                    )
+                    conn.execute(
+                        text("UPDATE users SET username = :u WHERE login = :l"),
+                        {"l": login, "u": f"renamed_{n}_{i}"}
+                    )
+                    if i % 10 == 0:
+                        conn.execute(
+                            text("UPDATE users SET role = 'moderator' WHERE login = :l"),
+                            {"l": login}
+                        )
+            except Exception as e:
+                errors.append(repr(e))
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT id, role, username FROM users")).fetchall()
+            except Exception as e:
+                errors.append(repr(e))
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for t in reader_threads:
+        t.start()
+
+    started = time.perf_counter()
+    for t in writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    for t in reader_threads:
+        t.join()
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    return writers * ops / elapsed, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite write throughput: before/after")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=300)
+    args = parser.parse_args()
+
+    for label, tuned in (("default", False), ("tuned", True)):
+        tps, errors = run(tuned, args.writers, args.readers, args.ops)
+        print(f"{label:8s} {tps:10.1f} tx/s  errors={len(errors)}")
+        if errors:
+            print(f"         first error: {errors[0]}")
+
+if __name__ == "__main__":
+    main()
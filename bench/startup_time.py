@@ -0,0 +1,119 @@
+"""
+Бюджет холодного старта: время `import app`, create_app() и первого
+запроса спецификации Swagger, каждое — в новом процессе интерпретатора.
+
+Запуск из корня проекта (нужен config/config.yaml):
+    python -m bench.startup_time                 # сравнить с bench/startup_budget.json
+    python -m bench.startup_time --top 15        # плюс самые медленные импорты (-X importtime)
+    python -m bench.startup_time --swagger-mode off  # Swagger выключен, поверх config.yaml
+    python -m bench.startup_time --update-budget
+
+Код выхода 1, если хотя бы одна величина превышает бюджет больше чем на tolerance.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), "startup_budget.json")
+
+PROBE = r"""
+import json, os, sys, tempfile, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+tmp_dir = tempfile.mkdtemp(prefix="omilia-startup-")
+overrides = {
+    "DATABASE_URL": "sqlite:///" + os.path.join(tmp_dir, "startup.db"),
+    "LOG_DIR": os.path.join(tmp_dir, "logs"),
+}
+if len(sys.argv) > 1:
+    # Поверх config.yaml: переменные окружения он перезаписывает
+    overrides["SWAGGER_MODE"] = sys.argv[1]
+flask_app = app.create_app(overrides, start_background_tasks=False)
+created = time.perf_counter()
+flask_app.test_client().get("/apispec.json")
+spec_served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_apispec_ms": (spec_served - created) * 1000,
+}))
+"""
+
+def measure(repeat: int, env: dict, swagger_mode: str = None):
+    """
+    Лучшее из repeat холодных запусков по каждой величине, мс.
+    """
+    command = [sys.executable, "-c", PROBE] + ([swagger_mode] if swagger_mode else [])
+    best = {}
+    for _ in range(repeat):
+        output = subprocess.run(command, capture_output=True,
+                                text=True, check=True, env=env).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        for key, value in sample.items():
+            best[key] = min(best.get(key, value), value)
+    return {key: round(value, 1) for key, value in best.items()}
+
+def slowest_imports(top: int, env: dict):
+    """
+    Самые медленные модули по -X importtime (суммарное время с вложенными), мкс.
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            capture_output=True, text=True, check=True, env=env).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   self_us | cumulative_us | module"
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start time budget")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--top", type=int, default=0, help="показать N самых медленных импортов")
+    parser.add_argument("--swagger-mode", choices=["dynamic", "static", "off"],
+                        help="SWAGGER_MODE для замера, заменяет значение из config.yaml")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--update-budget", action="store_true")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    results = measure(args.repeat, env, args.swagger_mode)
+
+    if args.top:
+        print(f"{'cumulative us':>14} {'self us':>10}  module")
+        for cumulative_us, self_us, name in slowest_imports(args.top, env):
+            print(f"{cumulative_us:14} {self_us:10}  {name}")
+        print()
+
+    if args.update_budget:
+        with open(args.budget, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        for key, value in results.items():
+            print(f"{key:20} {value:>10.1f} ms")
+        print(f"Budget written to {args.budget}")
+        return 0
+
+    budget = {}
+    if os.path.exists(args.budget):
+        with open(args.budget, encoding="utf-8") as f:
+            budget = json.load(f)
+
+    over = False
+    print(f"{'metric':20} {'current ms':>12} {'budget ms':>12}")
+    for key, value in results.items():
+        limit = budget.get(key)
+        exceeded = limit is not None and value > limit * (1 + args.tolerance)
+        limit_str = f"{limit:12.1f}" if limit is not None else f"{'-':>12}"
+        print(f"{key:20} {value:12.1f} {limit_str}{'  OVER BUDGET' if exceeded else ''}")
+        over = over or exceeded
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
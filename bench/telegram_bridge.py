@@ -0,0 +1,195 @@
+"""
+Мост в Telegram против локального фейкового Bot API: сколько сообщений
+доходит, насколько они склеиваются и соблюдаются ли лимиты.
+
+Фейковый сервер отвечает на sendMessage и, как Telegram, отдаёт 429 с
+retry_after, если в чат уходит больше --server-chat-limit сообщений в
+секунду или всего больше --server-global-limit. Бенчмарк генерирует
+события комнат, прогоняет их через TelegramBridge (потоки вместо
+greenlet'ов) и ждёт, пока очередь опустеет.
+    python -m bench.telegram_bridge --rooms 200 --room-size 5 --events-per-sec 300 --duration 10
+    python -m bench.telegram_bridge --latency-ms 80 --json telegram_bridge.json
+
+Только сервер — для ручной проверки приложения
+(TELEGRAM_API_URL: "http://127.0.0.1:8081"):
+    python -m bench.telegram_bridge --serve --port 8081
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeTelegram:
+    """Состояние фейкового Bot API: принятые сообщения и окна лимитов."""
+
+    def __init__(self, chat_limit: int, global_limit: int, latency: float):
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.recent = defaultdict(deque)   # chat_id -> время принятых за последнюю секунду
+        self.recent_all = deque()
+        self.delivered = defaultdict(list)  # chat_id -> тексты
+        self.calls = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _trim(window, now):
+        while window and window[0] <= now - 1:
+            window.popleft()
+
+    def send_message(self, chat_id, text: str):
+        """(HTTP-статус, тело ответа)."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            now = time.monotonic()
+            window = self.recent[chat_id]
+            self._trim(window, now)
+            self._trim(self.recent_all, now)
+            if len(window) >= self.chat_limit or len(self.recent_all) >= self.global_limit:
+                self.rejected += 1
+                return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                             "parameters": {"retry_after": 1}}
+            window.append(now)
+            self.recent_all.append(now)
+            self.delivered[chat_id].append(text)
+        return 200, {"ok": True, "result": {"message_id": self.calls, "chat": {"id": chat_id}, "text": text}}
+
+def make_server(fake: FakeTelegram, port: int, verbose: bool = False):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, как у api.telegram.org
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.endswith("/sendMessage"):
+                status, reply = fake.send_message(body.get("chat_id"), body.get("text", ""))
+                if verbose:
+                    print(f"{status} chat={body.get('chat_id')}: {body.get('text', '')!r}")
+            elif self.path.endswith("/getMe"):
+                status, reply = 200, {"ok": True, "result": {"id": 1, "is_bot": True, "username": "fake_bot"}}
+            else:
+                status, reply = 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+            payload = json.dumps(reply).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    return server
+
+def _spawn(fn, *args):
+    threading.Thread(target=fn, args=args, daemon=True).start()
+
+def run(args, fake: FakeTelegram, api_url: str):
+    from core.metrics import TELEGRAM_BRIDGE_MESSAGES
+    from services.telegram_bridge_service import TelegramBridge, TelegramClient
+
+    rooms = {f"room:{args.room_size}:{100000 + i}": list(range(i * args.room_size, (i + 1) * args.room_size))
+             for i in range(args.rooms)}
+    room_ids = list(rooms)
+
+    def resolve_chats(ids):
+        return {room_id: {user_id: user_id for user_id in rooms[room_id]} for room_id in ids}
+
+    client = TelegramClient("bench", api_url, pool_size=args.concurrency)
+    bridge = TelegramBridge(client, resolve_chats, global_rate=args.global_rate, chat_rate=args.chat_rate,
+                            flush_interval=args.flush_interval, concurrency=args.concurrency,
+                            max_pending=args.max_pending, spawn=_spawn)
+
+    expected_lines = 0
+    started = time.monotonic()
+    generated = 0
+    while True:
+        now = time.monotonic()
+        due = min(int((now - started) * args.events_per_sec), int(args.duration * args.events_per_sec))
+        for _ in range(due - generated):
+            room_id = random.choice(room_ids)
+            sender = random.choice(rooms[room_id])
+            bridge.on_room_event(room_id, "new_message",
+                                 {"user_id": f"u{sender}", "message": "x" * args.message_size,
+                                  "timestamp": "2025-01-01T00:00:00+00:00"}, sender_id=sender)
+            expected_lines += args.room_size - 1
+        generated = due
+        delay = bridge.pump()
+        generating = now - started < args.duration
+        if not generating and not bridge.events and not bridge.outbox and not bridge.sending:
+            break
+        if not generating and now - started > args.duration + args.drain_timeout:
+            print("drain timeout", file=sys.stderr)
+            break
+        time.sleep(min(delay, 0.005))
+    elapsed = time.monotonic() - started
+    client.close()
+
+    delivered_lines = sum(text.count("\n") + 1 for texts in fake.delivered.values() for text in texts)
+    accepted = sum(len(texts) for texts in fake.delivered.values())
+    return {
+        "events": generated,
+        "expected_lines": expected_lines,
+        "delivered_lines": delivered_lines,
+        "send_calls": fake.calls,
+        "accepted_calls": accepted,
+        "rejected_429": fake.rejected,
+        "lines_per_message": round(delivered_lines / accepted, 2) if accepted else 0,
+        "elapsed_s": round(elapsed, 2),
+        "drain_s": round(max(0.0, elapsed - args.duration), 2),
+        "bridge_results": {labels[0]: value for labels, value in TELEGRAM_BRIDGE_MESSAGES.values.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Telegram bridge against a local fake Bot API")
+    parser.add_argument("--serve", action="store_true", help="только запустить фейковый сервер")
+    parser.add_argument("--port", type=int, default=0, help="порт сервера (0 — любой свободный)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="задержка ответа сервера")
+    parser.add_argument("--server-chat-limit", type=int, default=1, help="сообщений в сек в чат до 429")
+    parser.add_argument("--server-global-limit", type=int, default=30, help="сообщений в сек всего до 429")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--room-size", type=int, default=5)
+    parser.add_argument("--events-per-sec", type=float, default=300)
+    parser.add_argument("--duration", type=float, default=10, help="сек генерации событий")
+    parser.add_argument("--message-size", type=int, default=40)
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--global-rate", type=float, default=25)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=200)
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.server_chat_limit, args.server_global_limit, args.latency_ms / 1000)
+    server = make_server(fake, args.port, verbose=args.serve)
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+    if args.serve:
+        print(f"Fake Telegram Bot API on {api_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    report = run(args, fake, api_url)
+    server.shutdown()
+
+    for key, value in report.items():
+        print(f"{key:18} {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
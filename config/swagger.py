@@ -59,6 +59,57 @@ swagger_template = {
                 }
             }
         },
+        "BulkUserActionModel": {
+            "type": "object",
+            "properties": {
+                "user_ids": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "example": [123, 124, 125]
+                }
+            }
+        },
+        "ProfilerSettingsModel": {
+            "type": "object",
+            "properties": {
+                "sample_rate": {
+                    "type": "number",
+                    "minimum": 0,
+                    "maximum": 1,
+                    "example": 0.01
+                }
+            }
+        },
+        "BulkRoleModel": {
+            "type": "object",
+            "properties": {
+                "user_ids": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "example": [123, 124]
+                },
+                "new_role": {
+                    "type": "string",
+                    "enum": ["user", "moderator", "admin"],
+                    "example": "moderator"
+                }
+            }
+        },
+        "BulkResultResponse": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "user_id": {"type": "integer", "example": 123},
+                            "status": {"type": "string", "example": "blocked"}
+                        }
+                    }
+                }
+            }
+        },
         "ErrorResponse": {
             "type": "object",
             "properties": {
@@ -71,6 +122,64 @@ swagger_template = {
                 "message": {"type": "string", "example": "Some success message"}
             }
         },
+        "SessionResponse": {
+            "type": "object",
+            "properties": {
+                "user": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer", "example": 123},
+                        "login": {"type": "string", "example": "my_login"},
+                        "username": {"type": "string", "example": "user_12345678"},
+                        "role": {"type": "string", "example": "user"},
+                        "telegram_id": {"type": "string", "example": None}
+                    }
+                },
+                "room_id": {"type": "string", "example": "room:3:123456"},
+                "room": {
+                    "type": "object",
+                    "properties": {
+                        "max_users": {"type": "integer", "example": 3},
+                        "current_users": {"type": "integer", "example": 2}
+                    }
+                },
+                "messages": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "user_id": {"type": "string", "example": "user_12345678"},
+                            "content": {"type": "string", "example": "Hello!"},
+                            "timestamp": {"type": "string", "example": "2025-01-01T10:00:00+00:00"}
+                        }
+                    }
+                },
+                "notifications": {
+                    "type": "array",
+                    "items": {"$ref": "#/definitions/Notification"}
+                },
+                "notification_cursor": {"type": "string", "example": "1735725600000-0"}
+            }
+        },
+        "Notification": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "string", "example": "1735725600000-0"},
+                "message": {"type": "string", "example": "User user_12345678 has joined the room."},
+                "created_at": {"type": "string", "example": "2025-01-01T10:00:00+00:00"}
+            }
+        },
+        "NotificationsResponse": {
+            "type": "object",
+            "properties": {
+                "room_id": {"type": "string", "example": "room:3:123456"},
+                "notifications": {
+                    "type": "array",
+                    "items": {"$ref": "#/definitions/Notification"}
+                },
+                "cursor": {"type": "string", "example": "1735725600000-0"}
+            }
+        },
         "CreateComplaintModel": {
             "type": "object",
             "properties": {
@@ -96,7 +205,10 @@ swagger_template = {
                 "target_user_id": {"type": "string", "example": "20"},
                 "message_id": {"type": "string", "example": "msg_12345"},
                 "reason": {"type": "string", "example": "Spam or offensive content"},
-                "created_at": {"type": "string", "example": "2025-01-01T10:00:00"}
+                "status": {"type": "string", "enum": ["open", "resolved"], "example": "open"},
+                "created_at": {"type": "string", "example": "2025-01-01T10:00:00"},
+                "resolved_at": {"type": "string", "example": ""},
+                "archived": {"type": "boolean", "example": False}
             }
         }
     },
@@ -15,7 +15,7 @@ from services.auth_service import (
     change_username as change_username_service
 )
 from services.room_service import leave_room_service
-from core.database import get_redis_client
+from core.storage import get_storage
 from models.user import User
 
 logger = logging.getLogger(__name__)
@@ -24,7 +24,7 @@ auth_bp = Blueprint('auth_bp', __name__)
 def get_current_user():
     """
     Извлекает текущего пользователя на основе токена JWT (access или refresh).
-    Дополнительно проверяет в Redis, нет ли флага блокировки user:{user_id}:blocked.
+    Дополнительно проверяет в хранилище, нет ли флага блокировки.
     Если заблокирован — прерываем запрос (abort(403)).
     """
     user_id = get_jwt_identity()
@@ -34,12 +34,8 @@ def get_current_user():
     user = User.query.get(user_id)
     if not user:
         return None
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
-    
-    # Проверка блокировки через Redis
-    if r.get(f"user:{user_id}:blocked") == "1":
+    # Проверка блокировки через хранилище (допускает отставание реплики)
+    if get_storage().is_blocked(user.id, stale_ok=True):
         abort(403, description="User is blocked")
 
     return user
@@ -0,0 +1,21 @@
+from flask import Blueprint, Response
+from core.metrics import render_metrics
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Метрики сервера
+    ---
+    description: Метрики в формате Prometheus, сложенные по всем воркерам
+      (задержки HTTP и Socket.IO, команды Redis, сокеты, комнаты).
+    tags:
+      - Monitoring
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Текст в формате Prometheus exposition 0.0.4
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
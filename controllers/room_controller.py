@@ -3,14 +3,15 @@ import os
 from flask import Blueprint, jsonify, request, abort
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
-from schemas.room_schemas import JoinRoomSchema
+from schemas.room_schemas import JoinRoomSchema, NotificationsQuerySchema
 from services.room_service import (
     join_room_service,
     leave_room_service,
     my_room_service,
-    get_room_messages_service
+    get_room_messages_service,
+    get_notifications_service
 )
-from core.database import get_redis_client
+from core.storage import get_storage
 from models.user import User
 
 logger = logging.getLogger(__name__)
@@ -18,7 +19,7 @@ room_bp = Blueprint('room_bp', __name__)
 
 def get_current_user():
     """
-    Извлекает текущего пользователя (JWT), проверяет блокировку в Redis.
+    Извлекает текущего пользователя (JWT), проверяет блокировку в хранилище.
     """
     user_id = get_jwt_identity()
     if user_id is None:
@@ -28,12 +29,8 @@ def get_current_user():
     if not user:
         return None
     
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
-    
-    # Проверка блокировки
-    if r.get(f"user:{user_id}:blocked") == "1":
+    # Проверка блокировки (допускает отставание реплики)
+    if get_storage().is_blocked(user.id, stale_ok=True):
         abort(403, description="User is blocked")
 
     return user
@@ -250,3 +247,61 @@ def room_messages(room_id):
         return jsonify({"error": error}), status_code
 
     return jsonify(messages), 200
+
+@room_bp.route('/notifications', methods=['GET'])
+@jwt_required()
+def room_notifications():
+    """
+    Уведомления комнаты
+    ---
+    description: Уведомления текущей комнаты (входы и выходы участников) после
+      курсора. Лента ограничена NOTIFICATIONS_MAX_LEN последними записями;
+      в ответе cursor — передать его в after при следующем запросе.
+    tags:
+      - Rooms
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: ID последнего полученного уведомления ("0" — с начала ленты); без него — последние limit
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        default: 50
+        description: Сколько уведомлений вернуть (1..200)
+    responses:
+      200:
+        description: Уведомления по возрастанию ID
+        schema:
+          $ref: '#/definitions/NotificationsResponse'
+      400:
+        description: Пользователь не в комнате или неверный курсор
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      403:
+        description: Пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      404:
+        description: Пользователь не найден
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    user_ = get_current_user()
+    if not user_:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        args = NotificationsQuerySchema().load(request.args)
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    payload, error, status_code = get_notifications_service(user_, args["after"], args["limit"])
+    if error:
+        return jsonify({"error": error}), status_code
+
+    return jsonify(payload), 200
@@ -0,0 +1,68 @@
+import logging
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import ValidationError
+from schemas.room_schemas import SessionQuerySchema
+from services.session_service import bootstrap_session
+
+logger = logging.getLogger(__name__)
+session_bp = Blueprint('session_bp', __name__)
+
+@session_bp.route('/session', methods=['GET'])
+@jwt_required()
+def session():
+    """
+    Состояние клиента при старте
+    ---
+    description: Профиль, текущая комната, её заполненность, последние
+      сообщения (после входа пользователя) и уведомления комнаты — одним
+      запросом вместо /my_room и /room_messages.
+    tags:
+      - Rooms
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: messages
+        type: integer
+        required: false
+        default: 50
+        description: Сколько последних сообщений комнаты вернуть (1..200)
+      - in: query
+        name: notifications
+        type: integer
+        required: false
+        default: 20
+        description: Сколько уведомлений комнаты вернуть (1..200)
+      - in: query
+        name: notifications_after
+        type: string
+        required: false
+        description: ID последнего полученного уведомления; без него — последние уведомления
+    responses:
+      200:
+        description: Состояние сессии
+        schema:
+          $ref: '#/definitions/SessionResponse'
+      400:
+        description: Ошибка валидации параметров
+      403:
+        description: Пользователь заблокирован
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+      404:
+        description: Пользователь не найден
+        schema:
+          $ref: '#/definitions/ErrorResponse'
+    """
+    try:
+        args = SessionQuerySchema().load(request.args)
+    except ValidationError as e:
+        return jsonify(e.messages), 400
+
+    payload, error, status_code = bootstrap_session(get_jwt_identity(), args["messages"],
+                                                    args["notifications"], args["notifications_after"])
+    if error:
+        return jsonify({"error": error}), status_code
+
+    return jsonify(payload), 200
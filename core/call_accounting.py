@@ -0,0 +1,151 @@
+import logging
+import os
+import re
+import time
+from functools import wraps
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from core.metrics import REQUEST_REDIS_ROUND_TRIPS, REQUEST_SQL_QUERIES, N_PLUS_ONE
+
+logger = logging.getLogger(__name__)
+
+# Учёт обращений к Redis и SQL в рамках одного HTTP-запроса или события
+# Socket.IO. «Форма» вызова — команда и ключ с заменёнными числами
+# (HGET room:#:#) или текст SQL-запроса; одна и та же форма, повторённая
+# N_PLUS_ONE_THRESHOLD раз отдельными round trip'ами, считается N+1.
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+class CallStats:
+    def __init__(self):
+        self.redis_commands = 0
+        self.redis_round_trips = 0
+        self.redis_seconds = 0.0
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.shapes = {}  # (kind, shape) -> число round trip'ов
+
+    def add(self, kind: str, shape: str):
+        key = (kind, shape)
+        self.shapes[key] = self.shapes.get(key, 0) + 1
+
+    def repeated_shapes(self, threshold: int):
+        return [(kind, shape, count) for (kind, shape), count in self.shapes.items() if count >= threshold]
+
+def _threshold() -> int:
+    return int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+
+def _current():
+    if not has_app_context():
+        return None
+    return g.get("call_stats")
+
+def redis_shape(args) -> str:
+    command = str(args[0]).upper()
+    if command in ("EVAL", "EVALSHA") and len(args) > 3:
+        # EVAL script numkeys key...: форма — первый ключ, текст скрипта не нужен
+        return f"{command} {_DIGITS.sub('#', str(args[3]))}"
+    if len(args) < 2:
+        return command
+    return f"{command} {_DIGITS.sub('#', str(args[1]))}"
+
+def pipeline_shape(stack_args) -> str:
+    """
+    Форма pipeline — различные формы его команд в порядке появления:
+    одинаковые pipeline'ы в цикле складываются в одну форму, разные — нет.
+    """
+    shapes = list(dict.fromkeys(redis_shape(args) for args in stack_args))
+    return f"PIPELINE [{'; '.join(shapes)}]"
+
+def account_redis(shape: str, seconds: float, commands: int = 1):
+    """
+    Вызывается клиентом Redis после каждого round trip (pipeline — один round trip).
+    """
+    stats = _current()
+    if stats is None:
+        return
+    stats.redis_commands += commands
+    stats.redis_round_trips += 1
+    stats.redis_seconds += seconds
+    stats.add("redis", shape)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.call_accounting_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current()
+    if stats is None:
+        return
+    stats.sql_queries += 1
+    stats.sql_seconds += time.perf_counter() - context.call_accounting_started
+    stats.add("sql", _SPACES.sub(" ", statement).strip()[:200])
+
+def begin():
+    g.call_stats = CallStats()
+
+def finish(endpoint: str):
+    """
+    Закрывает учёт: пишет метрики, логирует N+1. Возвращает CallStats или None.
+    """
+    stats = g.pop("call_stats", None)
+    if stats is None:
+        return None
+
+    REQUEST_REDIS_ROUND_TRIPS.observe((endpoint,), stats.redis_round_trips)
+    REQUEST_SQL_QUERIES.observe((endpoint,), stats.sql_queries)
+    repeated = stats.repeated_shapes(_threshold())
+    for kind in {kind for kind, _, _ in repeated}:
+        N_PLUS_ONE.inc((endpoint, kind))
+    for kind, shape, count in repeated:
+        logger.warning(f"Possible N+1 in {endpoint}: {kind} '{shape}' x{count}")
+    stats.repeated = repeated
+    return stats
+
+def _headers_enabled(app) -> bool:
+    value = os.environ.get("CALL_ACCOUNTING_HEADERS", "")
+    return app.debug or value.lower() in ("1", "true", "yes")
+
+def init_call_accounting(app):
+    """
+    Счётчики Redis/SQL на каждый HTTP-запрос. В debug-режиме (или при
+    CALL_ACCOUNTING_HEADERS) они отдаются в заголовках X-Redis-* / X-SQL-*.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def _begin_accounting():
+        begin()
+
+    @app.after_request
+    def _finish_accounting(response):
+        stats = finish(request.endpoint or "unmatched")
+        if stats is not None and _headers_enabled(app):
+            response.headers["X-Redis-Commands"] = str(stats.redis_commands)
+            response.headers["X-Redis-Round-Trips"] = str(stats.redis_round_trips)
+            response.headers["X-Redis-Time-Ms"] = f"{stats.redis_seconds * 1000:.2f}"
+            response.headers["X-SQL-Queries"] = str(stats.sql_queries)
+            response.headers["X-SQL-Time-Ms"] = f"{stats.sql_seconds * 1000:.2f}"
+            if stats.repeated:
+                response.headers["X-N-Plus-One"] = "; ".join(
+                    f"{kind} {shape} x{count}" for kind, shape, count in stats.repeated
+                )
+        return response
+
+def account_event(event_name: str):
+    """
+    Декоратор обработчика Socket.IO: тот же учёт, что у HTTP, endpoint = socket:<event>.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            begin()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                finish(f"socket:{event_name}")
+        return wrapper
+    return decorator
@@ -0,0 +1,135 @@
+import os
+import click
+
+def register_commands(app):
+    """
+    Регистрирует служебные CLI-команды: flask --app app <команда>.
+    """
+
+    @app.cli.command("reindex-complaints")
+    @click.option("--batch-size", default=500, show_default=True, help="Размер пачки SSCAN")
+    def reindex_complaints(batch_size):
+        """Перенести жалобы из {complaints}:all в sorted set-индексы (только Redis)."""
+        from core.storage import RedisStorage
+        migrated = RedisStorage().rebuild_complaint_indexes(batch_size=batch_size)
+        click.echo(f"Reindexed {migrated} complaints")
+
+    @app.cli.command("drop-legacy-notifications")
+    @click.option("--batch-size", default=500, show_default=True, help="Размер пачки SCAN")
+    def drop_legacy_notifications(batch_size):
+        """Удалить ленты уведомлений старого формата (list) из Redis."""
+        from core.storage import RedisStorage
+        dropped = RedisStorage().drop_legacy_notifications(batch_size=batch_size)
+        click.echo(f"Dropped {dropped} legacy notification lists")
+
+    @app.cli.command("migrate-redis-keys")
+    @click.option("--batch-size", default=500, show_default=True, help="Размер пачки SCAN")
+    @click.option("--dry-run", is_flag=True, help="Только посчитать, ничего не менять")
+    @click.option("--source-url", default=None,
+                  help="Старый Redis (redis://host:port/db), из которого копировать; по умолчанию — перенос на месте")
+    @click.option("--delete-source", is_flag=True, help="С --source-url: удалять перенесённые ключи в источнике")
+    def migrate_redis_keys(batch_size, dry_run, source_url, delete_source):
+        """Перенести ключи старых схем Redis в текущую: hash tag'и и компактные корзины."""
+        import redis
+        from core.redis_client import create_binary_client
+        from core.storage.redis_migration import compact_layout, migrate_keys
+        source = redis.Redis.from_url(source_url) if source_url else None
+        target = create_binary_client()
+        report = migrate_keys(target, source=source, batch_size=batch_size,
+                              dry_run=dry_run, delete_source=delete_source if source_url else None)
+        report.update(compact_layout(target, batch_size=batch_size, dry_run=dry_run))
+        for key, value in report.items():
+            click.echo(f"{key:16} {value}")
+        if report["failed"]:
+            raise SystemExit(1)
+
+    @app.cli.command("archive-complaints")
+    @click.option("--batch-size", default=None, type=int,
+                  help="Жалоб за одну пачку (по умолчанию COMPLAINT_ARCHIVE_BATCH_SIZE)")
+    @click.option("--retention-days", default=None, type=float,
+                  help="Архивировать нерешённые старше N дней (по умолчанию COMPLAINT_RETENTION_DAYS)")
+    def archive_complaints_command(batch_size, retention_days):
+        """Перенести решённые и устаревшие жалобы из Redis в SQLite."""
+        from services.complaint_archive_service import archive_complaints
+        archived = archive_complaints(batch_size=batch_size, retention_days=retention_days)
+        click.echo(f"Archived {archived} complaints")
+
+    @app.cli.command("reap-rooms")
+    @click.option("--batch-size", default=None, type=int,
+                  help="Ключей за одну порцию SCAN (по умолчанию ROOM_REAPER_BATCH_SIZE)")
+    @click.option("--membership-ttl", default=None, type=int,
+                  help="Сек без активности до выхода из комнаты (по умолчанию MEMBERSHIP_TTL)")
+    def reap_rooms_command(batch_size, membership_ttl):
+        """Один проход сборщика: неактивные участники, осиротевшие записи, пустые комнаты."""
+        from services.room_reaper_service import reap_rooms
+        report = reap_rooms(batch_size=batch_size, membership_ttl=membership_ttl)
+        for key, value in report.items():
+            click.echo(f"{key:22} {value}")
+
+    @app.cli.command("redis-memory-audit")
+    @click.option("--sample-rate", default=None, type=float,
+                  help="Доля владельцев ключей для MEMORY USAGE (по умолчанию REDIS_AUDIT_SAMPLE_RATE)")
+    @click.option("--top", default=10, show_default=True, help="Сколько самых больших комнат показать")
+    @click.option("--json", "json_path", default=None, help="Сохранить полный отчёт в файл")
+    def redis_memory_audit_command(sample_rate, top, json_path):
+        """Память Redis по семействам ключей, самые большие комнаты и ключи без владельца."""
+        import json
+        from admin.services.redis_audit_service import redis_memory_audit_full
+        report = redis_memory_audit_full(
+            sample_rate=sample_rate, top=top,
+            progress=lambda total: click.echo(f"... {total['scanned']} keys scanned", err=True))
+
+        click.echo(f"{'family':14} {'keys':>10} {'sampled':>9} {'bytes (est.)':>14}")
+        for family, stats in report["families"].items():
+            click.echo(f"{family:14} {stats['keys']:10} {stats['sampled']:9} {stats['bytes_estimated']:14}")
+        click.echo("top rooms (measured bytes):")
+        for row in report["top_rooms"]:
+            click.echo(f"  {row['room_id']:24} {row['bytes']}")
+        click.echo(f"orphans: {report['orphans_total'] or 'none'}")
+        for orphan in report["orphans"]:
+            click.echo(f"  {orphan['reason']:8} {orphan['key']}")
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+    @app.cli.command("storage-conformance")
+    @click.option("--backend", type=click.Choice(["memory", "redis"]), default="memory",
+                  show_default=True, help="Какой движок хранилища проверять")
+    @click.option("--scratch-db", type=int, default=None,
+                  help="Пустая база Redis для проверок (не REDIS_DB); после прогона очищается")
+    def storage_conformance(backend, scratch_db):
+        """Прогнать общий набор проверок контракта хранилища."""
+        from core.storage import create_storage
+        from core.storage.conformance import run_conformance
+        if backend == "memory":
+            failures = run_conformance(lambda: create_storage(backend))
+        else:
+            # Проверки сдвигают эпоху рейтинга нарушителей, заводят жалобы,
+            # ключи дубля и локи — только в отдельной пустой базе
+            from core.redis_client import create_scratch_client, is_cluster_mode
+            from core.storage.redis_storage import RedisStorage
+            if is_cluster_mode():
+                raise click.UsageError("Redis Cluster has only DB 0; run the checks against a standalone test Redis")
+            if scratch_db is None or scratch_db == int(os.environ.get("REDIS_DB", 0)):
+                raise click.UsageError("--scratch-db must name an empty Redis DB other than REDIS_DB")
+            client = create_scratch_client(scratch_db)
+            if client.dbsize():
+                raise click.UsageError(f"Redis DB {scratch_db} is not empty; refusing to use it as scratch")
+            try:
+                failures = run_conformance(lambda: RedisStorage(client))
+            finally:
+                client.flushdb()
+        for name, error in failures:
+            click.echo(f"FAIL {name}: {error}")
+        if failures:
+            raise SystemExit(1)
+        click.echo(f"All storage checks passed for '{backend}'")
+
+    @app.cli.command("build-swagger")
+    @click.option("--output", default=None,
+                  help="Куда записать спецификацию (по умолчанию SWAGGER_SPEC_PATH)")
+    def build_swagger(output):
+        """Собрать спецификацию Swagger из docstring'ов для SWAGGER_MODE=static."""
+        from core.swagger_setup import write_swagger_spec
+        path = write_swagger_spec(app, output)
+        click.echo(f"Swagger spec written to {path}")
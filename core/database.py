@@ -1,21 +1,145 @@
 import os
-import redis, time
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
+from core.redis_client import get_redis_client, get_redis_metrics, start_replica_monitor, RedisUnavailableError
 
 db = SQLAlchemy()
 jwt = JWTManager()
 socketio = SocketIO()
-_redis_client = None
+
+# Профиль SQLite по умолчанию: WAL позволяет читателям не ждать писателя,
+# synchronous=NORMAL в WAL-режиме безопасен при падении процесса.
+SQLITE_PRAGMA_DEFAULTS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64000,  # отрицательное значение — в КиБ (≈64 МБ)
+    "busy_timeout": 5000,  # мс
+    "foreign_keys": "ON",
+}
+
+def get_sqlite_pragmas():
+    """
+    Собирает PRAGMA для SQLite из переменных окружения (SQLITE_<NAME>).
+    Пустое значение отключает соответствующую PRAGMA.
+    """
+    pragmas = {}
+    for name, default in SQLITE_PRAGMA_DEFAULTS.items():
+        value = os.environ.get(f"SQLITE_{name.upper()}", default)
+        if value is None or str(value).strip() == "":
+            continue
+        pragmas[name] = value
+    return pragmas
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """
+    Применяет PRAGMA к «сырому» DB-API соединению SQLite.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def get_engine_options(uri: str):
+    """
+    Опции create_engine для основного движка.
+    Для SQLite размер пула подобран под eventlet: greenlet'ов много,
+    а писатель всё равно один, поэтому держим небольшой пул и ждём в очереди.
+    """
+    if not uri.startswith("sqlite"):
+        return {
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+            "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+            "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+            "pool_pre_ping": True,
+        }
+
+    if ":memory:" in uri or uri.rstrip("/") == "sqlite:":
+        # In-memory база живёт в одном соединении, пул не нужен
+        return {"connect_args": {"check_same_thread": False}}
+
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "connect_args": {
+            # Соединения переходят между greenlet'ами/потоками пула
+            "check_same_thread": False,
+            # Таймаут драйвера в секундах, дублирует busy_timeout
+            "timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)) / 1000,
+        },
+    }
+
+def configure_db(app):
+    """
+    Заполняет app.config опциями движка и (опционально) read-bind'ом.
+    DATABASE_READ_URL — отдельное соединение/реплика для read-only запросов.
+    """
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", get_engine_options(uri))
+
+    read_url = os.environ.get("DATABASE_READ_URL")
+    if read_url:
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds.setdefault("read", {"url": read_url, **get_engine_options(read_url)})
+        app.config["SQLALCHEMY_BINDS"] = binds
+
+def _register_sqlite_pragmas(engine, pragmas, readonly: bool = False):
+    """
+    Вешает на engine обработчик, выставляющий PRAGMA при каждом новом соединении.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        conn_pragmas = dict(pragmas)
+        if readonly:
+            # journal_mode — свойство файла, его выставляет только писатель
+            conn_pragmas.pop("journal_mode", None)
+            conn_pragmas["query_only"] = "ON"
+        apply_sqlite_pragmas(dbapi_connection, conn_pragmas)
 
 def init_db(app):
     """
     Инициализация БД (SQLAlchemy).
     """
+    configure_db(app)
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        pragmas = get_sqlite_pragmas()
+        _register_sqlite_pragmas(db.engine, pragmas)
+        if "read" in db.engines:
+            _register_sqlite_pragmas(db.engines["read"], pragmas, readonly=True)
+        db.create_all(bind_key=None)
+
+        from models.user import ensure_username_search_index
+        app.config["USERNAME_TRIGRAM_INDEX"] = ensure_username_search_index(db.engine)
+
+@contextmanager
+def read_session():
+    """
+    Сессия для read-only запросов.
+    Если задан DATABASE_READ_URL — отдельное соединение/реплика,
+    иначе обычная db.session.
+    """
+    engine = db.engines.get("read")
+    if engine is None:
+        yield db.session
+        return
+
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
 
 def init_jwt(app):
     """
@@ -41,44 +165,6 @@ def init_socketio(app):
     socketio.init_app(app, cors_allowed_origins="*")
     return socketio
 
-def get_redis_client():
-    """
-    Возвращает подключение к Redis, 
-    при необходимости создаёт новое.
-    """
-    global _redis_client
-    if _redis_client is not None:
-        # Уже есть подключение
-        return _redis_client
-
-    host = os.environ.get("REDIS_HOST", "127.0.0.1")
-    port = int(os.environ.get("REDIS_PORT", "6379"))
-    password = os.environ.get("REDIS_PASSWORD", "")
-    db_ = int(os.environ.get("REDIS_DB", 0))
-    retries = 5
-
-    for attempt in range(1, retries + 1):
-        try:
-            r = redis.Redis(
-                host=host,
-                port=port,
-                db=db_,
-                password=password,
-                decode_responses=True,
-                socket_timeout=5
-            )
-            r.ping()  # проверка соединения
-            print(f"Connected to Redis at {host}:{port} on attempt {attempt}")
-            _redis_client = r
-            return _redis_client
-        except redis.ConnectionError as e:
-            print(f"Failed to connect to Redis on attempt {attempt}: {e}")
-            time.sleep(2)
-
-    print("Failed to connect to Redis after retries.")
-    # Если все 5 попыток упали, остаёмся с None
-    return None
-
 # def init_redis():
 #     global redis_client
 #     host = os.environ.get("REDIS_HOST", "127.0.0.1")
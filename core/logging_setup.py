@@ -1,71 +1,158 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-def setup_logging():
+# Атрибуты LogRecord, которые не считаются пользовательскими полями (extra=...)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
     """
-      1) debug_info.log — пишет уровни ниже WARNING (DEBUG и INFO).
-      2) error_critical.log — пишет уровни ERROR и CRITICAL.
-      3) admin_actions.log — отдельный лог для действий админов (WARNING).
+    Одна запись — одна JSON-строка: ts, level, logger, message,
+    поля из extra=... и traceback, если есть.
     """
-    log_dir = "C:/Project/api/logs"
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
-    # Проверяем существование диска
-    drive = os.path.splitdrive(log_dir)[0]
-    if drive and not os.path.exists(drive):
-        raise FileNotFoundError(f"Drive not found: {drive}")
+class DebugSampler(logging.Filter):
+    """
+    Пропускает только долю rate записей уровня DEBUG (остальные уровни — все).
+    Отброшенная запись не попадает в очередь и не форматируется.
+    """
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
 
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
 
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который при переполненной очереди отбрасывает запись
+    и считает потери, а не блокирует вызывающий поток.
+    """
+    dropped = 0
 
-    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
 
-    # 1) Логер: debug_info (DEBUG + INFO) -----
-    debug_info_handler = RotatingFileHandler(
-        os.path.join(log_dir, 'debug_info.log'),
-        maxBytes=5 * 1024 * 1024,
-        backupCount=3,
+def _level(name: str, default: str) -> int:
+    return logging.getLevelName(os.environ.get(name, default).upper())
+
+def _file_handler(log_dir: str, filename: str, level: int, formatter: logging.Formatter):
+    handler = RotatingFileHandler(
+        os.path.join(log_dir, filename),
+        maxBytes=int(os.environ.get("LOG_MAX_BYTES", 5 * 1024 * 1024)),
+        backupCount=int(os.environ.get("LOG_BACKUP_COUNT", 3)),
         encoding='utf-8'
     )
-    debug_info_handler.setLevel(logging.DEBUG)
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    return handler
+
+def stop_logging():
+    """
+    Останавливает фоновую запись, дописав всё, что осталось в очереди.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def setup_logging():
+    """
+      1) debug_info.log — пишет уровни ниже WARNING (DEBUG и INFO).
+      2) error_critical.log — пишет уровни ERROR и CRITICAL.
+      3) admin_actions.log — отдельный лог для действий админов (WARNING).
+
+    Логгеры только кладут записи в очередь (QueueHandler), а в файлы их пишет
+    фоновый поток QueueListener — запись на диск не задерживает обработку запросов.
+    Настройки: LOG_DIR, LOG_LEVEL, LOG_ADMIN_LEVEL, LOG_FORMAT (text | json),
+    LOG_DEBUG_SAMPLE_RATE (доля сохраняемых DEBUG-записей), LOG_QUEUE_SIZE.
+    """
+    stop_logging()
+
+    log_dir = os.environ.get("LOG_DIR") or os.path.join(os.environ.get("BASE_DIR", os.getcwd()), "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+    # 1) debug_info (DEBUG + INFO)
+    debug_info_handler = _file_handler(log_dir, 'debug_info.log', logging.DEBUG, formatter)
 
     # Фильтр, чтобы отсечь WARNING и выше
     def debug_info_filter(record: logging.LogRecord):
         return record.levelno < logging.WARNING
 
     debug_info_handler.addFilter(debug_info_filter)
-    debug_info_handler.setFormatter(formatter)
-    logger.addHandler(debug_info_handler)
-
-    # 2) Логер: error_critical (ERROR, CRITICAL) -----
-    error_critical_handler = RotatingFileHandler(
-        os.path.join(log_dir, 'error_critical.log'),
-        maxBytes=5 * 1024 * 1024,
-        backupCount=3,
-        encoding='utf-8'
-    )
-    error_critical_handler.setLevel(logging.ERROR)
-    error_critical_handler.setFormatter(formatter)
-    logger.addHandler(error_critical_handler)
 
+    # 2) error_critical (ERROR, CRITICAL)
+    error_critical_handler = _file_handler(log_dir, 'error_critical.log', logging.ERROR, formatter)
+
+    # 3) admin_actions — пишется только записями логгера admin_actions
+    admin_level = _level("LOG_ADMIN_LEVEL", "WARNING")
+    admin_actions_handler = _file_handler(log_dir, 'admin_actions.log', admin_level, formatter)
+    admin_actions_handler.addFilter(lambda record: record.name == "admin_actions")
+    debug_info_handler.addFilter(lambda record: record.name != "admin_actions")
+    error_critical_handler.addFilter(lambda record: record.name != "admin_actions")
+
+    log_queue = queue.Queue(maxsize=int(os.environ.get("LOG_QUEUE_SIZE", 10000)))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", 1.0))))
+
+    logger = logging.getLogger()
+    logger.setLevel(_level("LOG_LEVEL", "DEBUG"))
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
 
-    # 3) Логгер для админских действий (admin_actions)
     admin_logger = logging.getLogger("admin_actions")
-    admin_logger.setLevel(logging.WARNING)
+    admin_logger.setLevel(admin_level)
     admin_logger.propagate = False
+    for handler in list(admin_logger.handlers):
+        if isinstance(handler, QueueHandler):
+            admin_logger.removeHandler(handler)
+    admin_logger.addHandler(queue_handler)
 
-    admin_actions_handler = RotatingFileHandler(
-        os.path.join(log_dir, 'admin_actions.log'),
-        maxBytes=5 * 1024 * 1024,
-        backupCount=3,
-        encoding='utf-8'
+    # respect_handler_level: каждый файл сам отбирает записи по своему уровню
+    global _listener
+    _listener = QueueListener(
+        log_queue,
+        debug_info_handler, error_critical_handler, admin_actions_handler,
+        respect_handler_level=True
     )
-    admin_actions_handler.setLevel(logging.WARNING)
-    admin_actions_handler.setFormatter(formatter)
-
-    admin_logger.addHandler(admin_actions_handler)
+    _listener.start()
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
 
     return logger
@@ -0,0 +1,410 @@
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from functools import wraps
+import redis
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Счётчики живут в обычных dict'ах процесса без блокировок: обработчики
+# выполняются в greenlet'ах eventlet, которые не переключаются посреди
+# одной операции со словарём. Между воркерами метрики складываются через
+# снимки в METRICS_DIR (каждый воркер пишет свой файл <pid>.json).
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # labels tuple -> float
+
+    def inc(self, labels=(), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in list(self.values.items())]
+
+class Gauge(Counter):
+    """
+    Значение на момент снятия; для воркера задаётся функцией collect().
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), collect=None):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+
+    def set(self, labels=(), value: float = 0):
+        self.values[labels] = value
+
+    def snapshot(self):
+        if self.collect is not None:
+            self.values = dict(self.collect())
+        return super().snapshot()
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels tuple -> [counts по корзинам (+Inf последней), sum, count]
+
+    def observe(self, labels, value: float):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def snapshot(self):
+        return [[list(labels), list(counts), total, count]
+                for labels, (counts, total, count) in list(self.values.items())]
+
+def _connected_sockets():
+    from core.socket_manager import connected_users
+    return {(): sum(len(sids) for sids in list(connected_users.values()))}
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by endpoint, method and status",
+                        ("endpoint", "method", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency",
+                         ("endpoint", "method"))
+SOCKET_EVENTS = Counter("socketio_events_total", "Socket.IO events handled", ("event",))
+SOCKET_LATENCY = Histogram("socketio_event_duration_seconds", "Socket.IO handler latency", ("event",))
+REDIS_COMMANDS = Counter("redis_commands_total", "Redis commands sent (pipelined included)", ("command",))
+REDIS_LATENCY = Histogram("redis_command_duration_seconds",
+                          "Redis round trip latency (a pipeline is one round trip)", ("command",))
+CONNECTED_SOCKETS = Gauge("socketio_connected_sockets", "Authenticated Socket.IO connections",
+                          collect=_connected_sockets)
+
+REQUEST_REDIS_ROUND_TRIPS = Histogram("request_redis_round_trips", "Redis round trips per request or event",
+                                      ("endpoint",), buckets=CALL_COUNT_BUCKETS)
+REQUEST_SQL_QUERIES = Histogram("request_sql_queries", "SQL queries per request or event",
+                                ("endpoint",), buckets=CALL_COUNT_BUCKETS)
+N_PLUS_ONE = Counter("n_plus_one_total", "Requests with a repeated identical Redis/SQL call shape",
+                     ("endpoint", "kind"))
+ROOM_REAPER_RECLAIMED = Counter("room_reaper_reclaimed_total",
+                                "Stale memberships, ghost members and rooms cleaned up by the reaper", ("kind",))
+REDIS_TOLERANT_READS = Counter("redis_tolerant_reads_total",
+                               "Lag-tolerant storage reads by where they were served", ("target",))
+TELEGRAM_BRIDGE_MESSAGES = Counter("telegram_bridge_messages_total",
+                                   "Telegram bridge sendMessage calls and dropped lines by result", ("result",))
+
+REGISTRY = [HTTP_REQUESTS, HTTP_LATENCY, SOCKET_EVENTS, SOCKET_LATENCY,
+            REDIS_COMMANDS, REDIS_LATENCY, CONNECTED_SOCKETS,
+            REQUEST_REDIS_ROUND_TRIPS, REQUEST_SQL_QUERIES, N_PLUS_ONE, ROOM_REAPER_RECLAIMED,
+            REDIS_TOLERANT_READS, TELEGRAM_BRIDGE_MESSAGES]
+
+# --- Хуки инструментирования ---
+
+def observe_redis(command: str, seconds: float, commands=None):
+    """
+    Учитывает один round trip в Redis. Для pipeline command = "PIPELINE",
+    а commands — имена команд внутри него.
+    """
+    for name in commands or (command,):
+        REDIS_COMMANDS.inc((name,))
+    REDIS_LATENCY.observe((command,), seconds)
+
+def instrument_event(event: str):
+    """
+    Декоратор обработчика Socket.IO: число вызовов и время обработки.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                SOCKET_EVENTS.inc((event,))
+                SOCKET_LATENCY.observe((event,), time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def init_metrics(app):
+    """
+    Замер времени каждого HTTP-запроса по endpoint'у Blueprint'а.
+    """
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            HTTP_REQUESTS.inc((endpoint, request.method, str(response.status_code)))
+            HTTP_LATENCY.observe((endpoint, request.method), time.perf_counter() - started)
+        return response
+
+# --- Снимки и агрегация между воркерами ---
+
+def _metrics_dir():
+    return os.environ.get("METRICS_DIR") or None
+
+# Счётчики и гистограммы завершившихся воркеров, чьи файлы этот воркер
+# убрал из METRICS_DIR: они переезжают в его снимок (поле "retired"), чтобы
+# суммы не уменьшались и Prometheus не принял это за сброс счётчика.
+_retired = {}  # metric name -> {labels tuple -> значение как в aggregate()}
+
+def take_snapshot() -> dict:
+    return {
+        "pid": os.getpid(),
+        "ts": time.time(),
+        "metrics": {metric.name: metric.snapshot() for metric in REGISTRY},
+        "retired": {name: _rows(values) for name, values in _retired.items()},
+    }
+
+def _rows(values: dict):
+    # Обратное к _merge_rows: {labels: value} -> строки снимка
+    rows = []
+    for labels, value in values.items():
+        if isinstance(value, list):
+            counts, total, count = value
+            rows.append([list(labels), list(counts), total, count])
+        else:
+            rows.append([list(labels), value])
+    return rows
+
+def _merge_rows(merged: dict, rows, kind: str):
+    for row in rows:
+        labels = tuple(row[0])
+        if kind == "histogram":
+            counts, total, count = row[1], row[2], row[3]
+            entry = merged.setdefault(labels, [[0] * len(counts), 0.0, 0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += count
+        else:
+            merged[labels] = merged.get(labels, 0) + row[1]
+
+def write_snapshot():
+    """
+    Сохраняет снимок воркера в METRICS_DIR (атомарно через os.replace).
+    """
+    metrics_dir = _metrics_dir()
+    if not metrics_dir:
+        return
+    os.makedirs(metrics_dir, exist_ok=True)
+    path = os.path.join(metrics_dir, f"{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(take_snapshot(), f)
+    os.replace(tmp_path, path)
+
+def _pid_alive(pid: int) -> bool:
+    if os.name != "posix":
+        # На Windows os.kill завершает процесс — там судим только по возрасту файла
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _retire_dead_snapshots(metrics_dir: str):
+    """
+    Забирает файлы воркеров, которые давно не обновлялись и чей процесс
+    завершился: их счётчики и гистограммы складываются в _retired, сам файл
+    удаляется после записи собственного снимка с этими значениями.
+    """
+    retire_after = float(os.environ.get("METRICS_RETIRE_AFTER", 300))
+    now = time.time()
+    claimed = []
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        try:
+            pid = int(os.path.splitext(os.path.basename(path))[0])
+        except ValueError:
+            continue
+        try:
+            if pid == os.getpid() or now - os.path.getmtime(path) < retire_after or _pid_alive(pid):
+                continue
+            # Переименование отдаёт файл ровно одному воркеру
+            claimed_path = f"{path}.retiring-{os.getpid()}"
+            os.rename(path, claimed_path)
+        except OSError:
+            continue
+        try:
+            with open(claimed_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable metrics snapshot {path}: {e}")
+            claimed.append(claimed_path)
+            continue
+
+        for metric in REGISTRY:
+            if metric.kind == "gauge":
+                continue
+            merged = _retired.setdefault(metric.name, {})
+            _merge_rows(merged, snapshot["metrics"].get(metric.name, []), metric.kind)
+            _merge_rows(merged, snapshot.get("retired", {}).get(metric.name, []), metric.kind)
+        claimed.append(claimed_path)
+        logger.info(f"Retired metrics snapshot of exited worker {pid}")
+    return claimed
+
+def _load_snapshots():
+    metrics_dir = _metrics_dir()
+    if not metrics_dir:
+        return [take_snapshot()]
+
+    os.makedirs(metrics_dir, exist_ok=True)
+    claimed = _retire_dead_snapshots(metrics_dir)
+    write_snapshot()
+    for claimed_path in claimed:
+        try:
+            os.remove(claimed_path)
+        except OSError:
+            pass
+
+    snapshots = []
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable metrics snapshot {path}: {e}")
+    return snapshots
+
+def aggregate(snapshots) -> dict:
+    """
+    Складывает снимки воркеров. Счётчики и гистограммы суммируются по всем
+    файлам (включая завершившиеся воркеры и унаследованные от них значения
+    "retired"), gauge — только по свежим снимкам.
+    """
+    stale_after = float(os.environ.get("METRICS_STALE_AFTER", 60))
+    now = time.time()
+    result = {}
+    for metric in REGISTRY:
+        merged = {}
+        for snapshot in snapshots:
+            if metric.kind == "gauge":
+                if now - snapshot.get("ts", 0) > stale_after:
+                    continue
+            else:
+                _merge_rows(merged, snapshot.get("retired", {}).get(metric.name, []), metric.kind)
+            _merge_rows(merged, snapshot["metrics"].get(metric.name, []), metric.kind)
+        result[metric.name] = merged
+    return result
+
+def start_metrics_flusher(app):
+    """
+    Фоновая запись снимка воркера раз в METRICS_FLUSH_INTERVAL сек.
+    Без METRICS_DIR (один процесс) ничего не запускает.
+    """
+    from core.database import socketio
+
+    interval = int(os.environ.get("METRICS_FLUSH_INTERVAL", 15))
+    if not _metrics_dir() or interval <= 0:
+        return None
+
+    def _loop():
+        while True:
+            socketio.sleep(interval)
+            try:
+                write_snapshot()
+            except OSError as e:
+                logger.error(f"Metrics snapshot failed: {e}")
+
+    return socketio.start_background_task(_loop)
+
+# --- Формат Prometheus ---
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+_room_stats_cache = None  # (expires_at по monotonic, stats)
+
+def _room_stats():
+    # Кэш между скрейпами: несколько Prometheus'ов или частый scrape_interval
+    # не должны каждый раз обходить индексы комнат в хранилище
+    global _room_stats_cache
+    ttl = float(os.environ.get("METRICS_ROOM_STATS_TTL", 15))
+    now = time.monotonic()
+    if _room_stats_cache is not None and _room_stats_cache[0] > now:
+        return _room_stats_cache[1]
+
+    from core.storage import get_storage
+    stats = get_storage().room_stats()
+    if ttl > 0:
+        _room_stats_cache = (now + ttl, stats)
+    return stats
+
+def _room_lines():
+    """
+    Комнаты и ожидающие пользователи — общее состояние хранилища,
+    снимается при запросе (не чаще раза в METRICS_ROOM_STATS_TTL сек),
+    а не складывается по воркерам.
+    """
+    try:
+        stats = _room_stats()
+    except (RuntimeError, redis.RedisError) as e:
+        # Без Redis пропадают только эти gauge, а не весь /metrics
+        logger.warning(f"Room gauges skipped: {e}")
+        return []
+
+    lines = [
+        "# HELP chat_open_rooms Open rooms by room size",
+        "# TYPE chat_open_rooms gauge",
+    ]
+    lines += [f'chat_open_rooms{{room_size="{size}"}} {s["rooms"]}' for size, s in sorted(stats.items())]
+    lines += [
+        "# HELP chat_waiting_users Users in rooms that are not full yet",
+        "# TYPE chat_waiting_users gauge",
+    ]
+    lines += [f'chat_waiting_users{{room_size="{size}"}} {s["waiting_users"]}' for size, s in sorted(stats.items())]
+    return lines
+
+def render_metrics() -> str:
+    """
+    Текст в формате Prometheus (text/plain; version=0.0.4).
+    """
+    merged = aggregate(_load_snapshots())
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in sorted(merged[metric.name].items()):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_format_labels(metric.labelnames, labels)} {_format_value(value)}")
+                continue
+
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                label_str = _format_labels(metric.labelnames, labels, [("le", _format_value(bound))])
+                lines.append(f"{metric.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(metric.labelnames, labels)
+            lines.append(f"{metric.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{metric.name}_count{label_str} {count}")
+
+    lines += _room_lines()
+    return "\n".join(lines) + "\n"
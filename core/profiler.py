@@ -0,0 +1,226 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+import greenlet
+from datetime import datetime, timezone
+from functools import wraps
+from eventlet.patcher import original
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Настоящие модули: после eventlet.monkey_patch() threading и time подменены
+_os_threading = original("threading")
+_os_time = original("time")
+
+# Семплирующий профайлер: один фоновый поток ОС на воркер раз в
+# PROFILER_INTERVAL_MS снимает стеки всех профилируемых сейчас запросов
+# и копит «свёрнутые» стеки (collapsed stacks), которые сразу подходят для
+# flamegraph.pl / speedscope.
+# Под eventlet threading подменён greenlet'ами, и «поток» из него никогда не
+# работает параллельно с обработчиком, поэтому семплер создаётся из
+# оригинального модуля threading (eventlet.patcher.original). Запрос
+# отслеживается по своему greenlet'у: если greenlet сейчас выполняется,
+# берётся текущий кадр потока ОС, если ждёт (I/O, sleep) — его
+# приостановленный стек gr_frame. Получается профиль по реальному времени
+# запроса, и чужие greenlet'ы в него не попадают.
+
+_sample_rate = None   # доля профилируемых запросов, задаётся админом (None — из env)
+_profiles = []        # min-heap (duration, seq, profile) — N самых медленных
+_by_id = {}
+_seq = itertools.count(1)
+
+def get_sample_rate() -> float:
+    if _sample_rate is not None:
+        return _sample_rate
+    return float(os.environ.get("PROFILER_SAMPLE_RATE", 0))
+
+def set_sample_rate(rate: float):
+    """
+    Меняет долю профилируемых запросов в текущем воркере (до перезапуска).
+    """
+    global _sample_rate
+    _sample_rate = rate
+
+def _top_n() -> int:
+    return int(os.environ.get("PROFILER_TOP_N", 20))
+
+def _interval() -> float:
+    return float(os.environ.get("PROFILER_INTERVAL_MS", 5)) / 1000
+
+def _header_requested() -> bool:
+    """
+    Профиль по заголовку X-Profile: его значение должно совпасть с PROFILER_TOKEN.
+    Без PROFILER_TOKEN включение по заголовку выключено.
+    """
+    token = os.environ.get("PROFILER_TOKEN")
+    return bool(token) and request.headers.get("X-Profile") == token
+
+def _should_profile(from_request: bool) -> bool:
+    if from_request and _header_requested():
+        return True
+    rate = get_sample_rate()
+    return rate > 0 and random.random() < rate
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}"
+
+class _Target:
+    """
+    Профилируемый запрос: его стеки и число снимков.
+    """
+    def __init__(self):
+        self.thread_id = _os_threading.get_ident()
+        current = greenlet.getcurrent()
+        # Главный greenlet потока (обычный сервер с потоками) — сам поток
+        self.greenlet = current if current.parent is not None else None
+        self.stacks = {}  # "a;b;c" -> число снимков
+        self.samples = 0
+
+    def frame(self, frames):
+        if self.greenlet is None:
+            return frames.get(self.thread_id)
+        if self.greenlet.dead:
+            return None
+        # gr_frame пуст, пока greenlet выполняется — тогда он и есть текущий кадр потока
+        return self.greenlet.gr_frame or frames.get(self.thread_id)
+
+class StackSampler:
+    """
+    Общий для воркера поток ОС, снимающий стеки зарегистрированных запросов
+    раз в PROFILER_INTERVAL_MS. Без профилируемых запросов он спит на событии.
+    """
+    def __init__(self):
+        self._targets = {}  # id(target) -> _Target
+        self._lock = _os_threading.Lock()
+        self._wakeup = _os_threading.Event()
+        self._thread = _os_threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def add(self, target: _Target):
+        with self._lock:
+            self._targets[id(target)] = target
+        self._wakeup.set()
+
+    def remove(self, target: _Target):
+        # Под локом: после выхода снимок в target.stacks больше не пишется
+        with self._lock:
+            self._targets.pop(id(target), None)
+
+    def _run(self):
+        while True:
+            if not self._targets:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            _os_time.sleep(_interval())
+            with self._lock:
+                frames = sys._current_frames()
+                for target in self._targets.values():
+                    self._sample(target, target.frame(frames))
+
+    @staticmethod
+    def _sample(target: _Target, frame):
+        if frame is None:
+            return
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        stack = ";".join(reversed(names))
+        target.stacks[stack] = target.stacks.get(stack, 0) + 1
+        target.samples += 1
+
+_sampler = None
+
+def _get_sampler() -> StackSampler:
+    # Поток создаётся при первом профилируемом запросе, а не при импорте
+    global _sampler
+    if _sampler is None:
+        _sampler = StackSampler()
+    return _sampler
+
+def _store(kind: str, name: str, started: float, target: _Target):
+    duration = time.perf_counter() - started
+    _get_sampler().remove(target)
+    profile = {
+        "id": next(_seq),
+        "kind": kind,
+        "name": name,
+        "duration_ms": round(duration * 1000, 3),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "samples": target.samples,
+        "stacks": target.stacks,
+    }
+    heapq.heappush(_profiles, (duration, profile["id"], profile))
+    _by_id[profile["id"]] = profile
+    while len(_profiles) > _top_n():
+        _, dropped_id, _ = heapq.heappop(_profiles)
+        _by_id.pop(dropped_id, None)
+    logger.debug(f"Profiled {kind} {name}: {profile['duration_ms']} ms, {target.samples} samples")
+
+def _start_sampler() -> _Target:
+    target = _Target()
+    _get_sampler().add(target)
+    return target
+
+def init_profiler(app):
+    """
+    Профилирование HTTP-запросов: по доле PROFILER_SAMPLE_RATE или заголовку X-Profile.
+    """
+    @app.before_request
+    def _start_profile():
+        if _should_profile(from_request=True):
+            g.profile = (time.perf_counter(), _start_sampler())
+
+    @app.teardown_request
+    def _finish_profile(exc=None):
+        started_sampler = g.pop("profile", None)
+        if started_sampler is not None:
+            started, target = started_sampler
+            _store("http", f"{request.method} {request.endpoint or request.path}", started, target)
+
+def profile_event(event: str):
+    """
+    Декоратор обработчика Socket.IO: профилирует долю PROFILER_SAMPLE_RATE вызовов.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            if not _should_profile(from_request=False):
+                return handler(*args, **kwargs)
+            started, target = time.perf_counter(), _start_sampler()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                _store("socket", event, started, target)
+        return wrapper
+    return decorator
+
+def list_profiles():
+    """
+    Сохранённые профили без стеков, от самого медленного.
+    """
+    profiles = sorted((p for _, _, p in _profiles), key=lambda p: p["duration_ms"], reverse=True)
+    return [{k: v for k, v in p.items() if k != "stacks"} for p in profiles]
+
+def get_collapsed_stacks(profile_id: int):
+    """
+    Профиль в формате collapsed stacks ("a;b;c N" на строку) или None.
+    """
+    profile = _by_id.get(profile_id)
+    if profile is None:
+        return None
+    lines = [f"{stack} {count}" for stack, count in
+             sorted(profile["stacks"].items(), key=lambda item: item[1], reverse=True)]
+    return "\n".join(lines) + "\n"
+
+def clear_profiles():
+    _profiles.clear()
+    _by_id.clear()
@@ -0,0 +1,461 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.client import Pipeline
+from redis.cluster import ClusterNode, ClusterPipeline, RedisCluster
+from redis.exceptions import ClusterDownError
+from redis.retry import Retry
+from core.metrics import observe_redis
+from core.call_accounting import account_redis, pipeline_shape, redis_shape
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, которые считаем признаком недоступности Redis (а не ошибкой команды)
+_CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError, ClusterDownError)
+
+class RedisUnavailableError(RuntimeError):
+    """
+    Redis недоступен: автомат разомкнут, команда не отправлялась.
+    Наследуется от RuntimeError, чтобы существующие обработчики его ловили.
+    """
+
+class CircuitBreaker:
+    """
+    Автомат для Redis.
+      closed — команды идут как обычно, считаем подряд идущие ошибки соединения;
+      open   — после failure_threshold ошибок команды сразу падают с
+               RedisUnavailableError, а фоновый поток пингует Redis с
+               экспоненциальной задержкой (до backoff_cap) и замыкает автомат,
+               как только ответ получен.
+    """
+    def __init__(self, failure_threshold: int, backoff_base: float, backoff_cap: float):
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_total = 0
+        self.rejected_total = 0
+        self.reconnect_attempts = 0
+        self.opened_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._probe = None
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        self.rejected_total += 1
+        return False
+
+    def record_success(self):
+        if self.consecutive_failures:
+            self.consecutive_failures = 0
+
+    def record_failure(self, error: Exception, probe):
+        """
+        probe — функция без аргументов, проверяющая соединение (ping).
+        """
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = repr(error)
+            if self.state == "open" or self.consecutive_failures < self.failure_threshold:
+                return
+            self.state = "open"
+            self.opened_at = time.time()
+            self.opened_total += 1
+            logger.error(f"Redis circuit opened after {self.consecutive_failures} failures: {error}")
+            self._probe = threading.Thread(target=self._reconnect_loop, args=(probe,), daemon=True)
+            self._probe.start()
+
+    def _reconnect_loop(self, probe):
+        delay = self.backoff_base
+        while True:
+            time.sleep(delay)
+            self.reconnect_attempts += 1
+            try:
+                probe()
+            except Exception as e:
+                self.last_error = repr(e)
+                delay = min(delay * 2, self.backoff_cap)
+                continue
+
+            with self._lock:
+                self.state = "closed"
+                self.consecutive_failures = 0
+                logger.warning(f"Redis circuit closed after {time.time() - self.opened_at:.1f}s")
+            return
+
+    def metrics(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_total": self.opened_total,
+            "rejected_total": self.rejected_total,
+            "reconnect_attempts": self.reconnect_attempts,
+            "opened_at": self.opened_at,
+            "last_error": self.last_error,
+        }
+
+class _BreakerPipelineMixin:
+    """
+    Pipeline, который учитывает результат execute() в автомате.
+    """
+    def _stack_args(self):
+        raise NotImplementedError
+
+    def execute(self, raise_on_error=True):
+        breaker = self.breaker
+        if not breaker.allow():
+            self.reset()
+            raise RedisUnavailableError("Redis is unavailable (circuit open)")
+        stack_args = self._stack_args()
+        commands = [str(args[0]).upper() for args in stack_args]
+        started = time.perf_counter()
+        try:
+            result = super().execute(raise_on_error=raise_on_error)
+        except _CONNECTION_ERRORS as e:
+            breaker.record_failure(e, self.probe)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            observe_redis("PIPELINE", elapsed, commands)
+            account_redis(pipeline_shape(stack_args), elapsed, len(commands))
+        breaker.record_success()
+        return result
+
+class BreakerPipeline(_BreakerPipelineMixin, Pipeline):
+    def _stack_args(self):
+        return [args for args, _ in self.command_stack]
+
+class BreakerClusterPipeline(_BreakerPipelineMixin, ClusterPipeline):
+    """
+    Pipeline кластера: команды группируются по узлам слотов, транзакций нет.
+    """
+    def _stack_args(self):
+        return [command.args for command in self.command_stack]
+
+class _BreakerClientMixin:
+    """
+    Клиент Redis с автоматом: пока Redis недоступен, команды не ждут
+    таймаутов, а сразу падают с RedisUnavailableError.
+    """
+    breaker: CircuitBreaker = None
+
+    def _probe(self):
+        # Пинг в обход автомата — используется фоновым переподключением
+        super().execute_command("PING")
+
+    def execute_command(self, *args, **options):
+        breaker = self.breaker
+        if not breaker.allow():
+            raise RedisUnavailableError("Redis is unavailable (circuit open)")
+        started = time.perf_counter()
+        try:
+            result = super().execute_command(*args, **options)
+        except _CONNECTION_ERRORS as e:
+            breaker.record_failure(e, self._probe)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            observe_redis(str(args[0]).upper(), elapsed)
+            account_redis(redis_shape(args), elapsed)
+        breaker.record_success()
+        return result
+
+class BreakerRedis(_BreakerClientMixin, redis.Redis):
+    """
+    Одиночный Redis поверх общего BlockingConnectionPool.
+    """
+    def pipeline(self, transaction=True, shard_hint=None) -> "BreakerPipeline":
+        pipe = BreakerPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+        pipe.breaker = self.breaker
+        pipe.probe = self._probe
+        return pipe
+
+class BreakerRedisCluster(_BreakerClientMixin, RedisCluster):
+    """
+    Redis Cluster (REDIS_MODE=cluster): пул на каждый узел, команды
+    маршрутизируются по слоту ключа. MULTI/WATCH через слоты недоступны —
+    хранилище обходится Lua-скриптами в пределах одного hash tag.
+    """
+    def pipeline(self, transaction=None, shard_hint=None) -> "BreakerClusterPipeline":
+        if transaction:
+            raise redis.RedisError("Transactions are not supported in cluster mode")
+        pipe = BreakerClusterPipeline(
+            nodes_manager=self.nodes_manager,
+            commands_parser=self.commands_parser,
+            startup_nodes=self.nodes_manager.startup_nodes,
+            result_callbacks=self.result_callbacks,
+            cluster_response_callbacks=self.cluster_response_callbacks,
+            cluster_error_retry_attempts=self.cluster_error_retry_attempts,
+            read_from_replicas=self.read_from_replicas,
+            reinitialize_steps=self.reinitialize_steps,
+            lock=self._lock,
+        )
+        pipe.breaker = self.breaker
+        pipe.probe = self._probe
+        return pipe
+
+def is_cluster_client(client) -> bool:
+    return isinstance(client, RedisCluster)
+
+_redis_client = None
+_client_lock = threading.Lock()
+
+def is_cluster_mode() -> bool:
+    return os.environ.get("REDIS_MODE", "standalone").lower() == "cluster"
+
+def _cluster_nodes():
+    """
+    Стартовые узлы из REDIS_CLUSTER_NODES ("host:port,host:port"),
+    по умолчанию — REDIS_HOST:REDIS_PORT.
+    """
+    raw = os.environ.get("REDIS_CLUSTER_NODES") or \
+        f"{os.environ.get('REDIS_HOST', '127.0.0.1')}:{os.environ.get('REDIS_PORT', '6379')}"
+    nodes = []
+    for item in raw.split(","):
+        host, _, port = item.strip().rpartition(":")
+        nodes.append(ClusterNode(host, int(port)))
+    return nodes
+
+def _create_client(decode_responses: bool = True, replica: bool = False, db: int = None):
+    """
+    Собирает пул и клиента из переменных окружения. REDIS_MODE:
+    standalone (по умолчанию) — один сервер, cluster — Redis Cluster.
+    replica=True — клиент реплики REDIS_REPLICA_HOST (только standalone).
+    db — другая база вместо REDIS_DB (только standalone).
+    """
+    # Короткий повтор внутри redis-py — на случай «протухшего» соединения
+    # из пула; долгие ожидания заменены автоматом и фоновым переподключением.
+    retry = Retry(
+        ExponentialBackoff(cap=0.2, base=0.05),
+        int(os.environ.get("REDIS_COMMAND_RETRIES", 1))
+    )
+    connection_kwargs = dict(
+        password=os.environ.get("REDIS_PASSWORD") or None,
+        decode_responses=decode_responses,
+        max_connections=int(os.environ.get("REDIS_MAX_CONNECTIONS", 50)),
+        socket_timeout=float(os.environ.get("REDIS_SOCKET_TIMEOUT", 5)),
+        socket_connect_timeout=float(os.environ.get("REDIS_CONNECT_TIMEOUT", 2)),
+        socket_keepalive=True,
+        health_check_interval=int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+        retry=retry,
+    )
+
+    if not replica and is_cluster_mode():
+        # Пул на каждый узел; в кластере есть только db 0
+        nodes = _cluster_nodes()
+        client = BreakerRedisCluster(startup_nodes=nodes, **connection_kwargs)
+        description = f"cluster via {', '.join(node.name for node in nodes)}"
+    else:
+        host_var = "REDIS_REPLICA_HOST" if replica else "REDIS_HOST"
+        port = os.environ.get("REDIS_REPLICA_PORT") if replica else None
+        pool = redis.BlockingConnectionPool(
+            host=os.environ.get(host_var, "127.0.0.1"),
+            port=int(port or os.environ.get("REDIS_PORT", "6379")),
+            db=int(os.environ.get("REDIS_DB", 0)) if db is None else db,
+            timeout=float(os.environ.get("REDIS_POOL_TIMEOUT", 2)),  # ожидание свободного соединения
+            **connection_kwargs,
+        )
+        client = BreakerRedis(connection_pool=pool)
+        description = f"{pool.connection_kwargs['host']}:{pool.connection_kwargs['port']}"
+
+    client.breaker = CircuitBreaker(
+        failure_threshold=int(os.environ.get("REDIS_BREAKER_THRESHOLD", 3)),
+        backoff_base=float(os.environ.get("REDIS_BACKOFF_BASE", 0.5)),
+        backoff_cap=float(os.environ.get("REDIS_BACKOFF_CAP", 30)),
+    )
+    logger.info(f"Redis {'replica ' if replica else ''}pool created for {description}")
+    return client
+
+def create_binary_client():
+    """
+    Отдельный клиент без декодирования ответов (для DUMP/RESTORE в
+    служебных командах). Общий пул приложения не трогает.
+    """
+    return _create_client(decode_responses=False)
+
+def create_scratch_client(db: int):
+    """
+    Отдельный клиент на другую базу того же сервера (служебные проверки,
+    см. storage-conformance). Общий пул приложения не трогает.
+    """
+    return _create_client(db=db)
+
+def get_redis_client():
+    """
+    Возвращает клиента Redis поверх общего пула.
+    Пока автомат разомкнут, сразу возвращает None — вызывающий код
+    уже умеет обрабатывать недоступность Redis.
+    """
+    global _redis_client
+    if _redis_client is None:
+        with _client_lock:
+            if _redis_client is None:
+                _redis_client = _create_client()
+
+    if _redis_client.breaker.state != "closed":
+        _redis_client.breaker.rejected_total += 1
+        return None
+    return _redis_client
+
+# --- Реплика для чтений, допускающих отставание ---
+
+REPLICA_HEARTBEAT_KEY = "replica:heartbeat"
+
+class ReplicaMonitor:
+    """
+    Следит за отставанием реплики. Каждую проверку воркер читает с реплики
+    счётчик REPLICA_HEARTBEAT_KEY, затем делает INCR на мастере и запоминает,
+    когда получил какое значение. Если реплика уже видит значение, полученное
+    на мастере в момент t, её данные не старее t: отставание оценивается
+    сверху как now - t (не меньше интервала проверок). Счётчик, а не время,
+    — чтобы не зависеть от расхождения часов между серверами.
+    """
+    def __init__(self, client, max_lag: float, check_interval: float):
+        self.client = client
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.samples = deque(maxlen=int(max_lag / check_interval) + 2)  # (значение, monotonic)
+        self.lag = None
+        self.checked_at = None
+        self.last_error = None
+
+    def check(self, primary):
+        now = time.monotonic()
+        self.checked_at = now
+        try:
+            seen = int(self.client.get(REPLICA_HEARTBEAT_KEY) or 0)
+            beat = primary.incr(REPLICA_HEARTBEAT_KEY)
+        except (redis.RedisError, RedisUnavailableError) as e:
+            self.lag = None
+            self.last_error = repr(e)
+            return
+
+        lag = None
+        for value, observed_at in reversed(self.samples):
+            if value <= seen:
+                lag = now - observed_at
+                break
+        self.samples.append((beat, now))
+        self.lag = lag
+
+    def healthy(self) -> bool:
+        if self.lag is None or self.lag > self.max_lag or self.client.breaker.state != "closed":
+            return False
+        # Монитор остановился — последней оценке больше не верим
+        return time.monotonic() - self.checked_at <= self.check_interval * 3
+
+    def metrics(self) -> dict:
+        return {
+            "healthy": self.healthy(),
+            "lag_s": None if self.lag is None else round(self.lag, 3),
+            "max_lag_s": self.max_lag,
+            "last_error": self.last_error,
+            "breaker": self.client.breaker.metrics(),
+        }
+
+_replica_monitor = None
+
+def _get_replica_monitor():
+    global _replica_monitor
+    if _replica_monitor is None:
+        if not os.environ.get("REDIS_REPLICA_HOST") or is_cluster_mode():
+            return None
+        with _client_lock:
+            if _replica_monitor is None:
+                _replica_monitor = ReplicaMonitor(
+                    _create_client(replica=True),
+                    max_lag=float(os.environ.get("REDIS_REPLICA_MAX_LAG", 2)),
+                    check_interval=float(os.environ.get("REDIS_REPLICA_CHECK_INTERVAL", 0.5)),
+                )
+    return _replica_monitor
+
+def get_redis_replica():
+    """
+    Клиент реплики для чтений, допускающих отставание, или None — тогда
+    читать из мастера: реплика не задана (REDIS_REPLICA_HOST), недоступна,
+    отстаёт больше REDIS_REPLICA_MAX_LAG или монитор не запущен.
+    """
+    monitor = _replica_monitor
+    if monitor is None or not monitor.healthy():
+        return None
+    return monitor.client
+
+def start_replica_monitor(app):
+    """
+    Фоновая проверка отставания реплики раз в REDIS_REPLICA_CHECK_INTERVAL сек.
+    Без REDIS_REPLICA_HOST (или в режиме кластера) ничего не запускает.
+    """
+    from core.database import socketio
+
+    monitor = _get_replica_monitor()
+    if monitor is None:
+        return None
+    if monitor.max_lag <= monitor.check_interval:
+        logger.warning("REDIS_REPLICA_MAX_LAG must exceed REDIS_REPLICA_CHECK_INTERVAL, "
+                       "otherwise reads never go to the replica")
+
+    def _loop():
+        while True:
+            primary = get_redis_client()
+            if primary is None:
+                monitor.lag = None
+            else:
+                monitor.check(primary)
+            socketio.sleep(monitor.check_interval)
+
+    return socketio.start_background_task(_loop)
+
+def _pool_metrics(pool) -> dict:
+    if isinstance(pool, redis.BlockingConnectionPool):
+        created = len(pool._connections)
+        available = sum(1 for conn in pool.pool.queue if conn is not None)
+    else:
+        # Обычный ConnectionPool — так redis-py создаёт пулы узлов кластера
+        created = pool._created_connections
+        available = len(pool._available_connections)
+    return {
+        "max_connections": pool.max_connections,
+        "created": created,
+        "available": available,
+        "in_use": created - available,
+    }
+
+def get_redis_metrics() -> dict:
+    """
+    Состояние пула соединений и автомата. В кластере pool — сумма по
+    узлам, nodes — пулы отдельных узлов; replica — отставание и автомат
+    реплики (если задан REDIS_REPLICA_HOST).
+    """
+    if _redis_client is None:
+        return {"mode": None, "pool": None, "breaker": None}
+
+    if not is_cluster_client(_redis_client):
+        return {
+            "mode": "standalone",
+            "pool": _pool_metrics(_redis_client.connection_pool),
+            "breaker": _redis_client.breaker.metrics(),
+            "replica": _replica_monitor.metrics() if _replica_monitor else None,
+        }
+
+    nodes = {}
+    for node in _redis_client.get_nodes():
+        if node.redis_connection is not None:
+            nodes[node.name] = dict(_pool_metrics(node.redis_connection.connection_pool),
+                                    server_type=node.server_type)
+    totals = {key: sum(node[key] for node in nodes.values())
+              for key in ("max_connections", "created", "available", "in_use")}
+    return {
+        "mode": "cluster",
+        "pool": totals,
+        "nodes": nodes,
+        "breaker": _redis_client.breaker.metrics(),
+    }
@@ -0,0 +1,25 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# События комнат внутри процесса: то, что уже разослано по сокетам комнаты,
+# получают и подписчики (мост в Telegram). Подписчик вызывается прямо в
+# обработчике запроса или события, поэтому должен только поставить событие
+# в свою очередь. Каждый воркер видит только свои события.
+_subscribers = []
+
+def subscribe(callback):
+    """callback(room_id, event, data, sender_id) — sender_id None для системных событий."""
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+
+def unsubscribe(callback):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+def publish(room_id: str, event: str, data: dict, sender_id: int = None):
+    for callback in list(_subscribers):
+        try:
+            callback(room_id, event, data, sender_id)
+        except Exception as e:
+            logger.exception("Room event subscriber failed on %s in %s: %s", event, room_id, e)
@@ -1,16 +1,104 @@
 import logging
+import os
+import time
 from flask import request
-from flask_socketio import emit, join_room
+from flask_socketio import emit, join_room, ConnectionRefusedError
 from datetime import datetime, timezone
 from flask_jwt_extended import decode_token
 from flask_jwt_extended.exceptions import JWTExtendedException
-from .database import socketio, get_redis_client
+from marshmallow import ValidationError
+from .database import socketio
+from .metrics import instrument_event
+from .profiler import profile_event
+from .call_accounting import account_event
+from .room_events import publish as publish_room_event
+from .storage import get_storage
 from models.user import User
+from schemas.room_schemas import NOTIFICATION_CURSOR
 
-connected_users = {}  # user_id -> sid
+# У пользователя может быть несколько подключений (вкладки, устройства).
+# Каждый сокет при подключении входит в Socket.IO-комнату user_room(user_id),
+# через неё событие доходит до всех подключений пользователя сразу.
+# Реестр подключений — в памяти воркера, а message_queue у Socket.IO нет:
+# лимит подключений и disconnect_users рассчитаны на один воркер.
+connected_users = {}  # user_id -> set(sid) в этом воркере
+_sid_users = {}       # sid -> user_id
+_last_touch = {}      # user_id -> time.monotonic() последней записи seen_at этим воркером
 logger = logging.getLogger(__name__)
 
+def user_room(user_id) -> str:
+    """Socket.IO-комната всех подключений пользователя."""
+    return f"user:{int(user_id)}"
+
+def _max_connections() -> int:
+    # подключений одного пользователя на воркер, 0 — без ограничения;
+    # при нескольких воркерах фактический предел — лимит на их число
+    return int(os.environ.get("SOCKET_MAX_CONNECTIONS_PER_USER", 5))
+
+def _register_sid(user_id: int, sid: str):
+    connected_users.setdefault(user_id, set()).add(sid)
+    _sid_users[sid] = user_id
+
+def _unregister_sid(sid: str):
+    """Убирает подключение; возвращает (user_id, осталось_подключений) или (None, 0)."""
+    user_id = _sid_users.pop(sid, None)
+    if user_id is None:
+        return None, 0
+    sids = connected_users.get(user_id, set())
+    sids.discard(sid)
+    if not sids:
+        connected_users.pop(user_id, None)
+        _last_touch.pop(user_id, None)
+    return user_id, len(sids)
+
+def _current_user_id():
+    return _sid_users.get(request.sid)
+
+def disconnect_users(user_ids, reason: str):
+    """
+    Закрывает все подключения пользователей в этом воркере: сначала событие
+    session_terminated в их user_room, затем отключение каждого сокета.
+    Подключения к другим воркерам не закрываются — без message_queue
+    Socket.IO блокировка полностью работает только с одним воркером.
+    Возвращает число закрытых подключений.
+    """
+    closed = 0
+    for user_id in {int(uid) for uid in user_ids}:
+        sids = list(connected_users.get(user_id, ()))
+        if not sids:
+            continue
+        socketio.emit('session_terminated', {"reason": reason}, to=user_room(user_id))
+        for sid in sids:
+            _unregister_sid(sid)
+            socketio.server.disconnect(sid, namespace='/')
+        closed += len(sids)
+        logger.info("Closed %d connections of user %s (%s)", len(sids), user_id, reason)
+    return closed
+
+def disconnect_user(user_id, reason: str) -> int:
+    return disconnect_users([user_id], reason)
+
+def touch_membership(user_id):
+    """
+    Продлевает живость участника комнаты (seen_at). Пишет в хранилище не чаще
+    MEMBERSHIP_TOUCH_INTERVAL сек на пользователя, чтобы поток сообщений
+    не превращался в поток HSET.
+    """
+    now = time.monotonic()
+    interval = float(os.environ.get("MEMBERSHIP_TOUCH_INTERVAL", 30))
+    if now - _last_touch.get(user_id, float("-inf")) < interval:
+        return
+    _last_touch[user_id] = now
+    try:
+        get_storage().touch_membership(user_id, time.time())
+    except RuntimeError:
+        _last_touch.pop(user_id, None)
+        logger.error("Storage is unavailable on membership touch")
+
 @socketio.on('connect')
+@instrument_event('connect')
+@profile_event('connect')
+@account_event('connect')
 def handle_connect():
     token = request.args.get('token')
     if not token:
@@ -28,46 +116,82 @@ def handle_connect():
             logger.debug("User not found in DB -> reject")
             return False
 
-        connected_users[user_id] = request.sid
-        # --- ДОБАВКА: смотрим, в какой room_id числится пользователь в Redis ---
-        r = get_redis_client()
-        room_id = r.hget(f"user:{user.id}", "room")  # например, "room:3:12345"
+        limit = _max_connections()
+        if limit and len(connected_users.get(user.id, ())) >= limit:
+            logger.info("User %s exceeded %d connections -> reject (sid=%s)", user.id, limit, request.sid)
+            raise ConnectionRefusedError("Too many connections")
+
+        # --- ДОБАВКА: смотрим, в какой room_id числится пользователь в хранилище ---
+        storage = get_storage()
+        try:
+            if storage.is_blocked(user.id):
+                logger.debug("Blocked user %s tried to connect -> reject", user.id)
+                return False
+            room_id = storage.get_user_room(user.id)  # например, "room:3:12345"
+        except RuntimeError:
+            logger.error("Storage is unavailable on Socket.IO connect -> reject")
+            return False
+        _register_sid(user.id, request.sid)
+        join_room(user_room(user.id))
         if room_id:
             join_room(room_id)  # <-- теперь этот сокет реально зашёл в room_id
-            logger.info(f"User {user_id} joined Socket.IO room {room_id} (sid={request.sid})")
+            logger.info("User %s joined Socket.IO room %s (sid=%s)", user_id, room_id, request.sid)
+            if len(connected_users[user.id]) == 1:
+                _last_touch.pop(user.id, None)
+            touch_membership(user.id)
+            replay_notifications(room_id, request.args.get('notifications_after'))
 
-        logger.info(f"User {user.login} connected via SocketIO (sid={request.sid})")
+        logger.info("User %s connected via SocketIO (sid=%s, connections=%d)",
+                    user.login, request.sid, len(connected_users[user.id]))
         return True
 
     except JWTExtendedException:
         logger.error("Invalid token on Socket.IO connect")
         return False
     
+def replay_notifications(room_id: str, after_id: str):
+    """
+    Досылает подключившемуся сокету уведомления, пропущенные с курсора
+    ?notifications_after=<id> (не больше NOTIFICATIONS_REPLAY_LIMIT).
+    Без курсора ничего не шлёт: начальное состояние клиент берёт из /session.
+    """
+    if not after_id:
+        return
+    try:
+        NOTIFICATION_CURSOR(after_id)
+    except ValidationError:
+        logger.debug("Invalid notifications_after on connect: %s", after_id)
+        return
+
+    limit = int(os.environ.get("NOTIFICATIONS_REPLAY_LIMIT", 50))
+    try:
+        missed = get_storage().get_notifications(room_id, after_id, limit)
+    except RuntimeError:
+        logger.error("Storage is unavailable on notifications replay")
+        return
+    for notification in missed:
+        emit('notification', notification)
+    if missed:
+        logger.debug("Replayed %d notifications for room %s (sid=%s)", len(missed), room_id, request.sid)
+
 @socketio.on('disconnect')
+@instrument_event('disconnect')
+@profile_event('disconnect')
+@account_event('disconnect')
 def handle_disconnect():
     sid = request.sid
-    user_id_to_remove = None
-
-    for uid, stored_sid in list(connected_users.items()):
-        if stored_sid == sid:
-            user_id_to_remove = uid
-            break
-
-    if user_id_to_remove:
-        del connected_users[user_id_to_remove]
-        logger.info(f"Socket disconnected (sid={sid}), user_id={user_id_to_remove}")
+    user_id, remaining = _unregister_sid(sid)
+    if user_id is not None:
+        logger.info("Socket disconnected (sid=%s), user_id=%s, connections left=%s", sid, user_id, remaining)
 
 @socketio.on('send_message')
+@instrument_event('send_message')
+@profile_event('send_message')
+@account_event('send_message')
 def handle_send_message(data):
     logger.debug("SocketIO send_message event")
 
-    sid = request.sid
-    user_id = None
-    for uid, stored_sid in connected_users.items():
-        if stored_sid == sid:
-            user_id = uid
-            break
-
+    user_id = _current_user_id()
     if user_id is None:
         logger.error("User not authenticated in send_message")
         emit('error', {"error": "Not authenticated"})
@@ -79,13 +203,14 @@ def handle_send_message(data):
         emit('error', {"error": "User not found"})
         return
     
-    r = get_redis_client()
-    if r is None:
-        logger.error("Cannot connect to Redis in send_message")
+    storage = get_storage()
+    try:
+        room_id = storage.get_user_room(user.id)
+    except RuntimeError:
+        logger.error("Storage is unavailable in send_message")
         emit('error', {"error": "Internal server error"})
         return
-    
-    room_id = r.hget(f"user:{user.id}", "room")
+
     if not room_id:
         logger.error("User tried to send message without being in a room")
         emit('error', {"error": "You are not in a room"})
@@ -97,8 +222,34 @@ def handle_send_message(data):
         emit('error', {"error": "No valid message provided"})
         return
 
+    touch_membership(user.id)
     timestamp = datetime.now(timezone.utc).isoformat()
-    r.rpush(f"{room_id}:messages", f"{user.username}:{message}:{timestamp}")
+    storage.append_message(room_id, f"{user.username}:{message}:{timestamp}")
+
+    # Самое частое событие: DEBUG попадает под LOG_DEBUG_SAMPLE_RATE,
+    # а ленивые аргументы не форматируются, если запись отброшена
+    logger.debug("User %s sent message to room %s", user.login, room_id)
+    payload = {"user_id": user.username, "message": message, "timestamp": timestamp}
+    emit('new_message', payload, room=room_id)
+    publish_room_event(room_id, 'new_message', payload, sender_id=user.id)
 
-    logger.info(f"User {user.login} sent message to room {room_id}")
-    emit('new_message', {"user_id": user.username, "message": message, "timestamp": timestamp}, room=room_id)
+@socketio.on('heartbeat')
+@instrument_event('heartbeat')
+@account_event('heartbeat')
+def handle_heartbeat():
+    """
+    Клиент шлёт heartbeat чаще MEMBERSHIP_TTL, пока держит комнату открытой
+    без сообщений. Ответ (ack) — текущая комната или None.
+    """
+    user_id = _current_user_id()
+    if user_id is None:
+        return {"room_id": None}
+
+    try:
+        room_id = get_storage().get_user_room(user_id)
+    except RuntimeError:
+        logger.error("Storage is unavailable in heartbeat")
+        return {"room_id": None}
+    if room_id:
+        touch_membership(user_id)
+    return {"room_id": room_id}
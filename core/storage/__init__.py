@@ -0,0 +1,36 @@
+import os
+from core.storage.base import ChatStorage
+from core.storage.redis_storage import RedisStorage
+from core.storage.memory_storage import MemoryStorage
+
+STORAGE_BACKENDS = {
+    "redis": RedisStorage,
+    "memory": MemoryStorage,
+}
+
+_storage = None
+
+def create_storage(backend: str = None) -> ChatStorage:
+    """
+    Создаёт хранилище по имени (STORAGE_BACKEND: redis | memory).
+    """
+    backend = (backend or os.environ.get("STORAGE_BACKEND", "redis")).lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return STORAGE_BACKENDS[backend]()
+
+def get_storage() -> ChatStorage:
+    """
+    Возвращает общее для процесса хранилище, создаёт при первом обращении.
+    """
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+def set_storage(storage: ChatStorage):
+    """
+    Подменяет хранилище процесса (бенчмарки, нагрузочные прогоны).
+    """
+    global _storage
+    _storage = storage
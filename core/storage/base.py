@@ -0,0 +1,254 @@
+def notification_id_after(after_id: str):
+    """
+    Первый возможный ID уведомления после after_id ("<ms>-<seq>" или "0"),
+    для включительных диапазонов вроде XRANGE.
+    """
+    ms, _, seq = str(after_id).partition("-")
+    return f"{int(ms)}-{int(seq or 0) + 1}"
+
+# Допустимые размеры комнат (JoinRoomSchema); по ним читается room_stats
+ROOM_SIZES = range(2, 11)
+
+# Рейтинг нарушителей с экспоненциальным затуханием (forward decay): жалоба
+# в момент now добавляет цели 2^((now - эпоха) / half_life), текущий вес —
+# сумма, делённая на тот же множитель для "сейчас". Эпоха хранится вместе с
+# рейтингом: как только показатель дорастает до DECAY_RESCALE_AT, все веса
+# делятся на 2^k, а эпоха сдвигается на k периодов полураспада. Так числа
+# остаются в пределах double при любом half_life и сколько угодно долго.
+DECAY_RESCALE_AT = 64
+
+class ChatStorage:
+    """
+    Интерфейс хранилища состояния чата: комнаты, сообщения, уведомления,
+    жалобы и блокировки. Сервисы работают только через него и не знают,
+    где лежат данные (Redis или память процесса).
+
+    Идентификаторы пользователей и жалоб — int, комнат — str ("room:3:123456").
+    Ошибки недоступности хранилища — RuntimeError (см. RedisUnavailableError).
+
+    stale_ok=True у методов чтения разрешает ответ с небольшим отставанием
+    (реплика Redis, см. REDIS_REPLICA_HOST). Его передают только там, где
+    не читают только что записанное.
+    """
+
+    # --- Комнаты и участники ---
+
+    def get_user_room(self, user_id: int):
+        """ID комнаты, в которой находится пользователь, или None."""
+        raise NotImplementedError
+
+    def get_membership(self, user_id: int):
+        """
+        {"room": room_id, "joined_at": iso-строка, "seen_at": unix-время последней
+        активности или None} или None, если пользователь не в комнате.
+        """
+        raise NotImplementedError
+
+    def get_room_info(self, room_id: str):
+        """{"max_users": int, "current_users": int} или None, если комнаты нет."""
+        raise NotImplementedError
+
+    def get_room_members(self, room_id: str, stale_ok: bool = False):
+        """ID участников комнаты (порядок не определён); пустой список, если комнаты нет."""
+        raise NotImplementedError
+
+    def join_room(self, user_id: int, room_size: int, joined_at: str):
+        """
+        Сажает пользователя в первую неполную комнату размера room_size
+        или создаёт новую (seen_at участника — текущее время).
+        Возвращает (room_id, created: bool).
+        Проверку «уже в комнате» делает вызывающий код.
+        """
+        raise NotImplementedError
+
+    def touch_membership(self, user_id: int, seen_at: float):
+        """
+        Отмечает активность участника (heartbeat). Вызывается только для тех,
+        кто в комнате; лишняя отметка без комнаты убирается сборщиком.
+        """
+        raise NotImplementedError
+
+    def leave_room(self, user_id: int):
+        """
+        Выводит пользователя из комнаты; пустая комната удаляется целиком.
+        Возвращает (room_id, room_deleted: bool) или (None, False), если он не был в комнате.
+        """
+        raise NotImplementedError
+
+    def room_stats(self):
+        """
+        {room_size: {"rooms": число комнат, "waiting_users": участники неполных комнат}}
+        по каждому размеру из ROOM_SIZES, включая пустые.
+        """
+        raise NotImplementedError
+
+    def leave_rooms(self, user_ids):
+        """
+        Массовый выход. Возвращает ({user_id: room_id} для тех, кто был в комнате,
+        множество удалённых комнат).
+        """
+        raise NotImplementedError
+
+    # --- Сборщик мусора комнат (инкрементальный обход) ---
+
+    def scan_memberships(self, cursor: int, count: int):
+        """
+        Порция участников для сборщика: (next_cursor, list[{"user_id", "room",
+        "seen_at", "room_exists"}]). Курсор непрозрачный: первый вызов с 0,
+        дальше — с полученным next_cursor; 0 в ответе — обход закончен.
+        room == None — осиротевшая запись без комнаты.
+        """
+        raise NotImplementedError
+
+    def clear_memberships(self, memberships):
+        """
+        Стирает записи о членстве без выхода из комнаты (комнаты уже нет).
+        memberships — list[(user_id, room_id как его видел сканер)]; запись,
+        которая успела смениться (пользователь вошёл в новую комнату), не трогается.
+        Возвращает число стёртых.
+        """
+        raise NotImplementedError
+
+    def scan_rooms(self, cursor: int, count: int):
+        """
+        Порция ID комнат (в том числе «висящих» в индексе по размеру без
+        самой комнаты): (next_cursor, list[room_id]). ID могут повторяться.
+        """
+        raise NotImplementedError
+
+    def repair_rooms(self, room_ids):
+        """
+        Сверяет комнаты с участниками: убирает из комнаты тех, чьё членство
+        указывает на другую комнату, выравнивает current_users по факту и удаляет
+        пустые и несуществующие комнаты. Комнату, которая менялась во время
+        проверки, пропускает. Возвращает {"ghost_members", "drift_fixed",
+        "rooms_deleted": set, "conflicts"}.
+        """
+        raise NotImplementedError
+
+    # --- Сообщения и уведомления ---
+
+    def append_message(self, room_id: str, record: str):
+        """Добавляет запись в историю комнаты."""
+        raise NotImplementedError
+
+    def get_messages(self, room_id: str, stale_ok: bool = False):
+        """Вся история комнаты (list[str]) в порядке добавления."""
+        raise NotImplementedError
+
+    def push_notification(self, room_id: str, message: str, created_at: str,
+                          max_len: int, ttl: int) -> str:
+        """
+        Добавляет уведомление в кольцевую ленту комнаты: хранятся последние
+        max_len, лента живёт ttl сек после последней записи (0 — без срока)
+        и удаляется вместе с комнатой. Возвращает ID уведомления "<ms>-<seq>";
+        ID растут, по ним читают с курсора.
+        """
+        raise NotImplementedError
+
+    def get_notifications(self, room_id: str, after_id: str = None, limit: int = 50):
+        """
+        До limit уведомлений с ID больше after_id по возрастанию,
+        без after_id — последние limit. list[{"id", "message", "created_at"}].
+        """
+        raise NotImplementedError
+
+    def get_session_state(self, user_id: int, message_limit: int, notification_limit: int,
+                          notifications_after: str = None):
+        """
+        Всё, что нужно клиенту при старте, за минимум обращений:
+        {"blocked": bool, "room": room_id или None, "joined_at": iso-строка или None,
+         "room_info": как get_room_info или None,
+         "messages": последние message_limit записей истории,
+         "notifications": как get_notifications(room, notifications_after, notification_limit)}.
+        Для заблокированного пользователя комната не читается.
+        """
+        raise NotImplementedError
+
+    # --- Блокировки ---
+
+    def is_blocked(self, user_id: int, stale_ok: bool = False) -> bool:
+        raise NotImplementedError
+
+    def set_blocked(self, user_ids, blocked: bool):
+        """Ставит или снимает флаг блокировки сразу у нескольких пользователей."""
+        raise NotImplementedError
+
+    # --- Жалобы ---
+
+    def create_complaint(self, data: dict, dedupe_key: str, dedupe_ttl: int,
+                         now: float, half_life: float, default_epoch: float, min_score: float):
+        """
+        Атомарно: проверка дубля по dedupe_key (окно dedupe_ttl сек), запись жалобы,
+        индексы по id/цели/репортёру и добавление жалобы в затухающий рейтинг
+        нарушителей (см. DECAY_RESCALE_AT; цели с текущим весом не больше
+        min_score выкидываются). default_epoch — эпоха, пока в хранилище её нет.
+        data обязана содержать reporter_id и target_user_id.
+        Возвращает (complaint_id, текущий вес цели) или (None, None) для дубля.
+        """
+        raise NotImplementedError
+
+    def list_complaint_ids(self, after_id: int = None, limit: int = 50,
+                           target_user_id: int = None, reporter_id: int = None,
+                           stale_ok: bool = False):
+        """
+        До limit ID жалоб по возрастанию, больше after_id.
+        Фильтр — по цели, иначе по репортёру, иначе все.
+        """
+        raise NotImplementedError
+
+    def get_complaints(self, complaint_ids, stale_ok: bool = False):
+        """list[dict|None] в том же порядке, что complaint_ids."""
+        raise NotImplementedError
+
+    def update_complaint(self, complaint_id: int, fields: dict) -> bool:
+        """Обновляет поля жалобы. False, если жалобы нет."""
+        raise NotImplementedError
+
+    def resolve_complaint(self, complaint_id: int, resolved_at: str) -> bool:
+        """
+        Атомарно: status=resolved, resolved_at и запись в индекс решённых
+        (его читает архиватор). False, если жалобы нет.
+        """
+        raise NotImplementedError
+
+    def list_resolved_complaint_ids(self, after_id: int = None, limit: int = 50):
+        """До limit ID решённых жалоб по возрастанию, больше after_id."""
+        raise NotImplementedError
+
+    def delete_complaints(self, complaints):
+        """
+        Удаляет жалобы вместе с индексами (включая индекс решённых).
+        complaints — list[(complaint_id, reporter_id, target_user_id)].
+        """
+        raise NotImplementedError
+
+    def top_offenders(self, limit: int, now: float, half_life: float, default_epoch: float,
+                      stale_ok: bool = False):
+        """list[(user_id, текущий вес на момент now)] по убыванию веса."""
+        raise NotImplementedError
+
+    # --- Служебное ---
+
+    def acquire_lock(self, name: str, ttl: int):
+        """
+        Неблокирующий лок с истечением через ttl сек (для фоновых задач).
+        Возвращает токен владельца (str) или None, если лок занят.
+        """
+        raise NotImplementedError
+
+    def extend_lock(self, name: str, token: str, ttl: int) -> bool:
+        """Продлевает лок ещё на ttl сек. False, если лок уже не принадлежит token."""
+        raise NotImplementedError
+
+    def release_lock(self, name: str, token: str) -> bool:
+        """Снимает лок, если он всё ещё принадлежит token."""
+        raise NotImplementedError
+
+    def get_generation(self, name: str) -> int:
+        """Текущее значение общего счётчика поколения name (0, если его не было)."""
+        raise NotImplementedError
+
+    def bump_generation(self, name: str) -> int:
+        """Увеличивает счётчик поколения name (сброс кэшей во всех воркерах), возвращает новое значение."""
+        raise NotImplementedError
@@ -0,0 +1,358 @@
+"""
+Общий набор проверок контракта ChatStorage.
+Любой движок хранилища обязан проходить все проверки:
+
+    flask --app app storage-conformance --backend memory
+    flask --app app storage-conformance --backend redis --scratch-db 15
+
+Проверки меняют общие для базы ключи (эпоха рейтинга нарушителей,
+счётчик жалоб), поэтому Redis проверяется только в отдельной пустой
+базе, которая после прогона очищается.
+"""
+import random
+import time
+from datetime import datetime
+from core.storage.base import ROOM_SIZES
+
+def _expect(condition, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+def _ids(n: int):
+    base = random.randint(10 ** 9, 2 * 10 ** 9)
+    return [base + i for i in range(n)]
+
+def _room_size() -> int:
+    # Редкий размер: проверки не зависят от комнат других проверок
+    return random.randint(50, 99)
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+def check_membership_empty(storage):
+    (uid,) = _ids(1)
+    _expect(storage.get_user_room(uid) is None, "new user must not be in a room")
+    _expect(storage.get_membership(uid) is None, "new user must have no membership")
+    _expect(storage.leave_room(uid) == (None, False), "leave without room must return (None, False)")
+
+def check_join_fills_room_before_creating(storage):
+    u1, u2, u3 = _ids(3)
+    size = _room_size()
+    # Первый вход создаёт комнату, второй попадает в неё же
+    room_a, created_a = storage.join_room(u1, size, _now())
+    _expect(created_a, "first join must create a room")
+    info = storage.get_room_info(room_a)
+    _expect(info == {"max_users": size, "current_users": 1}, f"unexpected room info {info}")
+
+    room_b, created_b = storage.join_room(u2, size, _now())
+    _expect(room_b == room_a and not created_b, "second join must reuse the open room")
+    _expect(storage.get_room_info(room_a)["current_users"] == 2, "member count must grow")
+    members = storage.get_room_members(room_a)
+    _expect(sorted(members) == [u1, u2], f"unexpected room members {members}")
+
+    membership = storage.get_membership(u2)
+    _expect(membership and membership["room"] == room_a and membership["joined_at"],
+            f"unexpected membership {membership}")
+
+    for uid in (u1, u2):
+        storage.leave_room(uid)
+    _expect(storage.get_user_room(u3) is None, "unrelated user must stay outside")
+
+def check_full_room_is_not_reused(storage):
+    (u1,) = _ids(1)
+    size = _room_size()
+    members = _ids(size)
+    room_id, _ = storage.join_room(members[0], size, _now())
+    for uid in members[1:]:
+        storage.join_room(uid, size, _now())
+    _expect(storage.get_room_info(room_id)["current_users"] == size, "room must be full")
+
+    other_room, created = storage.join_room(u1, size, _now())
+    _expect(created and other_room != room_id, "full room must not accept new members")
+
+    storage.leave_rooms(members + [u1])
+    _expect(storage.get_room_info(room_id) is None, "emptied room must be deleted")
+    _expect(storage.get_room_info(other_room) is None, "emptied room must be deleted")
+
+def check_room_stats(storage):
+    u1, u2 = _ids(2)
+    # room_stats видит только допустимые размеры комнат
+    size = ROOM_SIZES[-1]
+    before = storage.room_stats().get(size, {"rooms": 0, "waiting_users": 0})
+    room_a, _ = storage.join_room(u1, size, _now())
+    storage.join_room(u2, size, _now())
+    after = storage.room_stats().get(size)
+    _expect(after == {"rooms": before["rooms"] + 1, "waiting_users": before["waiting_users"] + 2},
+            f"unexpected room stats {after}")
+    storage.leave_rooms([u1, u2])
+    _expect(storage.room_stats().get(size, {"rooms": 0})["rooms"] == before["rooms"],
+            "deleted room must disappear from stats")
+
+def check_leave_deletes_empty_room(storage):
+    u1, u2 = _ids(2)
+    size = _room_size()
+    room_id, _ = storage.join_room(u1, size, _now())
+    storage.join_room(u2, size, _now())
+    storage.append_message(room_id, "u:hello:2025-01-01T00:00:00")
+
+    left_room, deleted = storage.leave_room(u1)
+    _expect(left_room == room_id and not deleted, "room with members must survive")
+    _expect(storage.get_user_room(u1) is None, "left user must have no room")
+
+    left_room, deleted = storage.leave_room(u2)
+    _expect(left_room == room_id and deleted, "last leave must delete the room")
+    _expect(storage.get_room_info(room_id) is None, "deleted room must have no info")
+    _expect(storage.get_room_members(room_id) == [], "deleted room must have no members")
+    _expect(storage.get_messages(room_id) == [], "deleted room must have no history")
+
+def check_bulk_leave(storage):
+    u1, u2, u3, outsider = _ids(4)
+    size = _room_size()
+    room_a, _ = storage.join_room(u1, size, _now())
+    storage.join_room(u2, size, _now())
+    room_c, _ = storage.join_room(u3, size + 1, _now())
+
+    memberships, deleted = storage.leave_rooms([u1, u3, outsider])
+    _expect(memberships == {u1: room_a, u3: room_c}, f"unexpected memberships {memberships}")
+    _expect(deleted == {room_c}, f"only room {room_c} must be deleted, got {deleted}")
+    _expect(storage.get_room_info(room_a)["current_users"] == 1, "one member must remain")
+
+    storage.leave_room(u2)
+
+def _scan_all(scan, count=2):
+    cursor, items = scan(0, count)
+    collected = list(items)
+    while cursor:
+        cursor, items = scan(cursor, count)
+        collected.extend(items)
+    return collected
+
+def check_reaper_primitives(storage):
+    u1, u2 = _ids(2)
+    size = _room_size()
+    room_id, _ = storage.join_room(u1, size, _now())
+    storage.join_room(u2, size, _now())
+    _expect(storage.get_membership(u1)["seen_at"], "join must set seen_at")
+    storage.touch_membership(u1, 1234.5)
+    _expect(storage.get_membership(u1)["seen_at"] == 1234.5, "touch must update seen_at")
+
+    entries = {e["user_id"]: e for e in _scan_all(storage.scan_memberships) if e["user_id"] in (u1, u2)}
+    _expect(set(entries) == {u1, u2}, f"scan must visit every member, got {entries}")
+    _expect(entries[u1]["room"] == room_id and entries[u1]["room_exists"] and entries[u1]["seen_at"] == 1234.5,
+            f"unexpected scanned membership {entries[u1]}")
+    _expect(room_id in _scan_all(storage.scan_rooms), "scan must visit every room")
+
+    _expect(storage.clear_memberships([(u1, "room:0:0")]) == 0, "changed membership must not be cleared")
+    report = storage.repair_rooms([room_id])
+    _expect(report["ghost_members"] == 0 and report["drift_fixed"] == 0 and not report["rooms_deleted"],
+            f"healthy room must be left alone, got {report}")
+    _expect(storage.get_room_info(room_id)["current_users"] == 2, "repair must keep live members")
+
+    storage.leave_rooms([u1, u2])
+    report = storage.repair_rooms([room_id])
+    _expect(not report["rooms_deleted"], "already deleted room must not be reported again")
+
+def check_messages_keep_order(storage):
+    (uid,) = _ids(1)
+    room_id, _ = storage.join_room(uid, _room_size(), _now())
+    records = [f"u:m{i}:2025-01-01T00:00:0{i}" for i in range(3)]
+    for record in records:
+        storage.append_message(room_id, record)
+    _expect(storage.get_messages(room_id) == records, "history must keep insertion order")
+    storage.leave_room(uid)
+
+def check_notifications_ring_buffer(storage):
+    u1, u2 = _ids(2)
+    size = _room_size()
+    room_id, _ = storage.join_room(u1, size, _now())
+    storage.join_room(u2, size, _now())
+    ids = [storage.push_notification(room_id, f"n{i}", _now(), 3, 60) for i in range(5)]
+    _expect(len(set(ids)) == 5, f"notification ids must be unique, got {ids}")
+
+    tail = storage.get_notifications(room_id, limit=10)
+    _expect([n["message"] for n in tail] == ["n2", "n3", "n4"], f"feed must keep the last max_len, got {tail}")
+    _expect([n["id"] for n in tail] == ids[2:], "ids must match push results in order")
+    _expect(tail[0]["created_at"], "created_at must be stored")
+    _expect([n["message"] for n in storage.get_notifications(room_id, limit=2)] == ["n3", "n4"],
+            "without cursor the newest limit entries")
+
+    after = storage.get_notifications(room_id, after_id=ids[2], limit=1)
+    _expect([n["id"] for n in after] == [ids[3]], f"cursor read must be exclusive, got {after}")
+    _expect([n["id"] for n in storage.get_notifications(room_id, after_id="0")] == ids[2:],
+            "cursor 0 must return the whole feed")
+    _expect(storage.get_notifications(room_id, after_id=ids[4]) == [], "nothing after the last id")
+
+    storage.leave_rooms([u1, u2])
+    _expect(storage.get_notifications(room_id) == [], "feed must be deleted with the room")
+
+def check_session_state(storage):
+    u1, u2 = _ids(2)
+    state = storage.get_session_state(u1, 2, 2)
+    _expect(state["room"] is None and not state["blocked"] and state["messages"] == [],
+            f"user outside rooms must get an empty state, got {state}")
+
+    size = _room_size()
+    room_id, _ = storage.join_room(u1, size, _now())
+    storage.join_room(u2, size, _now())
+    records = [f"u:m{i}:2025-01-01T00:00:0{i}" for i in range(3)]
+    for record in records:
+        storage.append_message(room_id, record)
+    for i in range(3):
+        storage.push_notification(room_id, f"n{i}", _now(), 10, 60)
+
+    state = storage.get_session_state(u1, 2, 2)
+    _expect(state["room"] == room_id and state["joined_at"], f"unexpected membership in {state}")
+    _expect(state["room_info"] == {"max_users": size, "current_users": 2}, f"unexpected room info {state}")
+    _expect(state["messages"] == records[-2:], "only the last message_limit messages")
+    _expect([n["message"] for n in state["notifications"]] == ["n1", "n2"],
+            "only the last notification_limit notifications")
+    first_id = storage.get_notifications(room_id, limit=3)[0]["id"]
+    state = storage.get_session_state(u1, 2, 10, notifications_after=first_id)
+    _expect([n["message"] for n in state["notifications"]] == ["n1", "n2"], "notifications after the cursor")
+
+    storage.set_blocked([u1], True)
+    state = storage.get_session_state(u1, 2, 2)
+    _expect(state["blocked"] and state["room"] is None, "blocked user must not see the room")
+    storage.set_blocked([u1], False)
+    storage.leave_rooms([u1, u2])
+
+def check_blocks(storage):
+    u1, u2 = _ids(2)
+    _expect(not storage.is_blocked(u1), "user must not be blocked by default")
+    storage.set_blocked([u1, u2], True)
+    _expect(storage.is_blocked(u1) and storage.is_blocked(u2), "both users must be blocked")
+    storage.set_blocked([u1], False)
+    _expect(not storage.is_blocked(u1) and storage.is_blocked(u2), "only u1 must be unblocked")
+    storage.set_blocked([u2], False)
+    storage.set_blocked([], True)
+
+def _decay(now: float, half_life: float = 3600.0):
+    # Эпоха по умолчанию = now: пока в хранилище эпохи нет, вес жалобы ровно 1
+    return {"now": now, "half_life": half_life, "default_epoch": now, "min_score": 0.0}
+
+def _complaint_data(reporter, target):
+    return {"reporter_id": str(reporter), "target_user_id": str(target), "message_id": "",
+            "reason": "", "status": "open", "created_at": _now()}
+
+def check_complaints(storage):
+    reporter, other_reporter, target, other_target = _ids(4)
+    data = _complaint_data
+    # Текущий вес в один и тот же момент не зависит от эпохи: +1 за жалобу
+    decay = _decay(time.time())
+
+    c1, score1 = storage.create_complaint(data(reporter, target), f"{reporter}:{target}:a", 60, **decay)
+    _expect(c1 is not None and score1 == 1.0, f"unexpected create result {(c1, score1)}")
+    dup = storage.create_complaint(data(reporter, target), f"{reporter}:{target}:a", 60, **decay)
+    _expect(dup == (None, None), "duplicate complaint must be rejected")
+
+    c2, score2 = storage.create_complaint(data(other_reporter, target), f"{other_reporter}:{target}:a", 60, **decay)
+    c3, _ = storage.create_complaint(data(reporter, other_target), f"{reporter}:{other_target}:a", 60, **decay)
+    _expect(c1 < c2 < c3, "complaint ids must grow")
+    _expect(score2 == 2.0, f"offender score must accumulate, got {score2}")
+
+    _expect(storage.list_complaint_ids(target_user_id=target) == [c1, c2], "by-target index")
+    _expect(storage.list_complaint_ids(reporter_id=reporter) == [c1, c3], "by-reporter index")
+    _expect(storage.list_complaint_ids(after_id=c1, limit=1, target_user_id=target) == [c2],
+            "after_id/limit pagination")
+    all_ids = storage.list_complaint_ids(after_id=c1 - 1, limit=10 ** 6)
+    _expect(all_ids[:3] == [c1, c2, c3], "global index must be ordered by id")
+
+    fetched = storage.get_complaints([c2, 0, c1])
+    _expect(fetched[1] is None, "missing complaint must be None")
+    _expect(fetched[0]["reporter_id"] == str(other_reporter) and fetched[2]["target_user_id"] == str(target),
+            "complaints must come back in request order")
+
+    _expect(storage.update_complaint(c1, {"status": "resolved"}), "update of existing complaint")
+    _expect(storage.get_complaints([c1])[0]["status"] == "resolved", "update must persist")
+    _expect(not storage.update_complaint(0, {"status": "resolved"}), "update of missing complaint")
+    _expect(storage.resolve_complaint(c3, _now()) and storage.resolve_complaint(c3, _now()),
+            "resolve of existing complaint")
+    _expect(storage.get_complaints([c3])[0]["status"] == "resolved", "resolve must set the status")
+    _expect(not storage.resolve_complaint(0, _now()), "resolve of missing complaint")
+    resolved = storage.list_resolved_complaint_ids(after_id=c1, limit=10 ** 6)
+    _expect(c3 in resolved and c1 not in resolved and resolved.count(c3) == 1,
+            f"resolved index must list c3 once, got {resolved}")
+
+    read = {key: decay[key] for key in ("now", "half_life", "default_epoch")}
+    top = dict(storage.top_offenders(10 ** 6, **read))
+    _expect(abs(top.get(target, 0) - 2.0) < 1e-9 and abs(top.get(other_target, 0) - 1.0) < 1e-9,
+            f"unexpected leaderboard {top}")
+    ranked = [uid for uid, _ in storage.top_offenders(10 ** 6, **read) if uid in (target, other_target)]
+    _expect(ranked == [target, other_target], "leaderboard must be sorted by score")
+    later = dict(storage.top_offenders(10 ** 6, **dict(read, now=decay["now"] + decay["half_life"])))
+    _expect(abs(later.get(target, 0) - 1.0) < 1e-9, f"score must halve after half_life, got {later}")
+
+    storage.delete_complaints([(c1, reporter, target), (c2, other_reporter, target), (c3, reporter, other_target)])
+    _expect(storage.get_complaints([c1, c2, c3]) == [None, None, None], "complaints must be deleted")
+    _expect(storage.list_complaint_ids(target_user_id=target) == [], "indexes must be cleaned")
+    _expect(c3 not in storage.list_resolved_complaint_ids(after_id=c1, limit=10 ** 6),
+            "resolved index must be cleaned")
+
+def check_offender_decay_rescale(storage):
+    # За секунду с half_life=1мс показатель 2^x превышает предел double (x > 1023):
+    # хранилище обязано пересчитать эпоху, а не упасть с переполнением
+    reporter, target, other_target = _ids(3)
+    half_life = 0.001
+    first, _ = storage.create_complaint(_complaint_data(reporter, target), f"{reporter}:{target}:d", 60,
+                                        **_decay(time.time(), half_life))
+    time.sleep(1.1)
+    later = _decay(time.time(), half_life)
+    second, score = storage.create_complaint(_complaint_data(reporter, other_target),
+                                             f"{reporter}:{other_target}:d", 60,
+                                             **dict(later, min_score=0.01))
+    _expect(second is not None and score == 1.0, f"complaint after a long gap must weigh 1, got {score}")
+    top = dict(storage.top_offenders(10 ** 6, later["now"], half_life, later["default_epoch"]))
+    _expect(target not in top, f"fully decayed target must be dropped, got {top.get(target)}")
+    _expect(abs(top.get(other_target, 0) - 1.0) < 1e-3, f"unexpected score after rescale {top.get(other_target)}")
+    storage.delete_complaints([(first, reporter, target), (second, reporter, other_target)])
+
+def check_lock(storage):
+    name = f"conformance-{random.randint(0, 10 ** 9)}"
+    token = storage.acquire_lock(name, 60)
+    _expect(token, "free lock must be acquired")
+    _expect(not storage.acquire_lock(name, 60), "held lock must not be acquired twice")
+    _expect(storage.extend_lock(name, token, 60), "owner must extend the lock")
+    _expect(not storage.extend_lock(name, "other", 60), "only the owner may extend the lock")
+    _expect(not storage.release_lock(name, "other"), "only the owner may release the lock")
+    _expect(storage.release_lock(name, token), "owner must release the lock")
+    _expect(not storage.extend_lock(name, token, 60), "released lock must not be extended")
+    token = storage.acquire_lock(name, 60)
+    _expect(token, "released lock must be acquired again")
+    storage.release_lock(name, token)
+
+def check_generation(storage):
+    name = f"conformance-{random.randint(0, 10 ** 9)}"
+    _expect(storage.get_generation(name) == 0, "new generation must start at 0")
+    _expect(storage.bump_generation(name) == 1, "bump must return the new value")
+    _expect(storage.get_generation(name) == 1, "bump must persist")
+
+CHECKS = [
+    check_membership_empty,
+    check_join_fills_room_before_creating,
+    check_full_room_is_not_reused,
+    check_room_stats,
+    check_leave_deletes_empty_room,
+    check_bulk_leave,
+    check_reaper_primitives,
+    check_messages_keep_order,
+    check_notifications_ring_buffer,
+    check_session_state,
+    check_blocks,
+    check_complaints,
+    check_offender_decay_rescale,
+    check_lock,
+    check_generation,
+]
+
+def run_conformance(storage_factory):
+    """
+    Прогоняет все проверки; для каждой создаётся новое хранилище storage_factory().
+    Возвращает list[(имя_проверки, ошибка)] — пустой, если всё прошло.
+    """
+    failures = []
+    for check in CHECKS:
+        try:
+            check(storage_factory())
+        except Exception as e:
+            failures.append((check.__name__, repr(e)))
+    return failures
@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+
+@contextmanager
+def hold_lock(storage, name: str, ttl: int):
+    """
+    Лок фоновой задачи на весь проход:
+
+        with hold_lock(storage, "room-reaper", 60) as keep_alive:
+            if keep_alive is None:
+                ...  # лок у другого воркера
+            ...
+            if not keep_alive():
+                ...  # лок истёк и достался другому — прекратить работу
+
+    keep_alive() продлевает лок ещё на ttl сек, его вызывают между порциями
+    работы; ttl должен покрывать одну порцию. На выходе лок снимается, если
+    он всё ещё принадлежит этому проходу.
+    """
+    token = storage.acquire_lock(name, ttl)
+    if not token:
+        yield None
+        return
+    try:
+        yield lambda: storage.extend_lock(name, token, ttl)
+    finally:
+        storage.release_lock(name, token)
@@ -0,0 +1,404 @@
+import math
+import random
+import time
+import uuid
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from core.storage.base import ChatStorage, DECAY_RESCALE_AT, ROOM_SIZES, notification_id_after
+
+class MemoryStorage(ChatStorage):
+    """
+    Хранилище в памяти процесса — для одиночного узла, локальной разработки
+    и быстрых бенчмарков без Redis.
+
+    Без блокировок: под eventlet greenlet'ы не вытесняются внутри метода
+    (здесь нет ввода-вывода), поэтому каждый метод выполняется атомарно.
+    Состояние не разделяется между процессами — только один воркер.
+    """
+
+    def __init__(self):
+        self.users = {}           # user_id -> {"room", "joined_at", "seen_at"}
+        self.rooms = {}           # room_id -> {"max_users", "members": set}
+        self.rooms_by_size = {}   # room_size -> set(room_id)
+        self.messages = {}        # room_id -> list[str]
+        self.notifications = {}   # room_id -> {"entries": list[((ms, seq), dict)], "expires_at"}
+        self.last_notification_id = (0, 0)
+        self.blocked = set()
+        self.complaints = {}      # complaint_id -> dict
+        self.complaint_counter = 0
+        self.complaint_index = {}  # None | ("target", id) | ("reporter", id) -> отсортированные id
+        self.resolved_ids = []    # отсортированные id решённых жалоб
+        self.dedupe = OrderedDict()  # key -> expires_at, в порядке записи
+        self.offenders = {}       # user_id -> raw score
+        self.decay_epoch = None   # эпоха затухания рейтинга (DECAY_RESCALE_AT)
+        self.locks = {}           # name -> (token, expires_at)
+        self.generations = {}     # name -> int
+
+    # --- Комнаты и участники ---
+
+    def get_user_room(self, user_id: int):
+        membership = self.users.get(int(user_id))
+        return membership["room"] if membership else None
+
+    def get_membership(self, user_id: int):
+        membership = self.users.get(int(user_id))
+        return dict(membership) if membership else None
+
+    def get_room_info(self, room_id: str):
+        room = self.rooms.get(room_id)
+        if room is None:
+            return None
+        return {"max_users": room["max_users"], "current_users": len(room["members"])}
+
+    def get_room_members(self, room_id: str, stale_ok: bool = False):
+        room = self.rooms.get(room_id)
+        return list(room["members"]) if room else []
+
+    def join_room(self, user_id: int, room_size: int, joined_at: str):
+        user_id = int(user_id)
+        candidates = self.rooms_by_size.setdefault(room_size, set())
+        chosen_room = None
+        for room_id in candidates:
+            room = self.rooms[room_id]
+            if len(room["members"]) < room["max_users"]:
+                chosen_room = room_id
+                break
+
+        created = chosen_room is None
+        if created:
+            chosen_room = f"room:{room_size}:{random.randint(100000, 999999)}"
+            while chosen_room in self.rooms:
+                chosen_room = f"room:{room_size}:{random.randint(100000, 999999)}"
+            self.rooms[chosen_room] = {"max_users": room_size, "members": set()}
+            candidates.add(chosen_room)
+
+        self.rooms[chosen_room]["members"].add(user_id)
+        self.users[user_id] = {"room": chosen_room, "joined_at": joined_at, "seen_at": time.time()}
+        return chosen_room, created
+
+    def touch_membership(self, user_id: int, seen_at: float):
+        membership = self.users.get(int(user_id))
+        if membership:
+            membership["seen_at"] = seen_at
+
+    def room_stats(self):
+        stats = {room_size: {"rooms": 0, "waiting_users": 0} for room_size in ROOM_SIZES}
+        for room in self.rooms.values():
+            entry = stats.get(room["max_users"])
+            if entry is None:
+                continue
+            entry["rooms"] += 1
+            if len(room["members"]) < room["max_users"]:
+                entry["waiting_users"] += len(room["members"])
+        return stats
+
+    def leave_room(self, user_id: int):
+        memberships, deleted = self.leave_rooms([user_id])
+        room_id = memberships.get(int(user_id))
+        return room_id, room_id in deleted
+
+    def leave_rooms(self, user_ids):
+        memberships = {}
+        empty_rooms = set()
+        for user_id in user_ids:
+            user_id = int(user_id)
+            membership = self.users.pop(user_id, None)
+            if not membership:
+                continue
+            room_id = membership["room"]
+            memberships[user_id] = room_id
+            room = self.rooms.get(room_id)
+            if room is None:
+                continue
+            room["members"].discard(user_id)
+            if not room["members"]:
+                self._delete_room(room_id)
+                empty_rooms.add(room_id)
+        return memberships, empty_rooms
+
+    def _delete_room(self, room_id: str):
+        room = self.rooms.pop(room_id)
+        self.rooms_by_size.get(room["max_users"], set()).discard(room_id)
+        self.messages.pop(room_id, None)
+        self.notifications.pop(room_id, None)
+
+    # --- Сборщик мусора комнат ---
+
+    @staticmethod
+    def _page(items, cursor, count: int):
+        # Курсор — последний выданный ключ (а не смещение): между порциями
+        # сборщик удаляет записи, и смещение перескочило бы через соседей
+        start = bisect_right(items, cursor) if cursor else 0
+        page = items[start:start + count]
+        next_cursor = page[-1] if start + count < len(items) else 0
+        return next_cursor, page
+
+    def scan_memberships(self, cursor: int, count: int):
+        next_cursor, user_ids = self._page(sorted(self.users), cursor, count)
+        entries = []
+        for user_id in user_ids:
+            membership = self.users[user_id]
+            entries.append({"user_id": user_id, "room": membership.get("room"),
+                            "seen_at": membership.get("seen_at"),
+                            "room_exists": membership.get("room") in self.rooms})
+        return next_cursor, entries
+
+    def clear_memberships(self, memberships):
+        cleared = 0
+        for user_id, room_id in memberships:
+            membership = self.users.get(int(user_id))
+            if membership is not None and membership.get("room") == room_id:
+                del self.users[int(user_id)]
+                cleared += 1
+        return cleared
+
+    def scan_rooms(self, cursor: int, count: int):
+        indexed = set().union(*self.rooms_by_size.values()) if self.rooms_by_size else set()
+        return self._page(sorted(set(self.rooms) | indexed), cursor, count)
+
+    def repair_rooms(self, room_ids):
+        report = {"ghost_members": 0, "drift_fixed": 0, "rooms_deleted": set(), "conflicts": 0}
+        for room_id in room_ids:
+            room = self.rooms.get(room_id)
+            if room is None:
+                dangling = any(room_id in rooms for rooms in self.rooms_by_size.values())
+                for rooms in self.rooms_by_size.values():
+                    rooms.discard(room_id)
+                self.messages.pop(room_id, None)
+                self.notifications.pop(room_id, None)
+                if dangling:
+                    report["rooms_deleted"].add(room_id)
+                continue
+            # Число участников здесь — размер множества, поэтому дрейфа счётчика нет
+            ghosts = {uid for uid in room["members"] if self.get_user_room(uid) != room_id}
+            room["members"] -= ghosts
+            report["ghost_members"] += len(ghosts)
+            if not room["members"]:
+                self._delete_room(room_id)
+                report["rooms_deleted"].add(room_id)
+        return report
+
+    # --- Сообщения и уведомления ---
+
+    def append_message(self, room_id: str, record: str):
+        self.messages.setdefault(room_id, []).append(record)
+
+    def get_messages(self, room_id: str, stale_ok: bool = False):
+        return list(self.messages.get(room_id, []))
+
+    def push_notification(self, room_id: str, message: str, created_at: str,
+                          max_len: int, ttl: int) -> str:
+        # ID как у Redis Streams: миллисекунды и номер внутри миллисекунды
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = self.last_notification_id
+        entry_id = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        self.last_notification_id = entry_id
+
+        feed = self._notification_feed(room_id) or {"entries": []}
+        feed["entries"].append((entry_id, {"message": message, "created_at": created_at}))
+        del feed["entries"][:-max_len]
+        feed["expires_at"] = time.time() + ttl if ttl else None
+        self.notifications[room_id] = feed
+        return f"{entry_id[0]}-{entry_id[1]}"
+
+    def _notification_feed(self, room_id: str):
+        feed = self.notifications.get(room_id)
+        if feed and feed["expires_at"] is not None and feed["expires_at"] <= time.time():
+            del self.notifications[room_id]
+            return None
+        return feed
+
+    def get_notifications(self, room_id: str, after_id: str = None, limit: int = 50):
+        feed = self._notification_feed(room_id)
+        entries = feed["entries"] if feed else []
+        if after_id is None:
+            selected = entries[-limit:]
+        else:
+            start = tuple(int(part) for part in notification_id_after(after_id).split("-"))
+            first = bisect_left(entries, start, key=lambda entry: entry[0])
+            selected = entries[first:first + limit]
+        return [{"id": f"{ms}-{seq}", **fields} for (ms, seq), fields in selected]
+
+    def get_session_state(self, user_id: int, message_limit: int, notification_limit: int,
+                          notifications_after: str = None):
+        state = {"blocked": self.is_blocked(user_id), "room": None, "joined_at": None,
+                 "room_info": None, "messages": [], "notifications": []}
+        membership = self.users.get(int(user_id))
+        if state["blocked"] or not membership:
+            return state
+
+        room_id = membership["room"]
+        state.update(
+            room=room_id,
+            joined_at=membership["joined_at"],
+            room_info=self.get_room_info(room_id),
+            messages=self.messages.get(room_id, [])[-message_limit:],
+            notifications=self.get_notifications(room_id, notifications_after, notification_limit),
+        )
+        return state
+
+    # --- Блокировки ---
+
+    def is_blocked(self, user_id: int, stale_ok: bool = False) -> bool:
+        return int(user_id) in self.blocked
+
+    def set_blocked(self, user_ids, blocked: bool):
+        for user_id in user_ids:
+            if blocked:
+                self.blocked.add(int(user_id))
+            else:
+                self.blocked.discard(int(user_id))
+
+    # --- Жалобы ---
+
+    def create_complaint(self, data: dict, dedupe_key: str, dedupe_ttl: int,
+                         now: float, half_life: float, default_epoch: float, min_score: float):
+        current_time = time.time()
+        expires_at = self.dedupe.get(dedupe_key)
+        if expires_at is not None:
+            if expires_at > current_time:
+                return None, None
+            del self.dedupe[dedupe_key]
+
+        self.complaint_counter += 1
+        complaint_id = self.complaint_counter
+        self.complaints[complaint_id] = {k: str(v) for k, v in data.items()}
+        # id растут, поэтому append сохраняет индексы отсортированными
+        for key in self._index_keys(data["reporter_id"], data["target_user_id"]):
+            self.complaint_index.setdefault(key, []).append(complaint_id)
+
+        # Затухающий рейтинг с пересчётом эпохи — как скрипт CREATE_COMPLAINT в Redis
+        epoch = self.decay_epoch if self.decay_epoch is not None else default_epoch
+        exponent = max((now - epoch) / half_life, 0.0)
+        if exponent >= DECAY_RESCALE_AT:
+            shift = math.floor(exponent)
+            scale = 2.0 ** -shift
+            self.offenders = {uid: raw * scale for uid, raw in self.offenders.items()}
+            epoch += shift * half_life
+            exponent -= shift
+        self.decay_epoch = epoch
+
+        weight = 2.0 ** exponent
+        target_user_id = int(data["target_user_id"])
+        score = self.offenders.get(target_user_id, 0.0) + weight
+        self.offenders[target_user_id] = score
+        for user_id in [uid for uid, raw in self.offenders.items() if raw <= min_score * weight]:
+            del self.offenders[user_id]
+        # Окно дубля — только для записанной жалобы, как в скрипте Redis
+        self._expire_dedupe(current_time)
+        self.dedupe[dedupe_key] = current_time + dedupe_ttl
+        return complaint_id, score / weight
+
+    def _expire_dedupe(self, current_time: float):
+        """
+        Удаляет истёкшие окна дублей, как SET ... EX в Redis. Записи идут в
+        порядке записи с одним COMPLAINT_DEDUPE_TTL, так что истёкшие лежат
+        в начале; запись с другим ttl лишь задерживает очистку за ней.
+        """
+        while self.dedupe:
+            key, expires_at = next(iter(self.dedupe.items()))
+            if expires_at > current_time:
+                break
+            del self.dedupe[key]
+
+    @staticmethod
+    def _index_keys(reporter_id, target_user_id):
+        return [None, ("target", str(target_user_id)), ("reporter", str(reporter_id))]
+
+    def list_complaint_ids(self, after_id: int = None, limit: int = 50,
+                           target_user_id: int = None, reporter_id: int = None,
+                           stale_ok: bool = False):
+        # Как sorted set в Redis: бинарный поиск курсора и срез страницы
+        if target_user_id is not None:
+            index = self.complaint_index.get(("target", str(target_user_id)), [])
+        elif reporter_id is not None:
+            index = self.complaint_index.get(("reporter", str(reporter_id)), [])
+        else:
+            index = self.complaint_index.get(None, [])
+        start = bisect_right(index, after_id) if after_id is not None else 0
+        return index[start:start + limit]
+
+    def get_complaints(self, complaint_ids, stale_ok: bool = False):
+        result = []
+        for complaint_id in complaint_ids:
+            data = self.complaints.get(int(complaint_id))
+            result.append(dict(data) if data else None)
+        return result
+
+    def update_complaint(self, complaint_id: int, fields: dict) -> bool:
+        data = self.complaints.get(int(complaint_id))
+        if data is None:
+            return False
+        data.update({k: str(v) for k, v in fields.items()})
+        return True
+
+    def resolve_complaint(self, complaint_id: int, resolved_at: str) -> bool:
+        if not self.update_complaint(complaint_id, {"status": "resolved", "resolved_at": resolved_at}):
+            return False
+        # Как ZADD: повторное решение не дублирует id
+        complaint_id = int(complaint_id)
+        pos = bisect_left(self.resolved_ids, complaint_id)
+        if pos == len(self.resolved_ids) or self.resolved_ids[pos] != complaint_id:
+            self.resolved_ids.insert(pos, complaint_id)
+        return True
+
+    def list_resolved_complaint_ids(self, after_id: int = None, limit: int = 50):
+        start = bisect_right(self.resolved_ids, after_id) if after_id is not None else 0
+        return self.resolved_ids[start:start + limit]
+
+    @staticmethod
+    def _remove_sorted(index, value) -> bool:
+        pos = bisect_left(index, value)
+        if pos < len(index) and index[pos] == value:
+            del index[pos]
+            return True
+        return False
+
+    def delete_complaints(self, complaints):
+        for complaint_id, reporter_id, target_user_id in complaints:
+            complaint_id = int(complaint_id)
+            self.complaints.pop(complaint_id, None)
+            self._remove_sorted(self.resolved_ids, complaint_id)
+            for key in self._index_keys(reporter_id, target_user_id):
+                self._remove_sorted(self.complaint_index.get(key, []), complaint_id)
+
+    def top_offenders(self, limit: int, now: float, half_life: float, default_epoch: float,
+                      stale_ok: bool = False):
+        epoch = self.decay_epoch if self.decay_epoch is not None else default_epoch
+        scale = 2.0 ** -max((now - epoch) / half_life, 0.0)
+        rows = sorted(self.offenders.items(), key=lambda item: item[1], reverse=True)
+        return [(user_id, raw * scale) for user_id, raw in rows[:limit]]
+
+    # --- Служебное ---
+
+    def acquire_lock(self, name: str, ttl: int):
+        now = time.time()
+        _, expires_at = self.locks.get(name, (None, 0))
+        if expires_at > now:
+            return None
+        token = uuid.uuid4().hex
+        self.locks[name] = (token, now + ttl)
+        return token
+
+    def _owns_lock(self, name: str, token: str) -> bool:
+        owner, expires_at = self.locks.get(name, (None, 0))
+        return owner == token and expires_at > time.time()
+
+    def extend_lock(self, name: str, token: str, ttl: int) -> bool:
+        if not self._owns_lock(name, token):
+            return False
+        self.locks[name] = (token, time.time() + ttl)
+        return True
+
+    def release_lock(self, name: str, token: str) -> bool:
+        if not self._owns_lock(name, token):
+            return False
+        del self.locks[name]
+        return True
+
+    def get_generation(self, name: str) -> int:
+        return self.generations.get(name, 0)
+
+    def bump_generation(self, name: str) -> int:
+        self.generations[name] = self.generations.get(name, 0) + 1
+        return self.generations[name]
@@ -0,0 +1,208 @@
+"""
+Аудит памяти Redis: сколько занимают семейства ключей (комнаты, сообщения,
+уведомления, жалобы, пользователи), какие комнаты самые тяжёлые и какие
+ключи остались без владельца — см. схему ключей в redis_storage.
+
+Обход — SCAN порциями, размер — MEMORY USAGE только для выборки: ключ
+попадает в неё по crc32 владельца (комнаты — по её ID, остальные — по
+имени ключа), так что все ключи одной комнаты либо меряются, либо нет, а
+повторный обход с той же долей видит ту же выборку. Оценка семейства —
+измеренные байты / доля выборки.
+
+Нагрузка на сервер ограничена: один шаг (audit_step) проходит не больше
+max_keys ключей и не дольше time_budget секунд, между порциями SCAN делает
+паузу. Шаг возвращает курсор; следующий шаг продолжает с него, отчёты
+шагов складывает merge_reports.
+"""
+import re
+import time
+import zlib
+from core.storage.redis_migration import legacy_target
+from core.storage.redis_storage import USER_BUCKET_SIZE, room_key, scan_page
+
+# Ключи комнаты: суффикс → семейство ({room:S:N}:users — прежняя схема)
+_ROOM_KEY = re.compile(r"^\{(room:\d+:\d+)\}(?::(messages|notifications|users))?$")
+_ROOM_FAMILIES = {None: "rooms", "messages": "messages", "notifications": "notifications", "users": "legacy"}
+# Остальные: (семейство, шаблон) — первый совпавший; не совпал ни один — legacy или other
+_FAMILIES = [
+    ("rooms", re.compile(r"^\{rooms:\d+\}$")),
+    ("users", re.compile(r"^\{users:\d+\}$")),
+    ("legacy", re.compile(r"^\{user:\d+\}(:blocked)?$")),
+    ("complaints", re.compile(r"^\{complaints\}:")),
+    ("service", re.compile(r"^lock:")),
+    ("service", re.compile(r"^generation:")),
+    ("service", re.compile(r"^replica:heartbeat$")),
+]
+FAMILIES = ("rooms", "messages", "notifications", "complaints", "users", "service", "legacy", "other")
+
+_COMPLAINT_USER_INDEX = re.compile(r"^\{complaints\}:by_(?:target|reporter):(\d+)$")
+ORPHAN_LIMIT = 100  # сколько осиротевших ключей перечислять в отчёте
+
+def classify(key: str):
+    """(семейство, ID комнаты или None)."""
+    match = _ROOM_KEY.match(key)
+    if match:
+        return _ROOM_FAMILIES[match.group(2)], match.group(1)
+    for family, pattern in _FAMILIES:
+        if pattern.match(key):
+            return family, None
+    return ("legacy" if legacy_target(key) else "other"), None
+
+def in_sample(owner: str, sample_rate: float) -> bool:
+    if sample_rate >= 1:
+        return True
+    return zlib.crc32(owner.encode()) % 10000 < sample_rate * 10000
+
+def encode_cursor(cursor) -> str:
+    """Курсор scan_page для JSON: "N" или в кластере "узел:N"; "0" — обход закончен."""
+    if isinstance(cursor, tuple):
+        return f"{cursor[0]}:{cursor[1]}"
+    return str(cursor)
+
+def decode_cursor(value: str):
+    if not value or value == "0":
+        return 0
+    if ":" in value:
+        node_index, node_cursor = value.split(":", 1)
+        return int(node_index), int(node_cursor)
+    return int(value)
+
+def empty_report(sample_rate: float) -> dict:
+    return {
+        "cursor": "0",
+        "complete": False,
+        "sample_rate": sample_rate,
+        "scanned": 0,
+        "sampled": 0,
+        "duration_s": 0.0,
+        "families": {family: {"keys": 0, "sampled": 0, "bytes_sampled": 0, "bytes_estimated": 0}
+                     for family in FAMILIES},
+        "top_rooms": [],
+        "orphans_total": {},
+        "orphans": [],
+        "_rooms": {},  # ID комнаты → измеренные байты, до finish_report
+    }
+
+def _add_orphan(report, key: str, reason: str):
+    report["orphans_total"][reason] = report["orphans_total"].get(reason, 0) + 1
+    if len(report["orphans"]) < ORPHAN_LIMIT:
+        report["orphans"].append({"key": key, "reason": reason})
+
+def _audit_batch(r, keys, report, sample_rate: float, memory_samples: int, user_exists):
+    classified = [(key, *classify(key)) for key in keys]
+    sampled = [(key, family, room_id) for key, family, room_id in classified
+               if in_sample(room_id or key, sample_rate)]
+    # Сообщения и уведомления без множества участников — остатки удалённой комнаты
+    room_owned = [(key, family, room_id) for key, family, room_id in classified
+                  if family in ("messages", "notifications")]
+
+    pipe = r.pipeline(transaction=False)
+    for key, _, _ in sampled:
+        pipe.memory_usage(key, samples=memory_samples)
+    for key, family, room_id in room_owned:
+        pipe.exists(room_key(room_id))
+        if family == "notifications":
+            pipe.type(key)
+    replies = pipe.execute()
+    sizes = dict(zip((key for key, _, _ in sampled), replies[:len(sampled)]))
+
+    no_room, legacy_lists = set(), set()
+    replies = iter(replies[len(sampled):])
+    for key, family, room_id in room_owned:
+        if not next(replies):
+            no_room.add(key)
+        if family == "notifications" and next(replies) == "list":
+            legacy_lists.add(key)  # лента старого формата: flask drop-legacy-notifications
+
+    for key, family, room_id in classified:
+        if key in legacy_lists:
+            family = "legacy"
+        stats = report["families"][family]
+        stats["keys"] += 1
+        if family == "legacy":
+            _add_orphan(report, key, "legacy")
+        elif key in no_room:
+            _add_orphan(report, key, "no_room")
+        size = sizes.get(key)
+        if size is None:
+            continue  # не в выборке или ключ исчез между SCAN и MEMORY USAGE
+        stats["sampled"] += 1
+        stats["bytes_sampled"] += size
+        report["sampled"] += 1
+        if room_id:
+            report["_rooms"][room_id] = report["_rooms"].get(room_id, 0) + size
+
+    if user_exists:
+        _check_user_owners(classified, report, user_exists)
+
+def _check_user_owners(classified, report, user_exists):
+    """Корзины, где нет ни одного существующего пользователя, и индексы жалоб удалённых пользователей."""
+    owners = {}  # ключ → id пользователей, хотя бы один из которых должен существовать
+    for key, family, _ in classified:
+        if family == "users":
+            bucket = int(key[len("{users:"):-1])
+            owners[key] = range(bucket * USER_BUCKET_SIZE, (bucket + 1) * USER_BUCKET_SIZE)
+        elif family == "complaints":
+            match = _COMPLAINT_USER_INDEX.match(key)
+            if match:
+                owners[key] = (int(match.group(1)),)
+    if not owners:
+        return
+    existing = user_exists({user_id for ids in owners.values() for user_id in ids})
+    for key, ids in owners.items():
+        if not any(user_id in existing for user_id in ids):
+            _add_orphan(report, key, "no_user")
+
+def audit_step(r, cursor=0, batch_size: int = 200, max_keys: int = 10000,
+               time_budget: float = 2.0, sample_rate: float = 1.0, memory_samples: int = 5,
+               pause: float = 0.0, sleep=time.sleep, user_exists=None) -> dict:
+    """
+    Один шаг аудита с курсора cursor (0 или None — с начала; строка из отчёта — тоже).
+    r — клиент с decode_responses. user_exists(ids) → множество существующих
+    id пользователей; без него ключи без владельца-пользователя не ищутся.
+    sleep — чем ждать между порциями (в приложении — socketio.sleep).
+    """
+    if cursor is None or isinstance(cursor, str):
+        cursor = decode_cursor(cursor)
+    report = empty_report(sample_rate)
+    started = time.monotonic()
+    while True:
+        cursor, keys = scan_page(r, cursor, "*", min(batch_size, max_keys))
+        report["scanned"] += len(keys)
+        if keys:
+            _audit_batch(r, keys, report, sample_rate, memory_samples, user_exists)
+        if not cursor:
+            report["complete"] = True
+            break
+        if report["scanned"] >= max_keys or time.monotonic() - started >= time_budget:
+            break
+        sleep(pause)
+    report["cursor"] = encode_cursor(cursor)
+    report["duration_s"] = round(time.monotonic() - started, 3)
+    return report
+
+def merge_reports(total: dict, step: dict) -> dict:
+    """Прибавляет отчёт шага к total (оба — до finish_report). Возвращает total."""
+    for name in ("scanned", "sampled", "duration_s"):
+        total[name] += step[name]
+    total["duration_s"] = round(total["duration_s"], 3)
+    total["cursor"], total["complete"] = step["cursor"], step["complete"]
+    for family, stats in step["families"].items():
+        for name in ("keys", "sampled", "bytes_sampled"):
+            total["families"][family][name] += stats[name]
+    for room_id, size in step["_rooms"].items():
+        total["_rooms"][room_id] = total["_rooms"].get(room_id, 0) + size
+    for reason, count in step["orphans_total"].items():
+        total["orphans_total"][reason] = total["orphans_total"].get(reason, 0) + count
+    total["orphans"].extend(step["orphans"][:ORPHAN_LIMIT - len(total["orphans"])])
+    return total
+
+def finish_report(report: dict, top: int = 10) -> dict:
+    """Оценки по семействам и top комнат по измеренным байтам; убирает служебные поля."""
+    for stats in report["families"].values():
+        stats["bytes_estimated"] = round(stats["bytes_sampled"] / report["sample_rate"]) \
+            if report["sample_rate"] > 0 else 0
+    rooms = report.pop("_rooms")
+    report["top_rooms"] = [{"room_id": room_id, "bytes": size} for room_id, size in
+                           sorted(rooms.items(), key=lambda item: item[1], reverse=True)[:top]]
+    return report
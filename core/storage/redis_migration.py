@@ -0,0 +1,210 @@
+"""
+Перенос ключей Redis из старой схемы без hash tag'ов (room:3:123456,
+user:42, complaints:by_id...) в новую ({room:3:123456}, {user:42},
+{complaints}:by_id...) — см. схему ключей в redis_storage.
+
+Ключ переносится целиком: DUMP + PTTL → RESTORE под новым именем (тип,
+содержимое и срок жизни сохраняются), затем старый удаляется. Если новый
+ключ уже существует, старый не трогается и считается конфликтом. Ленты
+уведомлений старого формата (list) не переносятся, а удаляются.
+
+Второй шаг — compact_layout: перевод в компактную схему. Hash пользователя
+{user:ID} и флаг {user:ID}:blocked складываются полями в корзину {users:B},
+hash комнаты со счётчиком удаляется, а её множество участников
+{room:S:N}:users становится ключом {room:S:N}.
+
+Запускать при остановленном приложении: ключ, изменённый между чтением и
+удалением, потеряет это изменение.
+"""
+import logging
+import re
+from core.storage import redis_scripts
+from core.storage.redis_storage import room_key, scan_page, user_bucket_key, user_field
+
+logger = logging.getLogger(__name__)
+
+# Старое имя → новое (шаблон для re.sub); ключи локов не меняются
+LEGACY_KEYS = [
+    (re.compile(r"^(room:\d+:\d+)$"), r"{\1}"),
+    (re.compile(r"^(room:\d+:\d+):(users|messages|notifications)$"), r"{\1}:\2"),
+    (re.compile(r"^(rooms:\d+)$"), r"{\1}"),
+    (re.compile(r"^(user:\d+)$"), r"{\1}"),
+    (re.compile(r"^(user:\d+):blocked$"), r"{\1}:blocked"),
+    (re.compile(r"^(complaint:\d+)$"), r"{complaints}:\1"),
+    (re.compile(r"^complaints:(by_id|offenders|all|by_target:\d+|by_reporter:\d+)$"), r"{complaints}:\1"),
+    (re.compile(r"^complaint_id_counter$"), "{complaints}:id_counter"),
+    (re.compile(r"^complaint:dedupe:(.+)$"), r"{complaints}:dedupe:\1"),
+]
+
+def legacy_target(key: str):
+    """Новое имя для ключа старой схемы или None, если ключ переносить не нужно."""
+    for pattern, replacement in LEGACY_KEYS:
+        if pattern.match(key):
+            return pattern.sub(replacement, key)
+    return None
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+def migrate_keys(target, source=None, batch_size: int = 500, dry_run: bool = False,
+                 delete_source: bool = None):
+    """
+    Переносит ключи старой схемы в target. source — другой Redis (например,
+    прежний одиночный сервер при переезде в кластер); по умолчанию — тот же
+    target. Оба клиента — без decode_responses (DUMP возвращает байты).
+
+    delete_source: удалять ли перенесённые ключи в источнике; по умолчанию
+    да при переносе на месте и нет при копировании из другого Redis.
+
+    Возвращает {"scanned", "migrated", "conflicts", "dropped", "failed"}.
+    """
+    in_place = source is None
+    source = target if in_place else source
+    if delete_source is None:
+        delete_source = in_place
+
+    report = {"scanned": 0, "migrated": 0, "conflicts": 0, "dropped": 0, "failed": 0}
+    cursor = 0
+    while True:
+        cursor, keys = scan_page(source, cursor, "*", batch_size)
+        report["scanned"] += len(keys)
+        pairs = [(key, legacy_target(key)) for key in map(_decode, keys)]
+        pairs = [(key, new_key) for key, new_key in pairs if new_key]
+        if pairs:
+            _migrate_batch(target, source, pairs, report, dry_run, delete_source)
+        if not cursor:
+            break
+
+    logger.info(f"Redis key migration{' (dry run)' if dry_run else ''}: {report}")
+    return report
+
+def _migrate_batch(target, source, pairs, report, dry_run: bool, delete_source: bool):
+    pipe = source.pipeline(transaction=False)
+    for key, _ in pairs:
+        pipe.type(key)
+        pipe.dump(key)
+        pipe.pttl(key)
+    replies = pipe.execute()
+
+    restores = []
+    stale = []  # старые ленты уведомлений — удаляются без переноса
+    for (key, new_key), key_type, payload, ttl in zip(pairs, replies[0::3], replies[1::3], replies[2::3]):
+        key_type = _decode(key_type)
+        if key_type == "none" or payload is None:
+            continue  # ключ исчез между SCAN и DUMP
+        if new_key.endswith(":notifications") and key_type == "list":
+            stale.append(key)
+            continue
+        restores.append((key, new_key, payload, max(ttl, 0)))
+
+    report["dropped"] += len(stale)
+    if dry_run:
+        report["migrated"] += len(restores)
+        return
+
+    done = []
+    if restores:
+        pipe = target.pipeline(transaction=False)
+        for _, new_key, payload, ttl in restores:
+            pipe.restore(new_key, ttl, payload)
+        results = pipe.execute(raise_on_error=False)
+        for (key, new_key, _, _), result in zip(restores, results):
+            if not isinstance(result, Exception):
+                report["migrated"] += 1
+                done.append(key)
+            elif "BUSYKEY" in str(result):
+                report["conflicts"] += 1
+                logger.warning(f"Redis key migration: {new_key} already exists, {key} left in place")
+            else:
+                report["failed"] += 1
+                logger.error(f"Redis key migration: {key} -> {new_key} failed: {result}")
+
+    to_delete = done + stale if delete_source else []
+    if to_delete:
+        pipe = source.pipeline(transaction=False)
+        for key in to_delete:
+            pipe.delete(key)
+        pipe.execute()
+
+# --- Компактная схема ---
+
+_EXPANDED_USER_KEY = re.compile(r"^\{user:(\d+)\}(:blocked)?$")
+_EXPANDED_ROOM_KEY = re.compile(r"^\{(room:\d+:\d+)\}(:users)?$")
+_USER_FIELDS = {"room": "r", "joined_at": "j", "seen_at": "s"}
+
+def compact_users(r, batch_size: int = 500, dry_run: bool = False) -> int:
+    """
+    {user:ID} и {user:ID}:blocked → поля корзины {users:B}. Возвращает число
+    перенесённых ключей.
+    """
+    moved = 0
+    cursor = 0
+    while True:
+        cursor, keys = scan_page(r, cursor, "{user:*", batch_size)
+        matched = [(key, match) for key, match in
+                   ((key, _EXPANDED_USER_KEY.match(key)) for key in map(_decode, keys)) if match]
+        if matched and not dry_run:
+            pipe = r.pipeline(transaction=False)
+            for key, match in matched:
+                if match.group(2):
+                    pipe.get(key)
+                else:
+                    pipe.hgetall(key)
+            values = pipe.execute()
+
+            pipe = r.pipeline(transaction=False)
+            for (key, match), value in zip(matched, values):
+                user_id = match.group(1)
+                if match.group(2):
+                    fields = {user_field(user_id, "b"): "1"} if _decode(value) == "1" else {}
+                else:
+                    fields = {user_field(user_id, _USER_FIELDS[name]): _decode(field_value)
+                              for name, field_value in ((_decode(k), v) for k, v in value.items())
+                              if name in _USER_FIELDS}
+                if fields:
+                    pipe.hset(user_bucket_key(user_id), mapping=fields)
+                pipe.delete(key)
+            pipe.execute()
+        moved += len(matched)
+        if not cursor:
+            return moved
+
+def compact_rooms(r, batch_size: int = 500, dry_run: bool = False) -> int:
+    """
+    {room:S:N} (hash) + {room:S:N}:users → {room:S:N} (множество участников).
+    Возвращает число переведённых комнат.
+    """
+    compacted = 0
+    cursor = 0
+    while True:
+        cursor, keys = scan_page(r, cursor, "{room:*", batch_size)
+        matched = [(match.group(1), bool(match.group(2)))
+                   for match in map(_EXPANDED_ROOM_KEY.match, map(_decode, keys)) if match]
+        if matched:
+            pipe = r.pipeline(transaction=False)
+            for room_id, _ in matched:
+                pipe.type(room_key(room_id))
+            # Комнату считаем по одному ключу: по hash, а без него — по :users
+            # (ключи одной комнаты могут попасть в разные порции SCAN)
+            expanded = list(dict.fromkeys(
+                room_id for (room_id, is_users), key_type in zip(matched, pipe.execute())
+                if (_decode(key_type) == "hash") != is_users))
+            if expanded and not dry_run:
+                # Hash и множество комнаты — в одном слоте: переводятся атомарно скриптом
+                pipe = r.pipeline(transaction=False)
+                for room_id in expanded:
+                    key = room_key(room_id)
+                    pipe.eval(redis_scripts.COMPACT_ROOM, 2, key, f"{key}:users")
+                pipe.execute()
+            compacted += len(expanded)
+        if not cursor:
+            return compacted
+
+def compact_layout(r, batch_size: int = 500, dry_run: bool = False):
+    """Оба шага компактной схемы. Возвращает {"users_compacted", "rooms_compacted"}."""
+    report = {
+        "users_compacted": compact_users(r, batch_size, dry_run),
+        "rooms_compacted": compact_rooms(r, batch_size, dry_run),
+    }
+    logger.info(f"Redis layout compaction{' (dry run)' if dry_run else ''}: {report}")
+    return report
@@ -0,0 +1,151 @@
+"""
+Lua-скрипты RedisStorage. Каждый трогает только ключи одного hash tag'а
+(одной комнаты, одной корзины пользователей или {complaints}), поэтому выполняется
+атомарно и в обычном Redis, и в Redis Cluster, где MULTI/WATCH через
+несколько слотов недоступны.
+
+Скрипты отправляются через EVAL: они короткие, а EVALSHA в pipeline
+кластера потребовал бы отдельной загрузки на каждый узел.
+"""
+
+# KEYS: комната (множество участников). ARGV: user_id, room_size, "1" — создать новую.
+# 1 — место занято, 0 — комнаты нет, она заполнена или (при создании) ID занят.
+JOIN_SEAT = """
+if ARGV[3] == '1' then
+  if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+  redis.call('SADD', KEYS[1], ARGV[1])
+  return 1
+end
+local count = redis.call('SCARD', KEYS[1])
+if count == 0 or count >= tonumber(ARGV[2]) then return 0 end
+redis.call('SADD', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: комната, сообщения, уведомления. ARGV: user_id.
+# Возвращает оставшееся число участников; 0 — комната удалена (или её уже не было).
+LEAVE_SEAT = """
+redis.call('SREM', KEYS[1], ARGV[1])
+local count = redis.call('SCARD', KEYS[1])
+if count == 0 then redis.call('DEL', KEYS[2], KEYS[3]) end
+return count
+"""
+
+# KEYS: комната, сообщения, уведомления.
+# ARGV: число участников при чтении, затем ID призраков. Если комната успела
+# измениться — {"conflict", 0}. Иначе {"deleted", удалено_ключей} или {"ok", живых}.
+REPAIR_ROOM = """
+if redis.call('SCARD', KEYS[1]) ~= tonumber(ARGV[1]) then return {'conflict', 0} end
+for i = 2, #ARGV do
+  if redis.call('SISMEMBER', KEYS[1], ARGV[i]) == 0 then return {'conflict', 0} end
+end
+for i = 2, #ARGV do redis.call('SREM', KEYS[1], ARGV[i]) end
+local live = redis.call('SCARD', KEYS[1])
+if live > 0 then return {'ok', live} end
+local emptied = 0
+if #ARGV > 1 then emptied = 1 end
+return {'deleted', emptied + redis.call('DEL', KEYS[2], KEYS[3])}
+"""
+
+# KEYS: корзина пользователей. ARGV: user_id, комната, которую видел сборщик ("" — без комнаты).
+CLEAR_MEMBERSHIP = """
+local uid = ARGV[1]
+if (redis.call('HGET', KEYS[1], uid .. ':r') or '') ~= ARGV[2] then return 0 end
+redis.call('HDEL', KEYS[1], uid .. ':r', uid .. ':j', uid .. ':s')
+return 1
+"""
+
+# KEYS: комната, её множество участников в прежней схеме ({room:S:N}:users).
+# Переводит комнату в компактную схему: hash со счётчиком удаляется, множество
+# участников становится ключом комнаты. Повторный запуск ничего не меняет.
+COMPACT_ROOM = """
+local changed = 0
+if redis.call('TYPE', KEYS[1]).ok == 'hash' then
+  redis.call('DEL', KEYS[1])
+  changed = 1
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+  redis.call('RENAME', KEYS[2], KEYS[1])
+  changed = 1
+end
+return changed
+"""
+
+# KEYS: жалоба, by_id, by_target, by_reporter, offenders, эпоха затухания, ключ дедупликации.
+# ARGV: complaint_id, now, half_life (сек), эпоха по умолчанию, минимальный вес,
+# порог пересчёта (DECAY_RESCALE_AT), target_user_id, окно дедупликации (сек),
+# затем пары поле/значение.
+# Вес жалобы — 2^((now - эпоха) / half_life); когда показатель доходит до
+# порога, веса рейтинга делятся на 2^k, а эпоха сдвигается на k периодов.
+# Ключ дедупликации ставится последним: жалоба, не дошедшая до записи, не
+# блокирует повтор. Возвращает текущий вес цели строкой (числа Lua в ответе
+# обрезаются до целых) или nil для дубля.
+CREATE_COMPLAINT = """
+if redis.call('EXISTS', KEYS[7]) == 1 then return false end
+local now, half_life = tonumber(ARGV[2]), tonumber(ARGV[3])
+local stored = redis.call('GET', KEYS[6])
+local epoch = tonumber(stored or ARGV[4])
+-- Часы воркера отстают от сохранённой эпохи — считаем жалобу поданной в эпоху
+local exponent = math.max((now - epoch) / half_life, 0)
+if exponent >= tonumber(ARGV[6]) then
+  local shift = math.floor(exponent)
+  redis.call('ZUNIONSTORE', KEYS[5], 1, KEYS[5], 'WEIGHTS', string.format('%.17g', 2 ^ -shift))
+  epoch = epoch + shift * half_life
+  exponent = exponent - shift
+  stored = false
+end
+if not stored then redis.call('SET', KEYS[6], string.format('%.17g', epoch)) end
+
+redis.call('HSET', KEYS[1], unpack(ARGV, 9))
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[1], ARGV[1])
+redis.call('ZADD', KEYS[4], ARGV[1], ARGV[1])
+local weight = 2 ^ exponent
+local score = tonumber(redis.call('ZINCRBY', KEYS[5], string.format('%.17g', weight), ARGV[7]))
+redis.call('ZREMRANGEBYSCORE', KEYS[5], '-inf', string.format('%.17g', tonumber(ARGV[5]) * weight))
+redis.call('SET', KEYS[7], '1', 'EX', ARGV[8])
+return string.format('%.17g', score / weight)
+"""
+
+# KEYS: жалоба. ARGV: пары поле/значение. 1 — обновлена, 0 — жалобы нет
+# (удалённая или архивированная жалоба не воскресает неполным hash'ем).
+UPDATE_COMPLAINT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# KEYS: жалоба, индекс решённых. ARGV: complaint_id, resolved_at. 1 — готово, 0 — жалобы нет.
+RESOLVE_COMPLAINT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[1], 'status', 'resolved', 'resolved_at', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[1])
+return 1
+"""
+
+# KEYS: by_id, индекс решённых, затем тройки (жалоба, by_target, by_reporter).
+# ARGV: complaint_id по порядку троек.
+DELETE_COMPLAINTS = """
+for i, cid in ipairs(ARGV) do
+  local base = 2 + (i - 1) * 3
+  redis.call('DEL', KEYS[base + 1])
+  redis.call('ZREM', KEYS[1], cid)
+  redis.call('ZREM', KEYS[2], cid)
+  redis.call('ZREM', KEYS[base + 2], cid)
+  redis.call('ZREM', KEYS[base + 3], cid)
+end
+return #ARGV
+"""
+
+# KEYS: лок. ARGV: токен владельца, ttl (сек). 1 — продлён, 0 — лок чужой или истёк.
+EXTEND_LOCK = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS: лок. ARGV: токен владельца. 1 — снят, 0 — лок чужой или истёк.
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+return redis.call('DEL', KEYS[1])
+"""
@@ -0,0 +1,639 @@
+import logging
+import random
+import re
+import time
+import uuid
+import redis
+from core.metrics import REDIS_TOLERANT_READS
+from core.redis_client import get_redis_client, get_redis_replica, is_cluster_client, RedisUnavailableError
+from core.storage import redis_scripts
+from core.storage.base import ChatStorage, DECAY_RESCALE_AT, ROOM_SIZES, notification_id_after
+
+logger = logging.getLogger(__name__)
+
+# Схема ключей. Часть в {} — hash tag: в Redis Cluster слот считается только
+# по ней, поэтому все ключи одной комнаты, одной корзины пользователей и все
+# жалобы лежат в одном слоте и меняются атомарно одним Lua-скриптом (redis_scripts).
+# ID комнаты для клиентов прежний — "room:3:123456", он и есть тег.
+#   {room:S:N}                  set     id участников; размер комнаты S — из ID,
+#                                       число участников — SCARD (без счётчика)
+#   {room:S:N}:messages         list    "username:message:timestamp"
+#   {room:S:N}:notifications    stream  message, created_at (MAXLEN, EXPIRE)
+#   {rooms:S}                   set     комнаты данного размера
+#   {users:B}                   hash    корзина из USER_BUCKET_SIZE пользователей,
+#                                       B = user_id // USER_BUCKET_SIZE; поля
+#                                       "ID:r" комната, "ID:j" joined_at,
+#                                       "ID:s" seen_at (unix-время heartbeat),
+#                                       "ID:b" "1", если заблокирован
+#   {complaints}:complaint:ID   hash    поля жалобы
+#   {complaints}:by_id | by_target:ID | by_reporter:ID  zset, score = complaint_id
+#   {complaints}:resolved       zset    решённые жалобы для архиватора, score = complaint_id
+#   {complaints}:offenders      zset    вес жалоб на пользователя (forward decay)
+#   {complaints}:decay_epoch    str     эпоха затухания рейтинга (DECAY_RESCALE_AT)
+#   {complaints}:id_counter     str     последний complaint_id
+#   {complaints}:all            set     старый индекс жалоб (до reindex-complaints)
+#   {complaints}:dedupe:KEY     str     окно дедупликации репортёр/цель/сообщение
+#   lock:NAME                   str     локи фоновых задач, значение — токен владельца
+#   generation:NAME             str     счётчик поколения для сброса кэшей воркеров
+#   replica:heartbeat           str     счётчик для оценки отставания реплики (redis_client)
+# Маленькие hash Redis хранит компактно (listpack), пока в них не больше
+# hash-max-listpack-entries полей (по умолчанию 128): 32 пользователя по 4 поля
+# укладываются в этот порог, поэтому USER_BUCKET_SIZE менять нельзя без миграции.
+# Старые схемы переносит flask migrate-redis-keys (redis_migration).
+USER_BUCKET_SIZE = 32
+COMPLAINTS_TAG = "{complaints}"
+COMPLAINTS_BY_ID = f"{COMPLAINTS_TAG}:by_id"
+COMPLAINTS_RESOLVED = f"{COMPLAINTS_TAG}:resolved"
+LEGACY_COMPLAINTS_SET = f"{COMPLAINTS_TAG}:all"
+OFFENDERS_KEY = f"{COMPLAINTS_TAG}:offenders"
+DECAY_EPOCH_KEY = f"{COMPLAINTS_TAG}:decay_epoch"
+COMPLAINT_COUNTER_KEY = f"{COMPLAINTS_TAG}:id_counter"
+
+def room_key(room_id: str) -> str:
+    return "{" + room_id + "}"
+
+def room_keys(room_id: str):
+    """Участники, сообщения, уведомления — в этом порядке."""
+    key = room_key(room_id)
+    return [key, f"{key}:messages", f"{key}:notifications"]
+
+def rooms_index_key(room_size) -> str:
+    return f"{{rooms:{room_size}}}"
+
+def user_bucket_key(user_id) -> str:
+    return f"{{users:{int(user_id) // USER_BUCKET_SIZE}}}"
+
+def user_field(user_id, attr: str) -> str:
+    """Поле пользователя в корзине: r — комната, j — joined_at, s — seen_at, b — блокировка."""
+    return f"{user_id}:{attr}"
+
+def complaint_key(complaint_id) -> str:
+    return f"{COMPLAINTS_TAG}:complaint:{complaint_id}"
+
+def _dedupe_key(dedupe_key: str) -> str:
+    return f"{COMPLAINTS_TAG}:dedupe:{dedupe_key}"
+
+def _by_target_key(user_id) -> str:
+    return f"{COMPLAINTS_TAG}:by_target:{user_id}"
+
+def _by_reporter_key(user_id) -> str:
+    return f"{COMPLAINTS_TAG}:by_reporter:{user_id}"
+
+_USER_BUCKET_KEY = re.compile(r"^\{users:\d+\}$")
+_ROOM_KEY = re.compile(r"^\{(room:\d+:\d+)\}")
+_ROOM_SET_KEY = re.compile(r"^\{rooms:(\d+)\}$")
+
+def _read_notifications(client, room_id: str, after_id, limit: int):
+    """XRANGE с курсора или хвост через XREVRANGE; client — соединение или pipeline."""
+    key = f"{room_key(room_id)}:notifications"
+    if after_id is None:
+        return client.xrevrange(key, "+", "-", count=limit)
+    return client.xrange(key, notification_id_after(after_id), "+", count=limit)
+
+def _notification_entries(entries, reverse: bool):
+    if reverse:
+        entries = list(reversed(entries))
+    return [{"id": entry_id, "message": fields.get("message"), "created_at": fields.get("created_at")}
+            for entry_id, fields in entries]
+
+def _room_size(room_id: str) -> int:
+    _, size_str, _ = room_id.split(":")
+    return int(size_str)
+
+def _eval(client, script: str, keys, args=()):
+    """EVAL на соединении или в pipeline (в кластере — на узле слота keys)."""
+    return client.eval(script, len(keys), *keys, *args)
+
+def scan_page(r, cursor, match: str, count: int):
+    """
+    SCAN с непрозрачным курсором (0 — начать, 0 в ответе — обход закончен).
+    В кластере обходит мастера по очереди: курсор — (номер узла, курсор узла).
+    """
+    if not is_cluster_client(r):
+        return r.scan(cursor=cursor, match=match, count=count)
+
+    nodes = sorted(r.get_primaries(), key=lambda node: node.name)
+    node_index, node_cursor = cursor or (0, 0)
+    node = nodes[node_index]
+    cursors, keys = r.scan(cursor=node_cursor, match=match, count=count, target_nodes=node)
+    node_cursor = cursors[node.name]
+    if node_cursor == 0:
+        node_index += 1
+    next_cursor = (node_index, node_cursor) if node_index < len(nodes) else 0
+    return next_cursor, keys
+
+def scan_keys(r, match: str, count: int):
+    cursor = 0
+    while True:
+        cursor, keys = scan_page(r, cursor, match, count)
+        yield from keys
+        if not cursor:
+            return
+
+class RedisStorage(ChatStorage):
+    """
+    Хранилище поверх Redis (общий пул из core.redis_client) — одиночного
+    или кластера (REDIS_MODE=cluster). Транзакции MULTI/WATCH не используются:
+    в кластере их нет, атомарность в пределах слота дают Lua-скрипты.
+
+    client — свой клиент вместо общего пула (например, на отдельную базу
+    для проверок); реплика тогда не используется.
+    """
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def _client(self):
+        if self.client is not None:
+            return self.client
+        r = get_redis_client()
+        if r is None:
+            raise RedisUnavailableError("Cannot connect to Redis")
+        return r
+
+    def _read(self, stale_ok: bool, read):
+        """
+        read(client) на реплике, если stale_ok и реплика не отстаёт (см.
+        get_redis_replica), иначе на мастере. Сбой соединения с репликой —
+        повтор на мастере, чтобы запрос не падал из-за неё.
+        """
+        if not stale_ok or self.client is not None:
+            return read(self._client())
+        replica = get_redis_replica()
+        if replica is not None:
+            try:
+                result = read(replica)
+                REDIS_TOLERANT_READS.inc(("replica",))
+                return result
+            except (redis.ConnectionError, redis.TimeoutError, RedisUnavailableError) as e:
+                logger.warning(f"Replica read failed, falling back to primary: {e}")
+        REDIS_TOLERANT_READS.inc(("primary",))
+        return read(self._client())
+
+    # --- Комнаты и участники ---
+
+    def get_user_room(self, user_id: int):
+        return self._client().hget(user_bucket_key(user_id), user_field(user_id, "r"))
+
+    def get_membership(self, user_id: int):
+        room_id, joined_at, seen_at = self._client().hmget(
+            user_bucket_key(user_id), [user_field(user_id, attr) for attr in "rjs"])
+        if not room_id:
+            return None
+        return {"room": room_id, "joined_at": joined_at, "seen_at": float(seen_at) if seen_at else None}
+
+    def touch_membership(self, user_id: int, seen_at: float):
+        self._client().hset(user_bucket_key(user_id), user_field(user_id, "s"), seen_at)
+
+    def get_room_info(self, room_id: str):
+        current = self._client().scard(room_key(room_id))
+        if not current:
+            return None
+        return {"max_users": _room_size(room_id), "current_users": current}
+
+    def get_room_members(self, room_id: str, stale_ok: bool = False):
+        return [int(uid) for uid in self._read(stale_ok, lambda r: r.smembers(room_key(room_id)))]
+
+    def join_room(self, user_id: int, room_size: int, joined_at: str):
+        r = self._client()
+        index_key = rooms_index_key(room_size)
+        available_rooms = list(r.smembers(index_key))
+
+        # Заполненность всех кандидатов — одним pipeline вместо SCARD на комнату
+        open_rooms = []
+        if available_rooms:
+            pipe = r.pipeline(transaction=False)
+            for room_id in available_rooms:
+                pipe.scard(room_key(room_id))
+            for room_id, current in zip(available_rooms, pipe.execute()):
+                if 0 < current < room_size:
+                    open_rooms.append(room_id)
+
+        # Место занимается скриптом в слоте комнаты: проверка заполненности и
+        # SADD атомарны, поэтому параллельные входы не переполнят комнату
+        chosen_room = None
+        for room_id in open_rooms:
+            if _eval(r, redis_scripts.JOIN_SEAT, [room_key(room_id)], (user_id, room_size, 0)):
+                chosen_room = room_id
+                break
+
+        created = chosen_room is None
+        while chosen_room is None:
+            room_id = f"room:{room_size}:{random.randint(100000, 999999)}"
+            if _eval(r, redis_scripts.JOIN_SEAT, [room_key(room_id)], (user_id, room_size, 1)):
+                chosen_room = room_id
+
+        # Остальное — в других слотах; при сбое между шагами расхождение
+        # (участник без записи, комната вне индекса) чинит сборщик комнат
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(user_bucket_key(user_id), mapping={
+            user_field(user_id, "r"): chosen_room,
+            user_field(user_id, "j"): joined_at,
+            user_field(user_id, "s"): time.time(),
+        })
+        if created:
+            pipe.sadd(index_key, chosen_room)
+        pipe.execute()
+        return chosen_room, created
+
+    def room_stats(self):
+        # Размеры комнат фиксированы (ROOM_SIZES), поэтому индексы читаются
+        # напрямую, без SCAN по всему keyspace
+        r = self._client()
+        pipe = r.pipeline(transaction=False)
+        for room_size in ROOM_SIZES:
+            pipe.smembers(rooms_index_key(room_size))
+        indexes = dict(zip(ROOM_SIZES, pipe.execute()))
+
+        stats = {room_size: {"rooms": 0, "waiting_users": 0} for room_size in ROOM_SIZES}
+        rooms = [(room_size, room_id) for room_size, room_ids in indexes.items() for room_id in room_ids]
+        if not rooms:
+            return stats
+        pipe = r.pipeline(transaction=False)
+        for _, room_id in rooms:
+            pipe.scard(room_key(room_id))
+        for (room_size, _), current in zip(rooms, pipe.execute()):
+            if not current:
+                continue
+            entry = stats[room_size]
+            entry["rooms"] += 1
+            if current < room_size:
+                entry["waiting_users"] += current
+        return stats
+
+    def leave_room(self, user_id: int):
+        memberships, deleted = self.leave_rooms([user_id])
+        room_id = memberships.get(user_id)
+        return room_id, room_id in deleted
+
+    def leave_rooms(self, user_ids):
+        r = self._client()
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}, set()
+
+        pipe = r.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hget(user_bucket_key(user_id), user_field(user_id, "r"))
+        memberships = {
+            user_id: room_id
+            for user_id, room_id in zip(user_ids, pipe.execute()) if room_id
+        }
+        if not memberships:
+            return {}, set()
+
+        items = list(memberships.items())
+        pipe = r.pipeline(transaction=False)
+        for user_id, room_id in items:
+            _eval(pipe, redis_scripts.LEAVE_SEAT, room_keys(room_id), (user_id,))
+            pipe.hdel(user_bucket_key(user_id), *(user_field(user_id, attr) for attr in "rjs"))
+        replies = pipe.execute()
+
+        # Последний ответ скрипта по комнате — итоговое число участников;
+        # пустую комнату скрипт уже удалил вместе с историей и уведомлениями
+        remaining = {}
+        for (user_id, room_id), count in zip(items, replies[0::2]):
+            remaining[room_id] = int(count)
+
+        empty_rooms = {room_id for room_id, count in remaining.items() if count <= 0}
+        if empty_rooms:
+            pipe = r.pipeline(transaction=False)
+            for room_id in empty_rooms:
+                pipe.srem(rooms_index_key(_room_size(room_id)), room_id)
+            pipe.execute()
+
+        return memberships, empty_rooms
+
+    # --- Сборщик мусора комнат ---
+
+    def scan_memberships(self, cursor, count: int):
+        r = self._client()
+        cursor, keys = scan_page(r, cursor, "{users:*}", count)
+        buckets = [key for key in keys if _USER_BUCKET_KEY.match(key)]
+        if not buckets:
+            return cursor, []
+
+        pipe = r.pipeline(transaction=False)
+        for key in buckets:
+            pipe.hgetall(key)
+        users = {}
+        for fields in pipe.execute():
+            for field, value in fields.items():
+                user_id, _, attr = field.partition(":")
+                users.setdefault(int(user_id), {})[attr] = value
+
+        rooms = sorted({record["r"] for record in users.values() if record.get("r")})
+        pipe = r.pipeline(transaction=False)
+        for room_id in rooms:
+            pipe.exists(room_key(room_id))
+        existing = {room_id for room_id, exists in zip(rooms, pipe.execute()) if exists}
+
+        entries = []
+        for user_id, record in sorted(users.items()):
+            room_id, seen_at = record.get("r"), record.get("s")
+            if not room_id and not seen_at:
+                continue  # только флаг блокировки
+            entries.append({"user_id": user_id, "room": room_id,
+                            "seen_at": float(seen_at) if seen_at else None,
+                            "room_exists": room_id in existing})
+        return cursor, entries
+
+    def clear_memberships(self, memberships):
+        memberships = list(memberships)
+        if not memberships:
+            return 0
+        # Скрипт стирает запись, только если комната в ней та же, что видел сборщик
+        pipe = self._client().pipeline(transaction=False)
+        for user_id, room_id in memberships:
+            _eval(pipe, redis_scripts.CLEAR_MEMBERSHIP, [user_bucket_key(user_id)], (user_id, room_id or ""))
+        return sum(pipe.execute())
+
+    def scan_rooms(self, cursor, count: int):
+        r = self._client()
+        cursor, keys = scan_page(r, cursor, "{room*", count)
+        room_ids = []
+        for key in keys:
+            match = _ROOM_KEY.match(key)
+            if match:
+                room_ids.append(match.group(1))
+            elif _ROOM_SET_KEY.match(key):
+                # Индекс по размеру тоже читаем порциями — SSCAN, а не SMEMBERS
+                room_ids.extend(r.sscan_iter(key, count=count))
+        return cursor, list(dict.fromkeys(room_ids))
+
+    def repair_rooms(self, room_ids):
+        # Число участников — SCARD множества, поэтому дрейфа счётчика нет:
+        # drift_fixed у Redis всегда 0
+        r = self._client()
+        report = {"ghost_members": 0, "drift_fixed": 0, "rooms_deleted": set(), "conflicts": 0}
+        for room_id in room_ids:
+            keys = room_keys(room_id)
+            members = list(r.smembers(keys[0]))
+
+            owners = []
+            if members:
+                pipe = r.pipeline(transaction=False)
+                for member in members:
+                    pipe.hget(user_bucket_key(member), user_field(member, "r"))
+                owners = pipe.execute()
+            ghosts = [m for m, owner in zip(members, owners) if owner != room_id]
+
+            # Скрипт сверяет, что комната не изменилась с момента чтения (вместо WATCH)
+            status, value = _eval(r, redis_scripts.REPAIR_ROOM, keys, (len(members), *ghosts))
+            if status == "conflict":
+                report["conflicts"] += 1
+                continue
+
+            report["ghost_members"] += len(ghosts)
+            if status == "deleted":
+                removed_from_index = r.srem(rooms_index_key(_room_size(room_id)), room_id)
+                if int(value) or removed_from_index:
+                    report["rooms_deleted"].add(room_id)
+        return report
+
+    # --- Сообщения и уведомления ---
+
+    def append_message(self, room_id: str, record: str):
+        self._client().rpush(f"{room_key(room_id)}:messages", record)
+
+    def get_messages(self, room_id: str, stale_ok: bool = False):
+        return self._read(stale_ok, lambda r: r.lrange(f"{room_key(room_id)}:messages", 0, -1))
+
+    def push_notification(self, room_id: str, message: str, created_at: str,
+                          max_len: int, ttl: int) -> str:
+        key = f"{room_key(room_id)}:notifications"
+        pipe = self._client().pipeline(transaction=False)
+        # Точная обрезка: лента маленькая, а «~» до заполнения узла не режет вовсе
+        pipe.xadd(key, {"message": message, "created_at": created_at}, maxlen=max_len, approximate=False)
+        if ttl:
+            pipe.expire(key, ttl)
+        return pipe.execute()[0]
+
+    def get_notifications(self, room_id: str, after_id: str = None, limit: int = 50):
+        entries = _read_notifications(self._client(), room_id, after_id, limit)
+        return _notification_entries(entries, reverse=after_id is None)
+
+    def drop_legacy_notifications(self, batch_size: int = 500):
+        """
+        Только для Redis: удаляет ленты уведомлений старого формата (list),
+        которые никто не читал и не обрезал. Возвращает число удалённых ключей.
+        """
+        r = self._client()
+        dropped = 0
+        keys = []
+        for key in scan_keys(r, "{room:*}:notifications", batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                dropped += self._drop_lists(r, keys)
+                keys = []
+        if keys:
+            dropped += self._drop_lists(r, keys)
+        logger.info(f"Legacy notification lists dropped: {dropped}")
+        return dropped
+
+    @staticmethod
+    def _drop_lists(r, keys):
+        pipe = r.pipeline(transaction=False)
+        for key in keys:
+            pipe.type(key)
+        lists = [key for key, key_type in zip(keys, pipe.execute()) if key_type == "list"]
+        if lists:
+            pipe = r.pipeline(transaction=False)
+            for key in lists:
+                pipe.delete(key)
+            pipe.execute()
+        return len(lists)
+
+    def get_session_state(self, user_id: int, message_limit: int, notification_limit: int,
+                          notifications_after: str = None):
+        r = self._client()
+        state = {"blocked": False, "room": None, "joined_at": None,
+                 "room_info": None, "messages": [], "notifications": []}
+
+        # Комната, вход и блокировка — поля одной корзины, одна команда
+        room_id, joined_at, blocked = r.hmget(user_bucket_key(user_id),
+                                              [user_field(user_id, attr) for attr in "rjb"])
+        state["blocked"] = blocked == "1"
+        if state["blocked"] or not room_id:
+            return state
+
+        # Ключи комнаты известны только после первого ответа — второй round trip
+        pipe = r.pipeline(transaction=False)
+        pipe.scard(room_key(room_id))
+        pipe.lrange(f"{room_key(room_id)}:messages", -message_limit, -1)
+        _read_notifications(pipe, room_id, notifications_after, notification_limit)
+        current, messages, notifications = pipe.execute()
+
+        state.update(room=room_id, joined_at=joined_at, messages=messages,
+                     notifications=_notification_entries(notifications, reverse=notifications_after is None))
+        if current:
+            state["room_info"] = {"max_users": _room_size(room_id), "current_users": current}
+        return state
+
+    # --- Блокировки ---
+
+    def is_blocked(self, user_id: int, stale_ok: bool = False) -> bool:
+        key, field = user_bucket_key(user_id), user_field(user_id, "b")
+        return self._read(stale_ok, lambda r: r.hget(key, field)) == "1"
+
+    def set_blocked(self, user_ids, blocked: bool):
+        # Флаг — поле в корзине пользователя: одна команда на корзину, одним pipeline
+        buckets = {}
+        for user_id in user_ids:
+            buckets.setdefault(user_bucket_key(user_id), []).append(user_field(user_id, "b"))
+        if not buckets:
+            return
+        pipe = self._client().pipeline(transaction=False)
+        for key, fields in buckets.items():
+            if blocked:
+                pipe.hset(key, mapping=dict.fromkeys(fields, "1"))
+            else:
+                pipe.hdel(key, *fields)
+        pipe.execute()
+
+    # --- Жалобы ---
+
+    @staticmethod
+    def _index_complaint(pipe, complaint_id, reporter_id, target_user_id):
+        pipe.zadd(COMPLAINTS_BY_ID, {complaint_id: complaint_id})
+        pipe.zadd(_by_target_key(target_user_id), {complaint_id: complaint_id})
+        pipe.zadd(_by_reporter_key(reporter_id), {complaint_id: complaint_id})
+
+    def create_complaint(self, data: dict, dedupe_key: str, dedupe_ttl: int,
+                         now: float, half_life: float, default_epoch: float, min_score: float):
+        r = self._client()
+        # Дубль отсекаем до INCR, чтобы не тратить id; окончательно его проверяет скрипт
+        if r.exists(_dedupe_key(dedupe_key)):
+            return None, None
+
+        complaint_id = r.incr(COMPLAINT_COUNTER_KEY)
+        target_user_id = data["target_user_id"]
+
+        # Дедупликация, hash жалобы, индексы и рейтинг с его эпохой — одним
+        # скриптом в слоте {complaints}: при сбое не остаётся ключа дубля без жалобы
+        keys = [complaint_key(complaint_id), COMPLAINTS_BY_ID, _by_target_key(target_user_id),
+                _by_reporter_key(data["reporter_id"]), OFFENDERS_KEY, DECAY_EPOCH_KEY,
+                _dedupe_key(dedupe_key)]
+        fields = [item for pair in data.items() for item in pair]
+        score = _eval(r, redis_scripts.CREATE_COMPLAINT, keys,
+                      (complaint_id, now, half_life, default_epoch, min_score, DECAY_RESCALE_AT,
+                       target_user_id, dedupe_ttl, *fields))
+        if score is None:
+            return None, None
+        return complaint_id, float(score)
+
+    def list_complaint_ids(self, after_id: int = None, limit: int = 50,
+                           target_user_id: int = None, reporter_id: int = None,
+                           stale_ok: bool = False):
+        if target_user_id is not None:
+            index_key = _by_target_key(target_user_id)
+        elif reporter_id is not None:
+            index_key = _by_reporter_key(reporter_id)
+        else:
+            index_key = COMPLAINTS_BY_ID
+
+        min_score = f"({after_id}" if after_id is not None else "-inf"
+        ids = self._read(stale_ok, lambda r: r.zrangebyscore(index_key, min_score, "+inf", start=0, num=limit))
+        return [int(cid) for cid in ids]
+
+    def get_complaints(self, complaint_ids, stale_ok: bool = False):
+        complaint_ids = list(complaint_ids)
+        if not complaint_ids:
+            return []
+
+        def read(r):
+            pipe = r.pipeline(transaction=False)
+            for cid in complaint_ids:
+                pipe.hgetall(complaint_key(cid))
+            return pipe.execute()
+        return [data or None for data in self._read(stale_ok, read)]
+
+    def update_complaint(self, complaint_id: int, fields: dict) -> bool:
+        # Проверка и запись — одним скриптом: между EXISTS и HSET жалобу мог удалить архиватор
+        args = [item for pair in fields.items() for item in pair]
+        return bool(_eval(self._client(), redis_scripts.UPDATE_COMPLAINT, [complaint_key(complaint_id)], args))
+
+    def resolve_complaint(self, complaint_id: int, resolved_at: str) -> bool:
+        keys = [complaint_key(complaint_id), COMPLAINTS_RESOLVED]
+        return bool(_eval(self._client(), redis_scripts.RESOLVE_COMPLAINT, keys, (complaint_id, resolved_at)))
+
+    def list_resolved_complaint_ids(self, after_id: int = None, limit: int = 50):
+        min_score = f"({after_id}" if after_id is not None else "-inf"
+        ids = self._client().zrangebyscore(COMPLAINTS_RESOLVED, min_score, "+inf", start=0, num=limit)
+        return [int(cid) for cid in ids]
+
+    def delete_complaints(self, complaints):
+        complaints = list(complaints)
+        if not complaints:
+            return
+        keys = [COMPLAINTS_BY_ID, COMPLAINTS_RESOLVED]
+        for complaint_id, reporter_id, target_user_id in complaints:
+            keys += [complaint_key(complaint_id), _by_target_key(target_user_id), _by_reporter_key(reporter_id)]
+        _eval(self._client(), redis_scripts.DELETE_COMPLAINTS, keys,
+              [complaint_id for complaint_id, _, _ in complaints])
+
+    def top_offenders(self, limit: int, now: float, half_life: float, default_epoch: float,
+                      stale_ok: bool = False):
+        def read(r):
+            # Эпоха до и после чтения совпадает — между ними не было пересчёта
+            while True:
+                pipe = r.pipeline(transaction=False)
+                pipe.get(DECAY_EPOCH_KEY)
+                pipe.zrevrange(OFFENDERS_KEY, 0, limit - 1, withscores=True)
+                pipe.get(DECAY_EPOCH_KEY)
+                epoch, rows, epoch_after = pipe.execute()
+                if epoch == epoch_after:
+                    return float(epoch or default_epoch), rows
+
+        epoch, rows = self._read(stale_ok, read)
+        # Затухание до нуля даёт 0.0, а не OverflowError
+        scale = 2.0 ** -max((now - epoch) / half_life, 0.0)
+        return [(int(user_id), raw * scale) for user_id, raw in rows]
+
+    def rebuild_complaint_indexes(self, batch_size: int = 500):
+        """
+        Только для Redis: переносит жалобы из старого множества {complaints}:all
+        в sorted set-индексы пачками через SSCAN. Возвращает число жалоб.
+        """
+        r = self._client()
+        migrated = 0
+        cursor = 0
+        while True:
+            cursor, ids = r.sscan(LEGACY_COMPLAINTS_SET, cursor=cursor, count=batch_size)
+            if ids:
+                pipe = r.pipeline(transaction=False)
+                for cid in ids:
+                    pipe.hmget(complaint_key(cid), "reporter_id", "target_user_id")
+                owners = pipe.execute()
+
+                pipe = r.pipeline(transaction=False)
+                for cid, (reporter_id, target_user_id) in zip(ids, owners):
+                    if reporter_id is None and target_user_id is None:
+                        continue
+                    self._index_complaint(pipe, int(cid), reporter_id, target_user_id)
+                    migrated += 1
+                pipe.execute()
+            if cursor == 0:
+                break
+
+        r.delete(LEGACY_COMPLAINTS_SET)
+        logger.info(f"Complaint indexes rebuilt: {migrated} complaints")
+        return migrated
+
+    # --- Служебное ---
+
+    def acquire_lock(self, name: str, ttl: int):
+        token = uuid.uuid4().hex
+        return token if self._client().set(f"lock:{name}", token, nx=True, ex=ttl) else None
+
+    def extend_lock(self, name: str, token: str, ttl: int) -> bool:
+        return bool(_eval(self._client(), redis_scripts.EXTEND_LOCK, [f"lock:{name}"], (token, ttl)))
+
+    def release_lock(self, name: str, token: str) -> bool:
+        return bool(_eval(self._client(), redis_scripts.RELEASE_LOCK, [f"lock:{name}"], (token,)))
+
+    def get_generation(self, name: str) -> int:
+        return int(self._client().get(f"generation:{name}") or 0)
+
+    def bump_generation(self, name: str) -> int:
+        return self._client().incr(f"generation:{name}")
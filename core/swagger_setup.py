@@ -0,0 +1,62 @@
+import json
+import logging
+import os
+from config.swagger import swagger_config, swagger_template
+
+logger = logging.getLogger(__name__)
+
+SWAGGER_MODES = ("dynamic", "static", "off")
+
+def _spec_path() -> str:
+    return os.environ.get("SWAGGER_SPEC_PATH") or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "swagger_spec.json"
+    )
+
+def build_swagger_spec(app) -> dict:
+    """
+    Собирает спецификацию из YAML-docstring'ов контроллеров (как flasgger
+    делает при первом заходе на /apidocs), не регистрируя Swagger в приложении.
+    """
+    from flasgger import Swagger
+
+    swagger = Swagger(config=swagger_config, template=swagger_template)
+    swagger.app = app
+    with app.app_context():
+        return swagger.get_apispecs(swagger_config["specs"][0]["endpoint"])
+
+def write_swagger_spec(app, path: str = None) -> str:
+    path = path or _spec_path()
+    spec = build_swagger_spec(app)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, ensure_ascii=False, indent=1, sort_keys=True)
+    return path
+
+def init_swagger(app):
+    """
+    SWAGGER_MODE:
+      dynamic — flasgger разбирает docstring'и при первом запросе /apidocs;
+      static  — отдаётся готовый файл SWAGGER_SPEC_PATH (flask build-swagger),
+                docstring'и не разбираются вовсе;
+      off     — без Swagger и без импорта flasgger.
+    """
+    mode = os.environ.get("SWAGGER_MODE", "dynamic").lower()
+    if mode not in SWAGGER_MODES:
+        raise ValueError(f"Unknown SWAGGER_MODE: {mode}")
+    if mode == "off":
+        return None
+
+    from flasgger import Swagger
+
+    if mode == "dynamic":
+        return Swagger(app, config=swagger_config, template=swagger_template)
+
+    path = _spec_path()
+    if not os.path.exists(path):
+        logger.error(f"Swagger spec not found at {path}; run 'flask build-swagger'. Swagger is disabled")
+        return None
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+
+    # Ни одно правило не проходит фильтр — пути берутся только из готового файла
+    config = dict(swagger_config, specs=[dict(swagger_config["specs"][0], rule_filter=lambda rule: False)])
+    return Swagger(app, config=config, template=spec)
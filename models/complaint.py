@@ -0,0 +1,37 @@
+from core.database import db
+
+class ArchivedComplaint(db.Model):
+    """
+    Архив жалоб: решённые и устаревшие жалобы, перенесённые из Redis.
+    """
+    __tablename__ = 'archived_complaints'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # complaint_id из Redis
+    reporter_id = db.Column(db.Integer, nullable=False)
+    target_user_id = db.Column(db.Integer, nullable=False)
+    message_id = db.Column(db.String(128), nullable=True)
+    reason = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='open')  # 'open', 'resolved'
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        # Keyset-пагинация по id в пределах пользователя
+        db.Index('ix_archived_complaints_target_id', 'target_user_id', 'id'),
+        db.Index('ix_archived_complaints_reporter_id', 'reporter_id', 'id'),
+    )
+
+    def to_dict(self) -> dict:
+        # Формат совпадает с активными жалобами из Redis
+        return {
+            "complaint_id": self.id,
+            "reporter_id": str(self.reporter_id),
+            "target_user_id": str(self.target_user_id),
+            "message_id": self.message_id or "",
+            "reason": self.reason or "",
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "resolved_at": self.resolved_at.isoformat() if self.resolved_at else "",
+            "archived": True,
+        }
@@ -1,6 +1,33 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 from core.database import db
 from werkzeug.security import generate_password_hash, check_password_hash
 
+logger = logging.getLogger(__name__)
+
+# FTS5-таблица с trigram-токенизатором для нечёткого поиска по username.
+# External content: сами строки хранятся в users, здесь только индекс.
+USERNAME_TRIGRAM_TABLE = "users_username_trgm"
+
+USERNAME_SEARCH_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {USERNAME_TRIGRAM_TABLE}
+        USING fts5(username, content='users', content_rowid='id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_trgm_ai AFTER INSERT ON users BEGIN
+        INSERT INTO {USERNAME_TRIGRAM_TABLE}(rowid, username) VALUES (new.id, new.username);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_trgm_ad AFTER DELETE ON users BEGIN
+        INSERT INTO {USERNAME_TRIGRAM_TABLE}({USERNAME_TRIGRAM_TABLE}, rowid, username)
+        VALUES ('delete', old.id, old.username);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_trgm_au AFTER UPDATE OF username ON users BEGIN
+        INSERT INTO {USERNAME_TRIGRAM_TABLE}({USERNAME_TRIGRAM_TABLE}, rowid, username)
+        VALUES ('delete', old.id, old.username);
+        INSERT INTO {USERNAME_TRIGRAM_TABLE}(rowid, username) VALUES (new.id, new.username);
+    END""",
+]
+
 class User(db.Model):
     __tablename__ = 'users'
 
@@ -8,7 +35,7 @@ class User(db.Model):
     login = db.Column(db.String(50), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     telegram_id = db.Column(db.String(50), unique=True, nullable=True)
-    username = db.Column(db.String(50), nullable=False)
+    username = db.Column(db.String(50), nullable=False, index=True)
     role = db.Column(db.String(20), default='user')  # 'user', 'admin', ...
 
     def set_password(self, password):
@@ -16,3 +43,31 @@ class User(db.Model):
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
+
+def ensure_username_search_index(engine) -> bool:
+    """
+    Создаёт индексы для поиска по username (B-tree для префиксов и
+    FTS5 trigram для нечёткого поиска). Возвращает True, если trigram-индекс доступен.
+    Для уже существующих баз индекс заполняется один раз через 'rebuild'.
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+
+    with engine.begin() as conn:
+        conn.execute(text(USERNAME_SEARCH_DDL[0]))
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+            {"name": USERNAME_TRIGRAM_TABLE}
+        ).first()
+        try:
+            for statement in USERNAME_SEARCH_DDL[1:]:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(
+                    f"INSERT INTO {USERNAME_TRIGRAM_TABLE}({USERNAME_TRIGRAM_TABLE}) VALUES ('rebuild')"
+                ))
+        except OperationalError as e:
+            # SQLite без FTS5/trigram (< 3.34) — остаётся только префиксный поиск
+            logger.warning(f"Trigram username index is unavailable: {e}")
+            return False
+    return True
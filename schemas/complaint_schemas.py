@@ -1,6 +1,26 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate, EXCLUDE
 
 class CreateComplaintSchema(Schema):
     target_user_id = fields.Int(required=True, description="ID пользователя, на кого жалуются")
     message_id = fields.Str(required=False, allow_none=True, description="ID сообщения или иной идентификатор")
     reason = fields.Str(required=False, allow_none=True, description="Причина жалобы")
+
+class ListComplaintsSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    after_id = fields.Int(load_default=None, validate=validate.Range(min=0),
+                          description="Вернуть жалобы с complaint_id больше этого")
+    limit = fields.Int(load_default=50, validate=validate.Range(min=1, max=500),
+                       description="Размер страницы (1..500)")
+    target_user_id = fields.Int(load_default=None, description="Только жалобы на этого пользователя")
+    reporter_id = fields.Int(load_default=None, description="Только жалобы от этого пользователя")
+    source = fields.Str(load_default="active", validate=validate.OneOf(["active", "archive"]),
+                        description="active — очередь в Redis, archive — архив в SQLite")
+
+class TopOffendersSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    limit = fields.Int(load_default=20, validate=validate.Range(min=1, max=100),
+                       description="Сколько пользователей вернуть")
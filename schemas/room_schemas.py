@@ -1,4 +1,5 @@
-from marshmallow import Schema, fields, ValidationError, validates_schema
+from marshmallow import Schema, fields, validate, ValidationError, validates_schema, EXCLUDE
+from core.storage.base import ROOM_SIZES
 
 class JoinRoomSchema(Schema):
     room_size = fields.Int(required=True)
@@ -6,5 +7,29 @@ class JoinRoomSchema(Schema):
     @validates_schema
     def validate_room_size(self, data, **kwargs):
         size = data["room_size"]
-        if size < 2 or size > 10:
-            raise ValidationError("room_size must be from 2 to 10", field_name='room_size')
+        if size not in ROOM_SIZES:
+            raise ValidationError(f"room_size must be from {ROOM_SIZES[0]} to {ROOM_SIZES[-1]}",
+                                  field_name='room_size')
+
+# ID уведомления "<ms>-<seq>" или "0" — с самого начала ленты
+NOTIFICATION_CURSOR = validate.Regexp(r"^(0|\d+-\d+)$", error="Invalid notification cursor")
+
+class NotificationsQuerySchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    after = fields.Str(load_default=None, validate=NOTIFICATION_CURSOR,
+                       description="ID последнего полученного уведомления")
+    limit = fields.Int(load_default=50, validate=validate.Range(min=1, max=200),
+                       description="Сколько уведомлений вернуть (1..200)")
+
+class SessionQuerySchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    messages = fields.Int(load_default=50, validate=validate.Range(min=1, max=200),
+                          description="Сколько последних сообщений комнаты вернуть (1..200)")
+    notifications = fields.Int(load_default=20, validate=validate.Range(min=1, max=200),
+                               description="Сколько уведомлений комнаты вернуть (1..200)")
+    notifications_after = fields.Str(load_default=None, validate=NOTIFICATION_CURSOR,
+                                     description="ID последнего полученного уведомления")
@@ -4,6 +4,7 @@ from flask_jwt_extended import create_access_token, create_refresh_token
 from core.database import db
 from models.user import User
 from controllers.utils import generate_username
+from services.user_search_cache import invalidate_user_search_cache
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +27,7 @@ def register_user(login: str, password: str):
     user.set_password(password)
     db.session.add(user)
     db.session.commit()
+    invalidate_user_search_cache()
     logger.info(f"User registered successfully: {login}")
     return user, None
 
@@ -99,5 +101,6 @@ def change_username(user: User, new_username: str):
 
     user.username = new_username
     db.session.commit()
+    invalidate_user_search_cache()
     logger.info(f"Username changed successfully for user {user.login}")
     return user, None
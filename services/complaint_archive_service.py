@@ -0,0 +1,180 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from core.database import db, read_session, socketio
+from core.storage import get_storage
+from core.storage.locks import hold_lock
+from models.complaint import ArchivedComplaint
+
+logger = logging.getLogger(__name__)
+
+# Политика хранения: решённые жалобы уходят в архив при ближайшем проходе,
+# нерешённые — когда становятся старше COMPLAINT_RETENTION_DAYS.
+# Настройки читаются при вызове: config.yaml загружается уже после импорта модулей.
+_ARCHIVER_LOCK = "complaints-archiver"
+# Лок продлевается после каждой порции, ttl — запас на одну порцию
+_ARCHIVER_LOCK_TTL = 60
+
+def _retention_days() -> float:
+    return float(os.environ.get("COMPLAINT_RETENTION_DAYS", 30))
+
+def _archive_interval() -> int:
+    # сек между проходами, 0 — выключено
+    return int(os.environ.get("COMPLAINT_ARCHIVE_INTERVAL", 600))
+
+def _archive_batch_size() -> int:
+    return int(os.environ.get("COMPLAINT_ARCHIVE_BATCH_SIZE", 500))
+
+def _parse_dt(value: str):
+    return datetime.fromisoformat(value) if value else None
+
+def _to_row(complaint_id: int, data: dict, archived_at: datetime) -> dict:
+    return {
+        "id": complaint_id,
+        "reporter_id": int(data["reporter_id"]),
+        "target_user_id": int(data["target_user_id"]),
+        "message_id": data.get("message_id") or None,
+        "reason": data.get("reason") or None,
+        "status": data.get("status") or "open",
+        "created_at": _parse_dt(data.get("created_at")) or archived_at,
+        "resolved_at": _parse_dt(data.get("resolved_at")),
+        "archived_at": archived_at,
+    }
+
+def _archive_batch(storage, batch, archived_at: datetime) -> int:
+    if not batch:
+        return 0
+    db.session.execute(
+        insert(ArchivedComplaint).prefix_with("OR IGNORE"),
+        [_to_row(cid, data, archived_at) for cid, data in batch]
+    )
+    db.session.commit()
+
+    storage.delete_complaints([
+        (cid, data["reporter_id"], data["target_user_id"]) for cid, data in batch
+    ])
+    return len(batch)
+
+def _still_locked(keep_alive) -> bool:
+    if keep_alive is None or keep_alive():
+        return True
+    logger.warning("Complaint archiver lost its lock, pass stopped")
+    return False
+
+def archive_complaints(batch_size: int = None, retention_days: float = None, keep_alive=None):
+    """
+    Переносит решённые и устаревшие жалобы из хранилища (Redis) в SQLite пачками:
+      1) решённые — по индексу решённых (его пополняет resolve_complaint);
+      2) старше retention_days — с начала by_id до первой жалобы новее порога:
+         id выдаются по возрастанию вместе с created_at, дальше старых нет.
+    Так проход читает только то, что уйдёт в архив, а не всю очередь.
+    Сначала строки коммитятся в SQLite (INSERT OR IGNORE — повтор безопасен),
+    только потом удаляются из хранилища. keep_alive() вызывается между
+    порциями (продление лока, см. hold_lock); False — проход прерывается.
+    Возвращает число перенесённых жалоб. Требует app context.
+    """
+    storage = get_storage()
+    batch_size = batch_size or _archive_batch_size()
+    if retention_days is None:
+        retention_days = _retention_days()
+
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    archived = 0
+    locked = True
+
+    after_id = None
+    while locked:
+        ids = storage.list_resolved_complaint_ids(after_id=after_id, limit=batch_size)
+        if not ids:
+            break
+        after_id = ids[-1]
+        batch = [(cid, data) for cid, data in zip(ids, storage.get_complaints(ids)) if data]
+        archived += _archive_batch(storage, batch, now)
+        locked = _still_locked(keep_alive)
+        if len(ids) < batch_size:
+            break
+
+    after_id = None
+    reached_cutoff = False
+    while locked and not reached_cutoff:
+        ids = storage.list_complaint_ids(after_id=after_id, limit=batch_size)
+        if not ids:
+            break
+        after_id = ids[-1]
+
+        batch = []
+        for cid, data in zip(ids, storage.get_complaints(ids)):
+            created_at = _parse_dt(data.get("created_at")) if data else None
+            if created_at is None:
+                continue
+            if created_at >= cutoff:
+                reached_cutoff = True
+                break
+            batch.append((cid, data))
+        archived += _archive_batch(storage, batch, now)
+        locked = _still_locked(keep_alive)
+        if len(ids) < batch_size:
+            break
+
+    if archived:
+        logger.info(f"Archived {archived} complaints to SQLite")
+    return archived
+
+def list_archived_complaints(after_id: int = None,
+                             limit: int = 50,
+                             target_user_id: int = None,
+                             reporter_id: int = None):
+    """
+    Страница архивных жалоб (keyset по id).
+    Возвращает (list_of_complaints, next_after_id) — как list_complaints.
+    """
+    with read_session() as session:
+        query = session.query(ArchivedComplaint).order_by(ArchivedComplaint.id)
+        if target_user_id is not None:
+            query = query.filter(ArchivedComplaint.target_user_id == target_user_id)
+        if reporter_id is not None:
+            query = query.filter(ArchivedComplaint.reporter_id == reporter_id)
+        if after_id is not None:
+            query = query.filter(ArchivedComplaint.id > after_id)
+        rows = query.limit(limit + 1).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_after_id = rows[-1].id if has_more and rows else None
+        return [c.to_dict() for c in rows], next_after_id
+
+def remove_archived_complaint(complaint_id: int):
+    """
+    Удаляет жалобу из архива. Возвращает (removed_bool, error_string|None).
+    """
+    deleted = ArchivedComplaint.query.filter_by(id=complaint_id).delete()
+    db.session.commit()
+    if not deleted:
+        return False, "Complaint not found"
+    return True, None
+
+def start_complaint_archiver(app):
+    """
+    Запускает фоновый архиватор (раз в COMPLAINT_ARCHIVE_INTERVAL секунд).
+    Между воркерами проход защищён локом в хранилище, так что одновременно работает один.
+    """
+    interval = _archive_interval()
+    if interval <= 0:
+        logger.info("Complaint archiver is disabled")
+        return None
+
+    def run():
+        while True:
+            socketio.sleep(interval)
+            try:
+                with hold_lock(get_storage(), _ARCHIVER_LOCK, _ARCHIVER_LOCK_TTL) as keep_alive:
+                    if keep_alive is None:
+                        continue
+                    with app.app_context():
+                        archive_complaints(keep_alive=keep_alive)
+            except Exception:
+                logger.exception("Complaint archiver pass failed")
+
+    return socketio.start_background_task(run)
@@ -1,80 +1,167 @@
 import logging
+import os
+import time
 from datetime import datetime
-from core.database import get_redis_client
+from core.storage import get_storage
+from admin.services.admin_service import block_user
 
 logger = logging.getLogger(__name__)
+admin_logger = logging.getLogger("admin_actions")
+
+# Рейтинг нарушителей с экспоненциальным затуханием (forward decay, см.
+# DECAY_RESCALE_AT в core.storage.base): вес жалобы уменьшается вдвое каждые
+# COMPLAINT_DECAY_HALF_LIFE_HOURS. Порядок в рейтинге не зависит от момента
+# чтения, и пересчитывать старые score не нужно.
+
+# Цели с весом ниже этого значения выкидываются из рейтинга
+_DECAY_MIN_SCORE = 0.01
+
+# Настройки читаются при вызове: config.yaml загружается уже после импорта модулей
+def _decay_settings() -> dict:
+    """half_life (сек) и эпоха, с которой начинается рейтинг, пока её нет в хранилище."""
+    return {
+        "half_life": float(os.environ.get("COMPLAINT_DECAY_HALF_LIFE_HOURS", 72)) * 3600,
+        "default_epoch": float(os.environ.get("COMPLAINT_DECAY_EPOCH", 1735689600)),  # 2025-01-01 UTC
+    }
+
+def _dedupe_ttl() -> int:
+    return int(os.environ.get("COMPLAINT_DEDUPE_TTL", 7 * 24 * 3600))
+
+def _autoblock_threshold() -> float:
+    # Порог автоблокировки по текущему весу; 0 — выключено
+    return float(os.environ.get("COMPLAINT_AUTOBLOCK_THRESHOLD", 0))
 
 def create_complaint(reporter_id: int, target_user_id: int, message_id: str = None, reason: str = ""):
     """
-    Создаёт новую жалобу в Redis. Возвращает (complaint_id, error).
+    Создаёт новую жалобу в хранилище. Возвращает (complaint_id, error).
     """
-    r = get_redis_client()
-    if r is None:
-        return None, "Cannot connect to Redis"
-
+    storage = get_storage()
     try:
-        # complaint_id auto-increment
-        complaint_id = r.incr("complaint_id_counter")
-        complaint_key = f"complaint:{complaint_id}"
-
         complaint_data = {
             "reporter_id": str(reporter_id),
             "target_user_id": str(target_user_id),
             "message_id": message_id or "",
             "reason": reason or "",
+            "status": "open",
             "created_at": datetime.utcnow().isoformat()
         }
 
-        # Сохраняем в Redis Hash:
-        r.hset(complaint_key, mapping=complaint_data)
-        # Добавим в множество/список всех жалоб:
-        r.sadd("complaints:all", complaint_id)
+        # Одна жалоба на связку репортёр/цель/сообщение за период дедупликации
+        complaint_id, offender_score = storage.create_complaint(
+            complaint_data,
+            dedupe_key=f"{reporter_id}:{target_user_id}:{message_id or '-'}",
+            dedupe_ttl=_dedupe_ttl(),
+            now=time.time(),
+            min_score=_DECAY_MIN_SCORE,
+            **_decay_settings()
+        )
+        if complaint_id is None:
+            return None, "Complaint already submitted"
+
+        threshold = _autoblock_threshold()
+        if threshold and offender_score >= threshold:
+            _auto_block(storage, target_user_id, offender_score, threshold)
 
         return complaint_id, None
+    except RuntimeError:
+        logger.exception("Storage is unavailable while creating complaint")
+        return None, "Cannot connect to Redis"
     except Exception as e:
-        logger.exception("Failed to create complaint in Redis")
+        logger.exception("Failed to create complaint")
         return None, "Internal server error"
 
-def list_complaints():
+def _auto_block(storage, target_user_id: int, score: float, threshold: float):
     """
-    Возвращает список всех жалоб.
+    Блокирует пользователя, набравшего порог жалоб (если он ещё не заблокирован).
     """
-    r = get_redis_client()
-    if r is None:
+    if storage.is_blocked(target_user_id):
+        return
+    if block_user(target_user_id):
+        admin_logger.warning(
+            f"User {target_user_id} auto-blocked: complaint score {score:.2f} "
+            f">= threshold {threshold}"
+        )
+
+def top_offenders(limit: int = 20):
+    """
+    Топ пользователей по текущему (затухающему) весу жалоб.
+    В Redis это один pipeline (эпоха и ZREVRANGE) — O(log n + limit). Возвращает list[dict].
+    """
+    try:
+        rows = get_storage().top_offenders(limit, now=time.time(), stale_ok=True, **_decay_settings())
+    except RuntimeError:
+        logger.exception("Storage is unavailable while reading top offenders")
         return []
 
+    return [
+        {"user_id": int(user_id), "score": round(score, 3)}
+        for user_id, score in rows
+    ]
+
+def list_complaints(after_id: int = None,
+                    limit: int = 50,
+                    target_user_id: int = None,
+                    reporter_id: int = None):
+    """
+    Страница жалоб по возрастанию complaint_id.
+    Возвращает (list_of_complaints, next_after_id); next_after_id = None,
+    если дальше ничего нет. В Redis всегда два обращения:
+    ZRANGEBYSCORE по нужному индексу и pipeline из HGETALL.
+    Если заданы оба фильтра, страница может оказаться короче limit.
+    Читает с реплики, если она не отстаёт (страница может быть старше на
+    REDIS_REPLICA_MAX_LAG сек).
+    """
+    storage = get_storage()
     try:
-        all_ids = r.smembers("complaints:all")
+        ids = storage.list_complaint_ids(after_id, limit + 1, target_user_id, reporter_id, stale_ok=True)
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        if not ids:
+            return [], None
+
         results = []
-        for cid in all_ids:
-            complaint_key = f"complaint:{cid}"
-            data = r.hgetall(complaint_key)
-            if data:
-                data["complaint_id"] = int(cid)
-                results.append(data)
-        # Можно сортировать по complaint_id (для удобства)
-        results.sort(key=lambda c: c["complaint_id"])
-        return results
+        for cid, data in zip(ids, storage.get_complaints(ids, stale_ok=True)):
+            if not data:
+                continue
+            if reporter_id is not None and data.get("reporter_id") != str(reporter_id):
+                continue
+            data["complaint_id"] = int(cid)
+            results.append(data)
+
+        next_after_id = int(ids[-1]) if has_more else None
+        return results, next_after_id
     except Exception as e:
         logger.exception("Failed to list complaints")
-        return []
+        return [], None
 
 def remove_complaint(complaint_id: int):
     """
-    Удаляет жалобу из Redis. Возвращает (removed_bool, error_string|None).
+    Удаляет жалобу из хранилища. Возвращает (removed_bool, error_string|None).
     """
-    r = get_redis_client()
-    if r is None:
+    storage = get_storage()
+    try:
+        data = storage.get_complaints([complaint_id])[0]
+    except RuntimeError:
         return False, "Cannot connect to Redis"
-
-    complaint_key = f"complaint:{complaint_id}"
-    if not r.exists(complaint_key):
+    if not data:
         return False, "Complaint not found"
 
     try:
-        r.delete(complaint_key)
-        r.srem("complaints:all", complaint_id)
+        storage.delete_complaints([(complaint_id, data["reporter_id"], data["target_user_id"])])
         return True, None
     except Exception as e:
         logger.exception("Failed to remove complaint")
         return False, "Internal server error"
+
+def resolve_complaint(complaint_id: int):
+    """
+    Помечает жалобу решённой; архиватор перенесёт её в SQLite.
+    Возвращает (resolved_bool, error_string|None).
+    """
+    try:
+        updated = get_storage().resolve_complaint(complaint_id, datetime.utcnow().isoformat())
+    except RuntimeError:
+        return False, "Cannot connect to Redis"
+    if not updated:
+        return False, "Complaint not found"
+    return True, None
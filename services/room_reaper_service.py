@@ -0,0 +1,161 @@
+import logging
+import os
+import time
+from core.database import socketio
+from core.metrics import ROOM_REAPER_RECLAIMED
+from core.storage import get_storage
+from core.storage.locks import hold_lock
+from models.user import User
+from services.room_service import leave_rooms_bulk
+
+logger = logging.getLogger(__name__)
+
+# Живость участника — seen_at в его записи о членстве: ставится при входе
+# и обновляется активностью сокета (connect, send_message, heartbeat).
+# Сборщик обходит хранилище порциями (в Redis — SCAN/SSCAN, без KEYS и
+# SMEMBERS по всему индексу) и между порциями отдаёт управление другим greenlet'ам.
+_REAPER_LOCK = "room-reaper"
+# Лок продлевается после каждой порции, ttl — запас на одну порцию
+_REAPER_LOCK_TTL = 60
+
+def _membership_ttl() -> int:
+    # сек без активности, после которых участник считается ушедшим;
+    # 0 — не выводить по неактивности, только чинить мусор. По умолчанию 0:
+    # клиенты без heartbeat'ов и пользователи только REST активность не
+    # обновляют, и ненулевой ttl выводил бы их из комнат
+    return int(os.environ.get("MEMBERSHIP_TTL", 0))
+
+def _reaper_interval() -> int:
+    # сек между проходами, 0 — выключено
+    return int(os.environ.get("ROOM_REAPER_INTERVAL", 60))
+
+def _reaper_batch_size() -> int:
+    return int(os.environ.get("ROOM_REAPER_BATCH_SIZE", 200))
+
+def _leave_stale(user_ids):
+    """
+    Выход через обычный путь (уведомления оставшимся, удаление пустых комнат).
+    Пользователей, которых уже нет в БД, выводим напрямую через хранилище.
+    Возвращает множество удалённых комнат.
+    """
+    users = User.query.filter(User.id.in_(user_ids)).all()
+    empty_rooms = leave_rooms_bulk(users)
+    missing = set(user_ids) - {user.id for user in users}
+    if missing:
+        _, deleted = get_storage().leave_rooms(list(missing))
+        empty_rooms |= deleted
+    return empty_rooms
+
+def _still_locked(keep_alive) -> bool:
+    if keep_alive is None or keep_alive():
+        return True
+    logger.warning("Room reaper lost its lock, pass stopped")
+    return False
+
+def reap_rooms(batch_size: int = None, membership_ttl: int = None, keep_alive=None):
+    """
+    Один проход сборщика. Требует app context.
+      1) участники: без активности дольше membership_ttl — выход из комнаты;
+         членство в несуществующей комнате — стирается; записи без seen_at
+         (созданные до heartbeat'ов) получают отсрочку на один ttl;
+      2) комнаты: призрачные участники, дрейф current_users, пустые комнаты
+         и «висящие» ID в индексе по размеру.
+    keep_alive() вызывается между порциями (продление лока, см. hold_lock);
+    False — проход прерывается. Возвращает отчёт о том, что собрано.
+    """
+    storage = get_storage()
+    batch_size = batch_size or _reaper_batch_size()
+    if membership_ttl is None:
+        membership_ttl = _membership_ttl()
+
+    started = time.time()
+    cutoff = started - membership_ttl
+    report = {
+        "memberships_scanned": 0,
+        "stale_memberships": 0,
+        "orphaned_memberships": 0,
+        "rooms_scanned": 0,
+        "ghost_members": 0,
+        "drift_fixed": 0,
+        "rooms_deleted": 0,
+        "conflicts": 0,
+    }
+
+    locked = True
+    cursor = 0
+    while locked:
+        cursor, entries = storage.scan_memberships(cursor, batch_size)
+        report["memberships_scanned"] += len(entries)
+
+        orphaned = [(e["user_id"], e["room"]) for e in entries if not e["room"] or not e["room_exists"]]
+        live = [e for e in entries if e["room"] and e["room_exists"]]
+        stale = []
+        if membership_ttl > 0:
+            stale = [e["user_id"] for e in live if e["seen_at"] is not None and e["seen_at"] < cutoff]
+            for entry in live:
+                if entry["seen_at"] is None:
+                    storage.touch_membership(entry["user_id"], started)
+
+        if orphaned:
+            report["orphaned_memberships"] += storage.clear_memberships(orphaned)
+        if stale:
+            report["stale_memberships"] += len(stale)
+            report["rooms_deleted"] += len(_leave_stale(stale))
+
+        socketio.sleep(0)
+        locked = _still_locked(keep_alive)
+        if cursor == 0:
+            break
+
+    cursor = 0
+    while locked:
+        cursor, room_ids = storage.scan_rooms(cursor, batch_size)
+        report["rooms_scanned"] += len(room_ids)
+        if room_ids:
+            repaired = storage.repair_rooms(room_ids)
+            report["ghost_members"] += repaired["ghost_members"]
+            report["drift_fixed"] += repaired["drift_fixed"]
+            report["rooms_deleted"] += len(repaired["rooms_deleted"])
+            report["conflicts"] += repaired["conflicts"]
+
+        socketio.sleep(0)
+        locked = _still_locked(keep_alive)
+        if cursor == 0:
+            break
+
+    for kind in ("stale_memberships", "orphaned_memberships", "ghost_members", "drift_fixed", "rooms_deleted"):
+        if report[kind]:
+            ROOM_REAPER_RECLAIMED.inc((kind,), report[kind])
+
+    report["duration_s"] = round(time.time() - started, 3)
+    reclaimed = {k: v for k, v in report.items() if v and k not in ("memberships_scanned", "rooms_scanned", "duration_s")}
+    if reclaimed:
+        logger.info("Room reaper reclaimed %s in %ss", reclaimed, report["duration_s"])
+    else:
+        logger.debug("Room reaper: nothing to reclaim (%d memberships, %d rooms scanned)",
+                     report["memberships_scanned"], report["rooms_scanned"])
+    return report
+
+def start_room_reaper(app):
+    """
+    Запускает фоновый сборщик (раз в ROOM_REAPER_INTERVAL секунд).
+    Между воркерами проход защищён локом в хранилище, так что одновременно работает один.
+    """
+    interval = _reaper_interval()
+    if interval <= 0:
+        logger.info("Room reaper is disabled")
+        return None
+
+    def run():
+        while True:
+            socketio.sleep(interval)
+            try:
+                with hold_lock(get_storage(), _REAPER_LOCK, _REAPER_LOCK_TTL) as keep_alive:
+                    if keep_alive is None:
+                        continue
+                    with app.app_context():
+                        reap_rooms(keep_alive=keep_alive)
+            except Exception:
+                logger.exception("Room reaper pass failed")
+
+    return socketio.start_background_task(run)
@@ -1,23 +1,46 @@
 import logging
-import random
-from datetime import datetime
-from core.database import get_redis_client, socketio
+import os
+from datetime import datetime, timezone
+from core.database import socketio
+from core.room_events import publish as publish_room_event
+from core.storage import get_storage
 from models.user import User
 
 logger = logging.getLogger(__name__)
 
 def notify_room_users(room_id: str, message: str):
     """
-    Записывает уведомление всем пользователям комнаты (в список notifications в Redis).
+    Записывает уведомление всем пользователям комнаты (в кольцевую ленту
+    хранилища, NOTIFICATIONS_MAX_LEN последних) и рассылает его по сокетам.
     """
     try:
-        r = get_redis_client()
-        if r is None:
-            raise RuntimeError("Cannot connect to Redis")
-        r.rpush(f"{room_id}:notifications", message)
-        socketio.emit("notification", {"message": message}, room=room_id)
+        created_at = datetime.now(timezone.utc).isoformat()
+        notification_id = get_storage().push_notification(
+            room_id, message, created_at,
+            int(os.environ.get("NOTIFICATIONS_MAX_LEN", 100)),
+            int(os.environ.get("NOTIFICATIONS_TTL", 86400)),
+        )
+        payload = {"id": notification_id, "message": message, "created_at": created_at}
+        socketio.emit("notification", payload, room=room_id)
+        publish_room_event(room_id, "notification", payload)
     except Exception as e:
-        logger.exception(f"Failed to notify users in room {room_id}: {e}")
+        logger.exception("Failed to notify users in room %s: %s", room_id, e)
+
+def get_notifications_service(user: User, after_id: str = None, limit: int = 50):
+    """
+    Уведомления комнаты пользователя после курсора after_id (ID последнего
+    полученного уведомления); без курсора — последние limit.
+    Возвращает ({"room_id", "notifications", "cursor"}, error, status_code).
+    """
+    storage = get_storage()
+    room_id = storage.get_user_room(user.id)
+    if not room_id:
+        logger.debug("User %s is not in any room", user.login)
+        return None, "You are not in a room", 400
+
+    notifications = storage.get_notifications(room_id, after_id, limit)
+    cursor = notifications[-1]["id"] if notifications else after_id
+    return {"room_id": room_id, "notifications": notifications, "cursor": cursor}, None, 200
 
 def join_room_service(user: User, room_size: int):
     """
@@ -28,70 +51,27 @@ def join_room_service(user: User, room_size: int):
       - status_code: int (200, 201, 400, 500 и т.д.)
     """
 
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
+    storage = get_storage()
 
     # Проверим, не в комнате ли уже пользователь
-    user_room = r.hget(f"user:{user.id}", "room")
-    if user_room:
-        logger.debug(f"User {user.login} is already in a room")
+    if storage.get_user_room(user.id):
+        logger.debug("User %s is already in a room", user.login)
         return None, "You are already in a room", 400
 
-    room_set_key = f"rooms:{room_size}"
     try:
-        available_rooms = r.smembers(room_set_key)
+        room_id, created = storage.join_room(user.id, room_size, datetime.now().isoformat())
     except Exception as e:
-        logger.exception(f"Failed to get available_rooms: {e}")
+        logger.exception("Failed to join room of size %s: %s", room_size, e)
         return None, "Internal server error", 500
 
-    chosen_room = None
-    for r_id in available_rooms:
-        try:
-            curr_str = r.hget(r_id, "current_users")
-            max_str = r.hget(r_id, "max_users")
-            if not curr_str or not max_str:
-                continue
-            current_users = int(curr_str)
-            max_users = int(max_str)
-            if current_users < max_users:
-                chosen_room = r_id
-                break
-        except Exception as e:
-            logger.exception(f"Failed to parse room info for {r_id}: {e}")
-            continue
-
-    if chosen_room:
-        # Присоединяемся к существующей комнате
-        try:
-            r.hincrby(chosen_room, "current_users", 1)
-            r.hset(f"user:{user.id}", "room", chosen_room)
-            r.sadd(f"{chosen_room}:users", user.id)
-            r.hset(f"user:{user.id}", "joined_at", datetime.now().isoformat())
-
-            notify_room_users(chosen_room, f"User {user.username} has joined the room.")
-            logger.info(f"User {user.login} joined room {chosen_room}")
-            return chosen_room, None, 200
-        except Exception as e:
-            logger.exception(f"Failed to join existing room {chosen_room}: {e}")
-            return None, "Internal server error", 500
-    else:
-        # Создаём новую комнату
-        try:
-            room_id = f"room:{room_size}:{random.randint(100000,999999)}"
-            r.hset(room_id, "max_users", room_size)
-            r.hset(room_id, "current_users", 1)
-            r.hset(f"user:{user.id}", "room", room_id)
-            r.sadd(f"{room_id}:users", user.id)
-            r.hset(f"user:{user.id}", "joined_at", datetime.now().isoformat())
-
-            r.sadd(room_set_key, room_id)
-            notify_room_users(room_id, f"User {user.username} created and joined the room.")
-            logger.info(f"User {user.login} created & joined room {room_id}")
-            return room_id, None, 201
-        except Exception as e:
-            logger.exception(f"Failed to create and join new room: {e}")
-            return None, "Internal server error", 500
+    if created:
+        notify_room_users(room_id, f"User {user.username} created and joined the room.")
+        logger.info("User %s created & joined room %s", user.login, room_id)
+        return room_id, None, 201
+
+    notify_room_users(room_id, f"User {user.username} has joined the room.")
+    logger.info("User %s joined room %s", user.login, room_id)
+    return room_id, None, 200
 
 def leave_room_service(user: User):
     """
@@ -99,88 +79,102 @@ def leave_room_service(user: User):
     Возвращает (room_id, error, status_code).
     """
 
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
-    
-    room_id = r.hget(f"user:{user.id}", "room")
-    if not room_id:
-        logger.debug(f"User {user.login} is not in any room")
+    storage = get_storage()
+    if not storage.get_user_room(user.id):
+        logger.debug("User %s is not in any room", user.login)
         return None, "You are not in a room", 400
 
     try:
-        r.hincrby(room_id, "current_users", -1)
-        r.srem(f"{room_id}:users", user.id)
-        r.hdel(f"user:{user.id}", "room")
-        r.hdel(f"user:{user.id}", "joined_at")
-
-        notify_room_users(room_id, f"User {user.username} has left the room.")
-        logger.info(f"User {user.login} left room {room_id}")
-
-        # Если в комнате никого не осталось — удалить
-        if int(r.hget(room_id, "current_users")) == 0:
-            _, size_str, _ = room_id.split(":")
-            r.delete(room_id)
-            r.delete(f"{room_id}:users")
-            r.delete(f"{room_id}:messages")
-            r.srem(f"rooms:{size_str}", room_id)
-            logger.info(f"Room {room_id} deleted because it became empty")
+        room_id, room_deleted = storage.leave_room(user.id)
+        if room_id is None:
+            # Успел выйти параллельным запросом
+            return None, "You are not in a room", 400
+
+        logger.info("User %s left room %s", user.login, room_id)
+        if room_deleted:
+            logger.info("Room %s deleted because it became empty", room_id)
+        else:
+            notify_room_users(room_id, f"User {user.username} has left the room.")
 
         return room_id, None, 200
     except Exception as e:
-        logger.exception(f"Failed to leave room {room_id}: {e}")
+        logger.exception("Failed to leave room for user %s: %s", user.login, e)
         return None, "Internal server error", 500
 
+def leave_rooms_bulk(users):
+    """
+    Принудительный выход сразу нескольких пользователей из комнат
+    (хранилище делает это пачкой). Возвращает множество удалённых комнат.
+    """
+    users_by_id = {user.id: user for user in users}
+    if not users_by_id:
+        return set()
+
+    memberships, empty_rooms = get_storage().leave_rooms(list(users_by_id))
+    for user_id, room_id in memberships.items():
+        if room_id not in empty_rooms:
+            notify_room_users(room_id, f"User {users_by_id[user_id].username} has left the room.")
+
+    logger.info("Bulk leave: %d users left rooms, %d rooms deleted", len(memberships), len(empty_rooms))
+    return empty_rooms
+
 def my_room_service(user: User):
     """
     Возвращает ID комнаты, в которой находится пользователь, или None.
     """
 
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
-    
-    return r.hget(f"user:{user.id}", "room")
+    return get_storage().get_user_room(user.id)
+
+def format_messages(messages, joined_at: str):
+    """
+    Разбирает записи "username:message:timestamp" в словари для клиента.
+    Берутся только сообщения, написанные не раньше joined_at.
+    """
+    # joined_at пишется в локальном времени без зоны, сообщения — в UTC:
+    # вторая форма времени входа считается один раз и только при необходимости
+    joined_time = datetime.fromisoformat(joined_at)
+    joined_by_aware = {joined_time.tzinfo is not None: joined_time}
+    formatted_messages = []
+    for msg in messages:
+        parts = msg.split(":")
+        if len(parts) >= 3:
+            sender_username, content, ts = parts[0], parts[1], ":".join(parts[2:])
+            try:
+                msg_time = datetime.fromisoformat(ts)
+            except ValueError:
+                logger.debug("Invalid timestamp format in message: %s", msg)
+                continue
+            # Берём только те, что после времени входа
+            aware = msg_time.tzinfo is not None
+            if aware not in joined_by_aware:
+                local = joined_time.astimezone()
+                joined_by_aware[aware] = local if aware else local.replace(tzinfo=None)
+            if msg_time >= joined_by_aware[aware]:
+                formatted_messages.append({
+                    "user_id": sender_username,
+                    "content": content,
+                    "timestamp": ts
+                })
+    return formatted_messages
 
 def get_room_messages_service(user: User, room_id: str):
     """
     Возвращает (list_of_messages, error, status_code).
     Только сообщения, написанные после того, как пользователь вошёл.
+    Членство читается с мастера (вход мог быть только что), история —
+    с реплики, если она не отстаёт: новые сообщения всё равно приходят по сокету.
     """
 
-    r = get_redis_client()
-    if r is None:
-        raise RuntimeError("Cannot connect to Redis")
-    
-    joined_at = r.hget(f"user:{user.id}", "joined_at")
-    if not joined_at:
-        logger.debug(f"User {user.login} has not joined room {room_id}")
+    storage = get_storage()
+    membership = storage.get_membership(user.id)
+    if not membership or not membership.get("joined_at"):
+        logger.debug("User %s has not joined room %s", user.login, room_id)
         return None, "You have not joined this room", 400
 
     try:
-        joined_time = datetime.fromisoformat(joined_at)
-        messages = r.lrange(f"{room_id}:messages", 0, -1)
-        formatted_messages = []
-
-        for msg in messages:
-            parts = msg.split(":")
-            if len(parts) >= 3:
-                sender_username, content, ts = parts[0], parts[1], ":".join(parts[2:])
-                try:
-                    msg_time = datetime.fromisoformat(ts)
-                    # Берём только те, что после времени входа
-                    if msg_time >= joined_time:
-                        formatted_messages.append({
-                            "user_id": sender_username,
-                            "content": content,
-                            "timestamp": ts
-                        })
-                except ValueError:
-                    logger.debug(f"Invalid timestamp format in message: {msg}")
-                    continue
-
-        logger.info(f"Retrieved {len(formatted_messages)} messages in room {room_id} for user {user.login}")
+        formatted_messages = format_messages(storage.get_messages(room_id, stale_ok=True), membership["joined_at"])
+        logger.info("Retrieved %d messages in room %s for user %s", len(formatted_messages), room_id, user.login)
         return formatted_messages, None, 200
     except Exception as e:
-        logger.exception(f"Failed to get room messages for {room_id}: {e}")
+        logger.exception("Failed to get room messages for %s: %s", room_id, e)
         return None, "Internal server error", 500
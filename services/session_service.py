@@ -0,0 +1,46 @@
+import logging
+from core.storage import get_storage
+from models.user import User
+from services.room_service import format_messages
+
+logger = logging.getLogger(__name__)
+
+def bootstrap_session(user_id, message_limit: int, notification_limit: int,
+                      notifications_after: str = None):
+    """
+    Состояние клиента при старте одним запросом вместо /my_room,
+    /room_messages и отдельной проверки блокировки.
+    Возвращает (payload, error, status_code).
+
+    Одно чтение пользователя из БД; из хранилища — membership, флаг
+    блокировки, заполненность комнаты, хвост истории и уведомлений
+    (в Redis — двумя pipeline'ами, второй только если пользователь в комнате).
+    """
+    user = User.query.get(user_id)
+    if not user:
+        return None, "User not found", 404
+
+    state = get_storage().get_session_state(user.id, message_limit, notification_limit, notifications_after)
+    if state["blocked"]:
+        return None, "User is blocked", 403
+
+    payload = {
+        "user": {
+            "id": user.id,
+            "login": user.login,
+            "username": user.username,
+            "role": user.role,
+            "telegram_id": user.telegram_id,
+        },
+        "room_id": state["room"],
+        "room": state["room_info"],
+        "messages": [],
+        "notifications": state["notifications"],
+        "notification_cursor": state["notifications"][-1]["id"] if state["notifications"] else notifications_after,
+    }
+    if state["room"] and state["joined_at"]:
+        payload["messages"] = format_messages(state["messages"], state["joined_at"])
+
+    logger.debug("Session bootstrap for %s: room %s, %d messages",
+                 user.login, state["room"], len(payload["messages"]))
+    return payload, None, 200
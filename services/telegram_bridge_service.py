@@ -0,0 +1,339 @@
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+import requests
+from eventlet.patcher import is_monkey_patched
+from requests.adapters import HTTPAdapter
+from core import room_events
+from core.database import read_session, socketio
+from core.metrics import TELEGRAM_BRIDGE_MESSAGES
+from core.storage import get_storage
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Мост комнат в Telegram: сообщения и уведомления комнаты (core.room_events)
+# пересылаются её участникам с привязанным telegram_id (кроме автора).
+# Обработчик события только кладёт его в очередь; раз в
+# TELEGRAM_FLUSH_INTERVAL события раскладываются по чатам, и всё, что
+# накопилось для чата, уходит одним sendMessage (до 4096 символов).
+# Отправку ограничивают token bucket'ы: общий (TELEGRAM_GLOBAL_RATE) и на
+# каждый чат (TELEGRAM_CHAT_RATE, для групп — TELEGRAM_GROUP_RATE); ответ
+# 429 ставит чат на паузу retry_after. Лимиты — на процесс: при нескольких
+# воркерах общий лимит делится между ними.
+MAX_MESSAGE_LENGTH = 4096
+EVENT_QUEUE_LIMIT = 10000   # событий между сборами; сверх — самые старые отбрасываются
+ERROR_BACKOFF = 5.0         # сек паузы чата после сетевой ошибки или 5xx
+BUSY_TICK = 0.02            # сек между тактами, пока есть отправки в полёте
+
+def _bot_token() -> str:
+    return os.environ.get("TELEGRAM_BOT_TOKEN", "")
+
+def _bridge_settings() -> dict:
+    return {
+        "global_rate": float(os.environ.get("TELEGRAM_GLOBAL_RATE", 25)),
+        "chat_rate": float(os.environ.get("TELEGRAM_CHAT_RATE", 1)),
+        "group_rate": float(os.environ.get("TELEGRAM_GROUP_RATE", 20 / 60)),
+        "flush_interval": float(os.environ.get("TELEGRAM_FLUSH_INTERVAL", 1.0)),
+        "max_pending": int(os.environ.get("TELEGRAM_MAX_PENDING", 200)),
+        "concurrency": int(os.environ.get("TELEGRAM_CONCURRENCY", 8)),
+    }
+
+class TokenBucket:
+    """
+    rate токенов в секунду, не больше capacity. wait() — через сколько секунд
+    появится токен (0 — уже есть), take() — забрать его, pause() — не выдавать
+    токены seconds секунд (ответ 429).
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def _refill(self) -> float:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def wait(self) -> float:
+        now = self._refill()
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        now = self._refill()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+
+    def idle(self) -> bool:
+        """Полон и не на паузе — неотличим от нового, его можно забыть."""
+        return self.wait() == 0 and self.tokens >= self.capacity
+
+class TelegramClient:
+    """
+    sendMessage Bot API через один requests.Session: соединения с api_url
+    переиспользуются (keep-alive), в пуле до pool_size штук. Запрос
+    блокирующий: в воркере он не останавливает остальные greenlet'ы только
+    при eventlet.monkey_patch() (python app.py, gunicorn -k eventlet).
+    """
+
+    def __init__(self, token: str, api_url: str = "https://api.telegram.org",
+                 pool_size: int = 8, timeout: float = 10):
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send_message(self, chat_id, text: str):
+        """
+        Возвращает (результат, retry_after): "sent"; "rate_limited" и сек до
+        повтора; "error" — сеть или 5xx, можно повторить; "failed" — чат
+        недоступен (бот заблокирован, чата нет), повторять бессмысленно.
+        """
+        try:
+            resp = self.session.post(self.url, timeout=self.timeout, json={
+                "chat_id": chat_id, "text": text, "disable_web_page_preview": True,
+            })
+        except requests.RequestException as e:
+            # В тексте исключения есть URL с токеном бота — в лог только тип
+            logger.warning(f"Telegram sendMessage to {chat_id} failed: {type(e).__name__}")
+            return "error", None
+        if resp.status_code == 200:
+            return "sent", None
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        if resp.status_code == 429:
+            return "rate_limited", float((body.get("parameters") or {}).get("retry_after", 1))
+        if resp.status_code >= 500:
+            return "error", None
+        logger.warning(f"Telegram rejected message to {chat_id}: {resp.status_code} {body.get('description')}")
+        return "failed", None
+
+    def close(self):
+        self.session.close()
+
+def format_event(event: str, data: dict):
+    """Строка для Telegram или None, если событие не пересылается."""
+    if event == "new_message":
+        return f"{data['user_id']}: {data['message']}"
+    if event == "notification":
+        return f"* {data['message']}"
+    return None
+
+class TelegramBridge:
+    """
+    Планировщик доставки. Все поля меняет только pump() (и on_room_event,
+    который лишь дописывает в очередь событий); отправки идут в фоновых
+    задачах spawn и возвращают итог через очередь results.
+    resolve_chats(room_ids) → {room_id: {user_id: chat_id}}.
+    """
+
+    def __init__(self, client, resolve_chats, global_rate: float = 25, chat_rate: float = 1,
+                 group_rate: float = 20 / 60, flush_interval: float = 1.0, max_pending: int = 200,
+                 concurrency: int = 8, spawn=None, clock=time.monotonic):
+        self.client = client
+        self.resolve_chats = resolve_chats
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self.spawn = spawn or socketio.start_background_task
+        self.clock = clock
+
+        self.events = deque()          # (room_id, event, data, sender_id) от обработчиков
+        self.outbox = OrderedDict()    # chat_id -> deque строк; порядок — очередь обхода чатов
+        self.buckets = {}              # chat_id -> TokenBucket
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate), clock)
+        self.sending = set()           # чаты с запросом в полёте (по одному на чат)
+        self.results = deque()         # итоги отправок из фоновых задач
+        self.next_flush = 0.0
+
+    def on_room_event(self, room_id: str, event: str, data: dict, sender_id: int = None):
+        if len(self.events) >= EVENT_QUEUE_LIMIT:
+            self.events.popleft()
+            TELEGRAM_BRIDGE_MESSAGES.inc(("dropped",))
+        self.events.append((room_id, event, data, sender_id))
+
+    def pump(self) -> float:
+        """
+        Один такт: итоги отправок, раз в flush_interval — раскладка событий
+        по чатам, затем новые отправки в пределах лимитов. Возвращает, через
+        сколько секунд нужен следующий такт.
+        """
+        self._collect_results()
+        now = self.clock()
+        if now >= self.next_flush:
+            self.flush()
+            self.next_flush = now + self.flush_interval
+        delay = self._dispatch()
+        if self.sending:
+            delay = min(delay, BUSY_TICK)
+        return min(delay, max(0.0, self.next_flush - self.clock()))
+
+    def flush(self):
+        """События → строки в очередях чатов получателей."""
+        by_room = {}
+        while self.events:
+            room_id, event, data, sender_id = self.events.popleft()
+            line = format_event(event, data)
+            if line:
+                by_room.setdefault(room_id, []).append((line, sender_id))
+        if by_room:
+            chats = self.resolve_chats(list(by_room))
+            for room_id, lines in by_room.items():
+                recipients = chats.get(room_id) or {}
+                for line, sender_id in lines:
+                    for user_id, chat_id in recipients.items():
+                        if user_id != sender_id:
+                            self._enqueue(chat_id, line)
+
+        # Полные bucket'ы чатов без очереди ничего не ограничивают
+        for chat_id in [chat_id for chat_id, bucket in self.buckets.items()
+                        if chat_id not in self.outbox and chat_id not in self.sending and bucket.idle()]:
+            del self.buckets[chat_id]
+
+    def _enqueue(self, chat_id, line: str):
+        pending = self.outbox.get(chat_id)
+        if pending is None:
+            pending = self.outbox[chat_id] = deque()
+        if len(pending) >= self.max_pending:
+            pending.popleft()
+            TELEGRAM_BRIDGE_MESSAGES.inc(("dropped",))
+        pending.append(line[:MAX_MESSAGE_LENGTH])
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательный chat_id — группа или канал, у них лимит строже
+            rate = self.group_rate if str(chat_id).startswith("-") else self.chat_rate
+            bucket = self.buckets[chat_id] = TokenBucket(rate, 1, self.clock)
+        return bucket
+
+    @staticmethod
+    def _take_text(pending) -> str:
+        """Склеивает строки из начала очереди в одно сообщение не длиннее MAX_MESSAGE_LENGTH."""
+        lines = [pending.popleft()]
+        size = len(lines[0])
+        while pending and size + 1 + len(pending[0]) <= MAX_MESSAGE_LENGTH:
+            size += 1 + len(pending[0])
+            lines.append(pending.popleft())
+        return "\n".join(lines)
+
+    def _dispatch(self) -> float:
+        delay = self.flush_interval
+        for chat_id in list(self.outbox):
+            if len(self.sending) >= self.concurrency:
+                break
+            pending = self.outbox[chat_id]
+            if not pending:
+                del self.outbox[chat_id]
+                continue
+            if chat_id in self.sending:
+                continue
+            wait = self._bucket(chat_id).wait()
+            if wait:
+                delay = min(delay, wait)
+                continue
+            wait = self.global_bucket.wait()
+            if wait:
+                delay = min(delay, wait)
+                break
+            self._bucket(chat_id).take()
+            self.global_bucket.take()
+            text = self._take_text(pending)
+            self.outbox.move_to_end(chat_id)  # следующим тактом — сначала другие чаты
+            self.sending.add(chat_id)
+            self.spawn(self._deliver, chat_id, text)
+        return delay
+
+    def _deliver(self, chat_id, text: str):
+        try:
+            result, retry_after = self.client.send_message(chat_id, text)
+        except Exception as e:
+            logger.exception(f"Telegram delivery to {chat_id} crashed: {e}")
+            result, retry_after = "error", None
+        self.results.append((chat_id, text, result, retry_after))
+
+    def _collect_results(self):
+        while self.results:
+            chat_id, text, result, retry_after = self.results.popleft()
+            self.sending.discard(chat_id)
+            TELEGRAM_BRIDGE_MESSAGES.inc((result,))
+            if result in ("rate_limited", "error"):
+                self._bucket(chat_id).pause(retry_after if result == "rate_limited" else ERROR_BACKOFF)
+                pending = self.outbox.setdefault(chat_id, deque())
+                pending.appendleft(text)
+                self.outbox.move_to_end(chat_id, last=False)
+            elif result == "failed":
+                dropped = self.outbox.pop(chat_id, ())
+                if dropped:
+                    TELEGRAM_BRIDGE_MESSAGES.inc(("dropped",), len(dropped))
+
+def resolve_room_chats(room_ids):
+    """
+    {room_id: {user_id: telegram_id}} для участников комнат с привязанным
+    Telegram. Требует app context.
+    """
+    storage = get_storage()
+    members = {room_id: storage.get_room_members(room_id, stale_ok=True) for room_id in room_ids}
+    user_ids = {user_id for ids in members.values() for user_id in ids}
+    if not user_ids:
+        return {}
+    with read_session() as session:
+        rows = (session.query(User.id, User.telegram_id)
+                .filter(User.id.in_(user_ids), User.telegram_id.isnot(None))
+                .all())
+    chats = {row.id: row.telegram_id for row in rows}
+    return {room_id: {user_id: chats[user_id] for user_id in ids if user_id in chats}
+            for room_id, ids in members.items()}
+
+def start_telegram_bridge(app):
+    """
+    Запускает мост в текущем воркере, если задан TELEGRAM_BOT_TOKEN.
+    Возвращает TelegramBridge или None.
+    """
+    token = _bot_token()
+    if not token:
+        logger.info("Telegram bridge is disabled")
+        return None
+
+    if not is_monkey_patched("socket"):
+        logger.warning("Telegram bridge runs without eventlet.monkey_patch(): "
+                       "each sendMessage blocks the worker until Bot API answers")
+
+    settings = _bridge_settings()
+    client = TelegramClient(token, os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org"),
+                            pool_size=settings["concurrency"],
+                            timeout=float(os.environ.get("TELEGRAM_TIMEOUT", 10)))
+    bridge = TelegramBridge(client, resolve_room_chats, **settings)
+    room_events.subscribe(bridge.on_room_event)
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    delay = bridge.pump()
+            except Exception as e:
+                logger.exception(f"Telegram bridge step failed: {e}")
+                delay = bridge.flush_interval
+            socketio.sleep(delay)
+
+    socketio.start_background_task(run)
+    logger.info(f"Telegram bridge started: {settings}")
+    return bridge
@@ -0,0 +1,87 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+import redis
+from core.redis_client import RedisUnavailableError
+from core.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Кэш поиска пользователей живёт в каждом воркере, а сбрасывать его нужно во
+# всех: запись (регистрация, смена username или роли) увеличивает общий
+# счётчик поколения в хранилище, а чтение сверяет с ним своё поколение и при
+# расхождении очищает локальный кэш. Если хранилище недоступно, кэш не
+# используется вовсе — лучше лишний запрос в SQLite, чем устаревший ответ.
+_SEARCH_GENERATION = "user-search"
+
+class _TTLCache:
+    """
+    Маленький LRU-кэш с TTL для горячих запросов поиска (в пределах воркера).
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = None
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+_cache = None
+
+def _get_cache() -> _TTLCache:
+    # Создаём при первом обращении: config.yaml загружается уже после импорта модулей
+    global _cache
+    if _cache is None:
+        _cache = _TTLCache(
+            maxsize=int(os.environ.get("USER_SEARCH_CACHE_SIZE", 256)),
+            ttl=float(os.environ.get("USER_SEARCH_CACHE_TTL", 30))
+        )
+    return _cache
+
+def get_search_cache():
+    """
+    Кэш поиска, сверенный с общим поколением, или None, если поколение
+    прочитать не удалось (тогда поиск идёт мимо кэша).
+    """
+    try:
+        generation = get_storage().get_generation(_SEARCH_GENERATION)
+    except (redis.ConnectionError, redis.TimeoutError, RedisUnavailableError) as e:
+        logger.debug(f"User search cache bypassed: {e}")
+        return None
+
+    cache = _get_cache()
+    if cache.generation != generation:
+        cache.clear()
+        cache.generation = generation
+    return cache
+
+def invalidate_user_search_cache():
+    """
+    Сбрасывает кэш поиска во всех воркерах (после регистрации, смены username или роли).
+    """
+    if _cache is not None:
+        _cache.clear()
+    try:
+        get_storage().bump_generation(_SEARCH_GENERATION)
+    except (redis.ConnectionError, redis.TimeoutError, RedisUnavailableError) as e:
+        # Другие воркеры, не видя хранилища, кэш и так не используют
+        logger.warning(f"Cannot publish user search cache invalidation: {e}")